@@ -1,4 +1,5 @@
 import streamlit as st
+from core import delete_agent
 
 st.set_page_config(page_title="Agents", layout="wide")
 st.title("Agents")
@@ -44,6 +45,7 @@ for i, agent in enumerate(st.session_state.agents):
             st.switch_page("pages/page3.py")
 
         if st.button("❌ Remove", key=f"remove_{i}"):
+            delete_agent(agent["name"])
             st.session_state.agents.pop(i)
             st.rerun()
 
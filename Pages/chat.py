@@ -1,4 +1,6 @@
+import uuid
 import streamlit as st
+from core import process_user_question, list_agents
 
 # Page setup
 st.set_page_config(
@@ -6,13 +8,30 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
-# Agents list
-agents = ["Agent 1", "Agent 2"]
+# Agents with indexed content
+agents = list_agents()
+if not agents:
+    st.info("No agent has content yet. Add content to an agent first.")
+    st.stop()
+
+if "chat_session_id" not in st.session_state:
+    st.session_state.chat_session_id = str(uuid.uuid4())
 
 # Store chat messages
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
+def agent_conversation(agent):
+    """Earlier exchanges with an agent, in the format the chat service expects"""
+    history = []
+    # Messages are appended in (question, reply) pairs
+    for question, reply in zip(st.session_state.messages[0::2], st.session_state.messages[1::2]):
+        # Failed requests are not part of the conversation
+        if reply["role"] == agent and not reply["text"].startswith("Error: "):
+            history.append({"role": "user", "content": question["text"]})
+            history.append({"role": "assistant", "content": reply["text"]})
+    return history
+
 # ---------- INPUT SECTION ----------
 with st.form(key="chat_form", clear_on_submit=True):
 
@@ -36,14 +55,26 @@ with st.form(key="chat_form", clear_on_submit=True):
         send = st.form_submit_button("Send")
 
     if send and user_input.strip():
+        conversation = agent_conversation(agent)
         st.session_state.messages.append({
             "role": "You",
             "text": user_input
         })
 
+        try:
+            reply = process_user_question(
+                user_input,
+                # Each agent keeps its own conversation
+                conversation_history=conversation,
+                session_id=f"{st.session_state.chat_session_id}:{agent}",
+                agent=agent
+            )
+        except Exception as e:
+            reply = f"Error: {e}"
+
         st.session_state.messages.append({
             "role": agent,
-            "text": "Reply from agent"
+            "text": reply
         })
 
 # ---------- CHAT DISPLAY ----------
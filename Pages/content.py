@@ -1,4 +1,7 @@
 import streamlit as st
+from core import submit_ingest_job, get_job, list_jobs, list_sources
+from core.config import JOB_POLL_INTERVAL
+from core.jobs import ACTIVE_STATES, SUCCEEDED
 
 # Page config
 st.set_page_config(
@@ -16,8 +19,11 @@ if not selected_agent:
         st.switch_page("pages/page2.py")
     st.stop()
 
+# Agents are stored as {"name", "desc"}; the name keys the agent's index
+agent_name = selected_agent["name"] if isinstance(selected_agent, dict) else selected_agent
+
 # Page title
-st.title(f"Content for {selected_agent}")
+st.title(f"Content for {agent_name}")
 
 st.write("---")
 
@@ -55,13 +61,63 @@ with st.container():
 
     # Submit button
     if st.button("Submit & Save"):
-        st.success(f"Content saved for {selected_agent}")
+        uploaded_files = uploaded_files or []
+        pdf_files = [f for f in uploaded_files if f.name.lower().endswith(".pdf")]
+        text_files = [f for f in uploaded_files if f.name.lower().endswith(".txt")]
+        other_files = [f.name for f in uploaded_files if f not in pdf_files and f not in text_files]
 
-        # For now just showing data
-        if uploaded_files:
-            st.write("Files uploaded:", len(uploaded_files))
+        texts = [f.read().decode("utf-8", errors="ignore") for f in text_files]
         if paragraph:
-            st.write("Paragraph received")
+            texts.append(paragraph)
+
+        # Indexing runs in the background; the page polls the job below
+        job_id = submit_ingest_job(
+            pdf_files=pdf_files,
+            text_input="\n\n".join(texts),
+            agent=agent_name
+        )
+        st.session_state.setdefault("content_jobs", {})[job_id] = agent_name
+        st.info("Indexing started. The agent keeps answering from its current content meanwhile.")
+        if other_files:
+            st.warning("Not indexed (unsupported type): " + ", ".join(other_files))
+
+    @st.fragment(run_every=JOB_POLL_INTERVAL)
+    def show_job_progress():
+        for job in list_jobs(agent=agent_name, active_only=True):
+            progress = job["progress"]
+            st.caption(
+                f"⏳ {job['status'].capitalize()}: {progress.get('pages', 0)} pages · "
+                f"{progress.get('chunks', 0)} chunks · {progress.get('embedded', 0)} embedded"
+            )
+        if not list_jobs(agent=agent_name, active_only=True, limit=1):
+            st.rerun()
+
+    if list_jobs(agent=agent_name, active_only=True, limit=1):
+        show_job_progress()
+
+    # Report finished jobs of this session once
+    content_jobs = st.session_state.get("content_jobs", {})
+    for job_id, job_agent in list(content_jobs.items()):
+        if job_agent != agent_name:
+            continue
+        job = get_job(job_id)
+        if job is not None and job["status"] in ACTIVE_STATES:
+            continue
+        del content_jobs[job_id]
+        if job is None:
+            continue
+        if job["status"] == SUCCEEDED:
+            st.success(f"Content saved for {agent_name}")
+        else:
+            st.error(job["error"] or "Indexing failed.")
+        if job["result"] and job["result"]["warning"]:
+            st.warning(job["result"]["warning"])
+
+    sources = list_sources(agent=agent_name)
+    if sources:
+        st.subheader("Indexed Content")
+        for source in sources:
+            st.write(f"📄 {source}")
 
     st.markdown("</div>", unsafe_allow_html=True)
 
@@ -1,8 +1,27 @@
 """
 Multi-PDF Chat Application - Streamlit UI with Conversation Memory
 """
+import uuid
 import streamlit as st
-from core import validate_env, process_user_question, process_documents
+from core import (
+    validate_env,
+    stream_user_question,
+    submit_ingest_job,
+    get_job,
+    list_jobs,
+    list_sources,
+    get_metrics,
+    get_recent_traces,
+    render_prometheus,
+    profile_next_request,
+    start_warmup,
+    get_warmup_status
+)
+from core.config import JOB_POLL_INTERVAL
+from core.jobs import ACTIVE_STATES, SUCCEEDED
+
+# Search scope option that searches every indexed document
+ALL_DOCUMENTS = "All documents"
 
 def initialize_session_state():
     """Initialize session state variables"""
@@ -10,6 +29,14 @@ def initialize_session_state():
         st.session_state.conversation = []
     if "max_history" not in st.session_state:
         st.session_state.max_history = 5  # Default: remember last 5 exchanges
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    if "ingest_jobs" not in st.session_state:
+        st.session_state.ingest_jobs = []  # Submitted jobs not yet reported
+    if "finished_jobs" not in st.session_state:
+        st.session_state.finished_jobs = []
+    if "search_source" not in st.session_state:
+        st.session_state.search_source = None  # None searches every document
 
 def display_conversation():
     """Display the conversation history"""
@@ -29,13 +56,15 @@ def handle_user_question(user_question):
         return
     
     try:
-        with st.spinner("Thinking..."):
-            # Pass conversation history to the chat service
-            answer = process_user_question(
-                user_question, 
-                conversation_history=st.session_state.conversation,
-                max_history=st.session_state.max_history
-            )
+        # Pass conversation history to the chat service and render the
+        # answer as it is generated
+        answer = st.write_stream(stream_user_question(
+            user_question, 
+            conversation_history=st.session_state.conversation,
+            max_history=st.session_state.max_history,
+            session_id=st.session_state.session_id,
+            source=st.session_state.search_source
+        ))
         
         # Update session state
         st.session_state.conversation.append({
@@ -57,24 +86,100 @@ def handle_user_question(user_question):
     except Exception as e:
         st.error(f"An error occurred: {str(e)}")
 
-def handle_document_processing(pdf_docs, para):
-    """Handle document upload and processing"""
+def handle_document_processing(pdf_docs, para, replace=False):
+    """Queue document upload and processing as a background job"""
     if not pdf_docs and not para:
         st.warning("Please provide either PDF files or text input.")
         return
     
-    with st.spinner("Processing documents..."):
-        result = process_documents(pdf_files=pdf_docs, text_input=para)
+    job_id = submit_ingest_job(
+        pdf_files=pdf_docs,
+        text_input=para,
+        append=not replace
+    )
+    st.session_state.ingest_jobs.append(job_id)
+    st.info("📥 Documents queued. You can keep asking questions while they are indexed.")
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def display_job_progress():
+    """Show running ingestion jobs, refreshing until they finish"""
+    for job in list_jobs(active_only=True):
+        progress = job["progress"]
+        st.caption(
+            f"⏳ {job['status'].capitalize()}: 📄 {progress.get('pages', 0)} pages · "
+            f"🧩 {progress.get('chunks', 0)} chunks · 🔢 {progress.get('embedded', 0)} embedded"
+        )
     
-    if result["warning"]:
-        st.warning(result["warning"])
+    finished = False
+    for job_id in list(st.session_state.ingest_jobs):
+        job = get_job(job_id)
+        if job is None or job["status"] not in ACTIVE_STATES:
+            st.session_state.ingest_jobs.remove(job_id)
+            if job is not None:
+                st.session_state.finished_jobs.append(job)
+            finished = True
     
-    if result["error"]:
-        st.error(result["error"])
-        return
+    # Rerun the whole page so the document list shows the new sources
+    if finished or not list_jobs(active_only=True, limit=1):
+        st.rerun()
+
+def display_finished_jobs():
+    """Report the outcome of this session's jobs once"""
+    for job in st.session_state.finished_jobs:
+        result = job["result"] or {}
+        if result.get("warning"):
+            st.warning(result["warning"])
+        if job["status"] == SUCCEEDED:
+            st.success("✅ Documents processed successfully! You can now ask questions.")
+        else:
+            st.error(job["error"] or "Processing failed.")
+    st.session_state.finished_jobs = []
+
+def display_debug_panel():
+    """Show per-stage latency histograms and recent request breakdowns"""
+    metrics = get_metrics()
+    if not metrics:
+        st.caption("No requests recorded yet.")
+    else:
+        st.dataframe(
+            [
+                {
+                    "stage": name,
+                    "count": stage["count"],
+                    "p50 ms": round(stage["p50_ms"], 1),
+                    "p95 ms": round(stage["p95_ms"], 1),
+                    "p99 ms": round(stage["p99_ms"], 1),
+                    **stage["totals"]
+                }
+                for name, stage in metrics.items()
+            ],
+            hide_index=True,
+            use_container_width=True
+        )
+    
+    for request in get_recent_traces()[:5]:
+        st.caption(f"**{request['name']}** · {request['seconds'] * 1000:.0f} ms")
+        st.json(request["stages"], expanded=False)
+        if "profile" in request:
+            st.code(request["profile"], language=None)
     
-    if result["success"]:
-        st.success("✅ Documents processed successfully! You can now ask questions.")
+    warmup = get_warmup_status()
+    st.caption(f"Warm-up: {warmup['state']}")
+    for step, outcome in warmup["steps"].items():
+        detail = outcome.get("error") or outcome.get("note") or f"{outcome['seconds']:.2f}s"
+        st.caption(f"· {step}: {detail}")
+    
+    if st.button("🔬 Profile next request", use_container_width=True):
+        profile_next_request()
+        st.caption("The next question or upload will be profiled.")
+    
+    st.download_button(
+        "⬇️ Prometheus metrics",
+        render_prometheus(),
+        file_name="metrics.prom",
+        mime="text/plain",
+        use_container_width=True
+    )
 
 def main():
     """Main application entry point"""
@@ -109,17 +214,17 @@ def main():
     )
     
     col1, col2, col3 = st.columns([1, 1, 4])
-    answer = ""
     with col1:
-        if st.button("🚀 Submit", use_container_width=True):
-            answer = handle_user_question(user_question)
+        submitted = st.button("🚀 Submit", use_container_width=True)
     
     with col2:
         if st.button("🗑️ Clear Chat", use_container_width=True):
             st.session_state.conversation = []
             st.rerun()
 
-    st.write(answer)
+    # The answer streams in below the buttons
+    if submitted:
+        handle_user_question(user_question)
     # Display conversation history
     if st.session_state.conversation:
         st.divider()
@@ -153,9 +258,42 @@ def main():
             height=150
         )
         
+        replace = st.checkbox(
+            "Replace existing documents",
+            help="Rebuild the index from these documents only instead of adding to it"
+        )
+        
         # Process Button
         if st.button("⚡ Submit & Process", use_container_width=True):
-            handle_document_processing(pdf_docs, para)
+            handle_document_processing(pdf_docs, para, replace=replace)
+        
+        # Poll only while something is being indexed
+        if list_jobs(active_only=True, limit=1):
+            display_job_progress()
+        display_finished_jobs()
+        
+        # Indexed documents
+        sources = list_sources()
+        if sources:
+            st.subheader("🗂️ Indexed Documents")
+            for i, source in enumerate(sources):
+                doc_col, remove_col = st.columns([4, 1])
+                doc_col.caption(source)
+                if remove_col.button("❌", key=f"remove_source_{i}", help=f"Remove {source}"):
+                    # Loads the vector store, so only imported when needed
+                    from core import delete_source
+                    delete_source(source)
+                    st.rerun()
+            
+            scopes = [ALL_DOCUMENTS] + sources
+            current = st.session_state.search_source
+            scope = st.selectbox(
+                "Answer from",
+                scopes,
+                index=scopes.index(current) if current in scopes else 0,
+                help="Restrict answers to one document"
+            )
+            st.session_state.search_source = None if scope == ALL_DOCUMENTS else scope
         
         st.write("---")
         
@@ -201,6 +339,9 @@ def main():
             - Bot: "The Q4 revenue was $6M"
             """)
         
+        with st.expander("🩺 Performance Debug"):
+            display_debug_panel()
+        
         with st.expander("⚙️ About"):
             st.markdown("""
             This application uses:
@@ -210,6 +351,9 @@ def main():
             - **Groq** LLM for responses
             - **Conversation Memory** for context
             """)
+    
+    # The page is rendered; load the model and index before the first question
+    start_warmup()
 
 if __name__ == "__main__":
     main()
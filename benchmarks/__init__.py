@@ -0,0 +1,3 @@
+"""
+Offline benchmarks for the ingestion and query paths
+"""
\ No newline at end of file
@@ -0,0 +1,146 @@
+"""
+Deterministic stand-ins for the embedding model, the LLM and uploads
+"""
+import hashlib
+import io
+import random
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+# Same dimension as all-MiniLM-L6-v2
+FAKE_EMBEDDING_DIM = 384
+
+FAKE_ANSWER = "Here's the deal: the documents cover this. I cannot verify anything beyond them."
+
+_WORDS = (
+    "system index query vector latency cache memory document chunk page "
+    "budget shard replica throughput storage policy contract invoice clause "
+    "payment delivery warranty section appendix schedule review audit report"
+).split()
+
+class FakeEmbeddings(Embeddings):
+    """
+    Embeddings derived from a hash of the text
+    
+    The same text always gets the same unit vector, so runs are
+    reproducible, and the cost is negligible, so benchmarks measure the
+    code around the model rather than the model.
+    """
+    
+    def __init__(self, dim=FAKE_EMBEDDING_DIM):
+        self.dim = dim
+    
+    def _embed(self, text):
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+    
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+    
+    def embed_query(self, text):
+        return self._embed(text)
+
+def fake_chat_model(**kwargs):
+    """Drop-in for ChatGroq(...) that answers instantly with a fixed reply"""
+    return FakeListChatModel(responses=[FAKE_ANSWER])
+
+def synthetic_text(rng, num_words):
+    """
+    Generate filler prose with the odd identifier, like a real document
+    
+    Args:
+        rng (random.Random): Random source, for reproducibility
+        num_words (int): Approximate length in words
+    
+    Returns:
+        str: Text
+    """
+    words = []
+    while len(words) < num_words:
+        sentence = [rng.choice(_WORDS) for _ in range(rng.randint(6, 16))]
+        if rng.random() < 0.2:
+            sentence.append(f"{rng.choice('ABCDEFGH')}{rng.choice('XYZ')}-{rng.randint(1000, 9999)}")
+        words.extend(sentence)
+        words[-1] += "."
+    return " ".join(words)
+
+def synthetic_chunks(count, seed=0, num_words=150):
+    """Generate `count` distinct chunk texts"""
+    rng = random.Random(seed)
+    return [f"[{seed}:{i}] " + synthetic_text(rng, num_words) for i in range(count)]
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def make_pdf(pages, line_length=90):
+    """
+    Build a minimal valid PDF with one text page per string
+    
+    Args:
+        pages (list): Text of each page
+        line_length (int): Characters per line
+    
+    Returns:
+        bytes: PDF file
+    """
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # Page tree, filled in once the page objects are numbered
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+    ]
+    
+    page_ids = []
+    for text in pages:
+        lines = [text[i:i + line_length] for i in range(0, len(text), line_length)]
+        content = "BT /F1 9 Tf 11 TL 40 800 Td " + " ".join(
+            f"({_pdf_escape(line)}) Tj T*" for line in lines
+        ) + " ET"
+        content = content.encode("latin-1", errors="replace")
+        
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+    
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+    
+    xref_offset = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(
+        b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+        % (len(objects) + 1, xref_offset)
+    )
+    return out.getvalue()
+
+class UploadedFile(io.BytesIO):
+    """In-memory file with a name, like Streamlit's uploads"""
+    
+    def __init__(self, name, data):
+        super().__init__(data)
+        self.name = name
+
+def synthetic_pdfs(num_files, pages_per_file, seed=0, words_per_page=350):
+    """Generate upload-like PDF files of synthetic text"""
+    rng = random.Random(seed)
+    return [
+        UploadedFile(
+            f"synthetic-{i}.pdf",
+            make_pdf([synthetic_text(rng, words_per_page) for _ in range(pages_per_file)])
+        )
+        for i in range(num_files)
+    ]
\ No newline at end of file
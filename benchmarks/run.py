@@ -0,0 +1,361 @@
+"""
+Benchmark harness for the ingestion and query paths
+
+Runs fully offline: storage goes to a temporary directory, embeddings are
+FakeEmbeddings and the LLM is a fake chat model, so results reflect the
+code in core/ rather than the model or the network.
+
+Usage:
+    python -m benchmarks.run
+    python -m benchmarks.run --sizes 1000,10000,50000 --output after.json --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from .fakes import (
+    FakeEmbeddings,
+    fake_chat_model,
+    synthetic_chunks,
+    synthetic_pdfs,
+    synthetic_text
+)
+
+def _percentiles(samples_ms):
+    """p50/p95/p99 and mean of latency samples in milliseconds"""
+    cuts = statistics.quantiles(samples_ms, n=100, method="inclusive")
+    return {
+        "p50_ms": cuts[49],
+        "p95_ms": cuts[94],
+        "p99_ms": cuts[98],
+        "mean_ms": statistics.fmean(samples_ms),
+        "samples": len(samples_ms)
+    }
+
+def _rate(count, seconds):
+    return count / seconds if seconds else 0.0
+
+def _isolate_storage(work_dir):
+    """Point every storage path of core at a scratch directory and install the fakes"""
+    from core import config, database, embeddings, llm_chain, manifest, vector_store
+    
+    manifest.AGENT_INDEX_ROOT = os.path.join(work_dir, "agents")
+    vector_store.invalidate_vector_store_cache()
+    
+    database.DATABASE_PATH = os.path.join(work_dir, "chat_history.db")
+    database._schema_ready = False
+    database._local.conn = None
+    
+    fake = FakeEmbeddings()
+    if config.EMBEDDING_CACHE_ENABLED:
+        fake = embeddings.CachedEmbeddings(
+            fake,
+            model_name="fake",
+            path=os.path.join(work_dir, "embedding_cache"),
+            max_entries=config.EMBEDDING_CACHE_MAX_ENTRIES
+        )
+    embeddings._embeddings_instance = fake
+    
+    llm_chain.ChatGroq = fake_chat_model
+    llm_chain.reset_chain()
+
+def bench_pdf_extraction(num_files, pages_per_file):
+    """Pages extracted per second, with one worker process and with the pool"""
+    from core.pdf_loader import iter_pdf_pages
+    
+    files = synthetic_pdfs(num_files, pages_per_file)
+    results = {"files": num_files, "pages_per_file": pages_per_file}
+    
+    for mode, parallel in (("sequential", False), ("parallel", True)):
+        skipped = []
+        started = time.perf_counter()
+        pages = sum(1 for _ in iter_pdf_pages(files, skipped, parallel=parallel))
+        seconds = time.perf_counter() - started
+        results[mode] = {
+            "pages": pages,
+            "seconds": seconds,
+            "pages_per_sec": _rate(pages, seconds),
+            "skipped_files": len(skipped)
+        }
+    
+    return results
+
+def bench_chunking(num_pages):
+    """Chunks and characters per second through the streaming splitter"""
+    from core.text_splitter import iter_text_chunks
+    
+    pages = [
+        (f"doc-{i // 50}", i % 50 + 1, synthetic_text(random.Random(i), 350))
+        for i in range(num_pages)
+    ]
+    characters = sum(len(text) for _, _, text in pages)
+    
+    started = time.perf_counter()
+    chunks = sum(1 for _ in iter_text_chunks(pages))
+    seconds = time.perf_counter() - started
+    
+    return {
+        "pages": num_pages,
+        "chunks": chunks,
+        "seconds": seconds,
+        "chunks_per_sec": _rate(chunks, seconds),
+        "mb_per_sec": _rate(characters / 1e6, seconds)
+    }
+
+def bench_embeddings(num_texts):
+    """Embedding batches per second through get_embeddings(), cold and cached"""
+    from core.config import EMBEDDING_BATCH_SIZE
+    from core.embeddings import get_embeddings
+    
+    texts = synthetic_chunks(num_texts, seed=1)
+    batches = [texts[i:i + EMBEDDING_BATCH_SIZE] for i in range(0, len(texts), EMBEDDING_BATCH_SIZE)]
+    embeddings = get_embeddings()
+    
+    results = {"texts": num_texts, "batch_size": EMBEDDING_BATCH_SIZE}
+    for run in ("cold", "warm"):
+        started = time.perf_counter()
+        for batch in batches:
+            embeddings.embed_documents(batch)
+        seconds = time.perf_counter() - started
+        results[run] = {
+            "seconds": seconds,
+            "batches_per_sec": _rate(len(batches), seconds),
+            "texts_per_sec": _rate(num_texts, seconds)
+        }
+    
+    return results
+
+def bench_corpus(size, num_queries):
+    """Index build time and query latency for one corpus size"""
+    from core import vector_store
+    from core.chat_service import process_user_question
+    from core.config import EMBEDDING_BATCH_SIZE
+    from core.text_splitter import make_chunk
+    
+    agent = f"bench-{size}"
+    chunks = [
+        make_chunk(text, f"doc-{i // 1000}")
+        for i, text in enumerate(synthetic_chunks(size, seed=size))
+    ]
+    batches = [chunks[i:i + EMBEDDING_BATCH_SIZE] for i in range(0, size, EMBEDDING_BATCH_SIZE)]
+    
+    started = time.perf_counter()
+    vector_store.add_chunk_batches(batches, replace=True, agent=agent)
+    build_seconds = time.perf_counter() - started
+    
+    results = {
+        "chunks": size,
+        "build": {
+            "seconds": build_seconds,
+            "chunks_per_sec": _rate(size, build_seconds)
+        },
+        "memory": vector_store.get_vector_store(agent).footprint
+    }
+    
+    # Appending one chunk to the built index only writes that chunk
+    started = time.perf_counter()
+    vector_store.add_chunk_batches([[make_chunk(f"appended chunk {size}", "appended")]], agent=agent)
+    results["append_one_ms"] = (time.perf_counter() - started) * 1000
+    
+    # Cold open of the snapshot, as after a restart
+    vector_store.invalidate_vector_store_cache()
+    started = time.perf_counter()
+    vector_store.get_vector_store(agent)
+    results["open_ms"] = (time.perf_counter() - started) * 1000
+    
+    # Every query is distinct, so neither the query embedding nor the
+    # results cache can answer it
+    queries = [f"q{size}-{i} " + synthetic_text(random.Random(i), 12) for i in range(num_queries)]
+    for mode in ("dense", "hybrid"):
+        started = time.perf_counter()
+        vector_store.search_similar_documents(f"warm-up {mode}", mode=mode, agent=agent)
+        first_ms = (time.perf_counter() - started) * 1000
+        
+        samples = []
+        for query in queries:
+            started = time.perf_counter()
+            vector_store.search_similar_documents(f"{mode} {query}", mode=mode, agent=agent)
+            samples.append((time.perf_counter() - started) * 1000)
+        results[f"query_{mode}"] = {"first_ms": first_ms, **_percentiles(samples)}
+    
+    # Recall of the configured index against exact search; the sweep is
+    # keyed by parameter so --compare can line runs up
+    ann_report = vector_store.get_ann_report(num_queries=min(num_queries, 100), agent=agent)
+    ann_report.pop("memory")
+    ann_report["sweep"] = {
+        f"{entry['param']}={entry['value']}" if entry["param"] else "default": entry
+        for entry in ann_report["sweep"]
+    }
+    results["ann"] = ann_report
+    
+    # Whole question path with the fake LLM
+    samples = []
+    for i, query in enumerate(queries[:max(2, num_queries // 4)]):
+        started = time.perf_counter()
+        process_user_question(f"answer {query}", session_id=f"bench-{size}-{i}", agent=agent)
+        samples.append((time.perf_counter() - started) * 1000)
+    results["answer_fake_llm"] = _percentiles(samples)
+    
+    return results
+
+def bench_sqlite(num_messages):
+    """Message writes per second: one at a time, batched and write-behind"""
+    from core import database
+    
+    messages = [
+        ("user" if i % 2 == 0 else "assistant", synthetic_text(random.Random(i), 40))
+        for i in range(num_messages)
+    ]
+    batch_size = 64
+    results = {"messages": num_messages}
+    
+    started = time.perf_counter()
+    for role, content in messages:
+        database.save_message(role, content, session_id="bench-single", background=False)
+    results["single"] = {"messages_per_sec": _rate(num_messages, time.perf_counter() - started)}
+    
+    started = time.perf_counter()
+    for i in range(0, num_messages, batch_size):
+        database.save_messages(messages[i:i + batch_size], session_id="bench-batched", background=False)
+    results["batched"] = {"messages_per_sec": _rate(num_messages, time.perf_counter() - started)}
+    
+    started = time.perf_counter()
+    for i in range(0, num_messages, 2):
+        database.save_messages(messages[i:i + 2], session_id="bench-write-behind", background=True)
+    enqueued = time.perf_counter() - started
+    database.flush_messages()
+    results["write_behind"] = {
+        "enqueue_ms_per_exchange": enqueued * 1000 / (num_messages / 2),
+        "messages_per_sec": _rate(num_messages, time.perf_counter() - started)
+    }
+    
+    started = time.perf_counter()
+    history = database.get_conversation_history(session_id="bench-single")
+    results["read_history"] = {
+        "messages": len(history),
+        "ms": (time.perf_counter() - started) * 1000
+    }
+    
+    return results
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _metadata(args):
+    from core import config
+    
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "args": vars(args),
+        "config": {
+            name: getattr(config, name)
+            for name in (
+                "FAISS_INDEX_TYPE",
+                "VECTOR_QUANTIZATION",
+                "RETRIEVAL_MODE",
+                "EMBEDDING_BATCH_SIZE",
+                "EMBEDDING_CACHE_ENABLED",
+                "CHUNK_SIZE",
+                "CHUNK_OVERLAP",
+                "CONTEXT_PACKING_ENABLED",
+                "CONTEXT_TOKEN_BUDGET"
+            )
+        }
+    }
+
+def _numeric_leaves(data, prefix=""):
+    """Flatten nested results into {'a.b.c': number}"""
+    leaves = {}
+    for key, value in data.items():
+        path = f"{prefix}.{key}" if prefix else str(key)
+        if isinstance(value, dict):
+            leaves.update(_numeric_leaves(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            leaves[path] = value
+    return leaves
+
+def compare(previous, current):
+    """
+    Print how every measurement changed between two runs
+    
+    Args:
+        previous (dict): Earlier results file contents
+        current (dict): New results file contents
+    """
+    before = _numeric_leaves(previous["results"])
+    after = _numeric_leaves(current["results"])
+    
+    print(f"\nChanges since {previous['meta'].get('commit')} ({previous['meta']['timestamp']}):")
+    for path in sorted(before.keys() & after.keys()):
+        old, new = before[path], after[path]
+        change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+        print(f"  {path:<55} {old:>14.3f} -> {new:>14.3f}  {change}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000", help="Corpus sizes in chunks, comma separated")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per corpus size and mode")
+    parser.add_argument("--pdf-files", type=int, default=8)
+    parser.add_argument("--pdf-pages", type=int, default=40, help="Pages per PDF file")
+    parser.add_argument("--chunk-pages", type=int, default=2000, help="Pages for the chunking benchmark")
+    parser.add_argument("--embed-texts", type=int, default=4096)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch storage directory")
+    args = parser.parse_args(argv)
+    
+    work_dir = tempfile.mkdtemp(prefix="rag-bench-")
+    _isolate_storage(work_dir)
+    
+    results = {}
+    try:
+        print("PDF extraction...", flush=True)
+        results["pdf_extraction"] = bench_pdf_extraction(args.pdf_files, args.pdf_pages)
+        print("Chunking...", flush=True)
+        results["chunking"] = bench_chunking(args.chunk_pages)
+        print("Embeddings...", flush=True)
+        results["embeddings"] = bench_embeddings(args.embed_texts)
+        results["corpus"] = {}
+        for size in [int(size) for size in args.sizes.split(",")]:
+            print(f"Corpus of {size} chunks...", flush=True)
+            results["corpus"][str(size)] = bench_corpus(size, args.queries)
+        print("SQLite...", flush=True)
+        results["sqlite"] = bench_sqlite(args.messages)
+    finally:
+        if args.keep:
+            print(f"Scratch storage kept in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    
+    output = {"meta": _metadata(args), "results": results}
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2)
+    print(f"Results written to {args.output}")
+    
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), output)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
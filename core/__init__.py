@@ -1,16 +1,50 @@
 """
 Core package initialization
+
+Exports are resolved on first access, so `import core` loads nothing
+heavy; each submodule is imported when one of its names is first used.
 """
-from .config import validate_env, get_groq_api_key
-from .chat_service import process_user_question, process_documents
-from .database import get_conversation_history, clear_history, save_message
+import importlib
+
+# Exported name -> submodule defining it
+_EXPORTS = {
+    'validate_env': 'config',
+    'get_groq_api_key': 'config',
+    'process_user_question': 'chat_service',
+    'stream_user_question': 'chat_service',
+    'aprocess_user_question': 'chat_service',
+    'astream_user_question': 'chat_service',
+    'process_documents': 'chat_service',
+    'get_conversation_history': 'database',
+    'get_history_page': 'database',
+    'clear_history': 'database',
+    'save_message': 'database',
+    'flush_messages': 'database',
+    'list_sources': 'manifest',
+    'delete_source': 'vector_store',
+    'list_agents': 'manifest',
+    'delete_agent': 'vector_store',
+    'submit_ingest_job': 'jobs',
+    'get_job': 'jobs',
+    'list_jobs': 'jobs',
+    'get_metrics': 'metrics',
+    'get_recent_traces': 'metrics',
+    'render_prometheus': 'metrics',
+    'profile_next_request': 'metrics',
+    'start_warmup': 'startup',
+    'get_warmup_status': 'startup'
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    globals()[name] = value  # Later lookups skip __getattr__
+    return value
 
-__all__ = [
-    'validate_env',
-    'get_groq_api_key',
-    'process_user_question',
-    'process_documents',
-    'get_conversation_history',
-    'clear_history',
-    'save_message'
-]
\ No newline at end of file
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
\ No newline at end of file
@@ -0,0 +1,516 @@
+"""
+FAISS index construction and tuning for large corpora
+"""
+import math
+import time
+import faiss
+import numpy as np
+from .config import (
+    FAISS_INDEX_TYPE,
+    ANN_AUTO_HNSW_MIN_VECTORS,
+    ANN_AUTO_IVF_MIN_VECTORS,
+    IVF_NLIST,
+    IVF_NPROBE,
+    HNSW_M,
+    HNSW_EF_CONSTRUCTION,
+    HNSW_EF_SEARCH,
+    VECTOR_QUANTIZATION,
+    PQ_M
+)
+
+INDEX_TYPES = ("flat", "ivf", "hnsw")
+QUANTIZATIONS = (None, "sq8", "pq")
+
+# IVF needs about this many training vectors per list for stable centroids
+_MIN_TRAINING_POINTS_PER_LIST = 39
+
+# PQ codebooks have 256 centroids per sub-quantizer, trained the same way
+_PQ_NBITS = 8
+_MIN_PQ_TRAINING_POINTS = _MIN_TRAINING_POINTS_PER_LIST * 2 ** _PQ_NBITS
+
+# Vectors compared per step of an exact search
+EXACT_SEARCH_BLOCK = 65_536
+
+def choose_index_type(num_vectors, index_type=FAISS_INDEX_TYPE):
+    """
+    Resolve the index type to use for a corpus
+    
+    With "auto", small corpora stay on the exact flat index, mid-sized
+    ones use HNSW (best latency, no training) and very large ones IVF
+    (smaller memory overhead than HNSW's graph).
+    
+    Args:
+        num_vectors (int): Number of vectors in the corpus
+        index_type (str): "flat", "ivf", "hnsw" or "auto"
+    
+    Returns:
+        str: "flat", "ivf" or "hnsw"
+    """
+    if index_type == "auto":
+        if num_vectors >= ANN_AUTO_IVF_MIN_VECTORS:
+            return "ivf"
+        if num_vectors >= ANN_AUTO_HNSW_MIN_VECTORS:
+            return "hnsw"
+        return "flat"
+    
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown FAISS index type: {index_type}")
+    
+    # IVF cannot be trained on a handful of vectors
+    if index_type == "ivf" and num_vectors < _MIN_TRAINING_POINTS_PER_LIST:
+        return "flat"
+    
+    return index_type
+
+def choose_quantization(num_vectors, dim, quantization=VECTOR_QUANTIZATION):
+    """
+    Resolve the vector quantization to use for a corpus
+    
+    PQ needs thousands of training vectors for its codebooks; smaller
+    corpora fall back to SQ8, which trains on any number of vectors.
+    
+    Args:
+        num_vectors (int): Number of vectors in the corpus
+        dim (int): Vector dimension
+        quantization (str): None, "sq8" or "pq"
+    
+    Returns:
+        str: None, "sq8" or "pq"
+    
+    Raises:
+        ValueError: If the quantization is unknown or PQ_M does not divide dim
+    """
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown vector quantization: {quantization}")
+    
+    if quantization == "pq" and dim % PQ_M:
+        raise ValueError(f"PQ_M ({PQ_M}) must divide the embedding dimension ({dim})")
+    
+    if not num_vectors:
+        return None
+    if quantization == "pq" and num_vectors < _MIN_PQ_TRAINING_POINTS:
+        return "sq8"
+    
+    return quantization
+
+def index_type_of(index):
+    """
+    Get the type name of a FAISS index
+    
+    Returns:
+        str: "flat", "ivf" or "hnsw"
+    """
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+def quantization_of(index):
+    """
+    Get the vector quantization of a FAISS index
+    
+    Returns:
+        str: None, "sq8" or "pq"
+    """
+    if isinstance(index, (
+        faiss.IndexScalarQuantizer,
+        faiss.IndexIVFScalarQuantizer,
+        faiss.IndexHNSWSQ
+    )):
+        return "sq8"
+    if isinstance(index, (faiss.IndexPQ, faiss.IndexIVFPQ, faiss.IndexHNSWPQ)):
+        return "pq"
+    return None
+
+def _ivf_nlist(num_vectors):
+    """Number of IVF lists: configured, or about 4 * sqrt(n), trainable either way"""
+    nlist = IVF_NLIST or int(4 * math.sqrt(num_vectors))
+    return max(1, min(nlist, num_vectors // _MIN_TRAINING_POINTS_PER_LIST))
+
+def apply_search_params(index):
+    """
+    Set the query-time parameters (nprobe / efSearch) from config
+    
+    These are not reliably persisted with the index, so they are applied
+    after every build and load.
+    """
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = IVF_NPROBE
+    elif isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    return index
+
+def _new_index(dim, num_vectors, index_type, quantization):
+    """Create an empty, untrained index of the given type and quantization"""
+    sq8 = faiss.ScalarQuantizer.QT_8bit
+    
+    if index_type == "hnsw":
+        if quantization == "sq8":
+            index = faiss.IndexHNSWSQ(dim, sq8, HNSW_M)
+        elif quantization == "pq":
+            index = faiss.IndexHNSWPQ(dim, PQ_M, HNSW_M)
+        else:
+            index = faiss.IndexHNSWFlat(dim, HNSW_M)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        return index
+    
+    if index_type == "ivf":
+        quantizer = faiss.IndexFlatL2(dim)
+        nlist = _ivf_nlist(num_vectors)
+        if quantization == "sq8":
+            return faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, sq8)
+        if quantization == "pq":
+            return faiss.IndexIVFPQ(quantizer, dim, nlist, PQ_M, _PQ_NBITS)
+        return faiss.IndexIVFFlat(quantizer, dim, nlist)
+    
+    if quantization == "sq8":
+        return faiss.IndexScalarQuantizer(dim, sq8)
+    if quantization == "pq":
+        return faiss.IndexPQ(dim, PQ_M, _PQ_NBITS)
+    return faiss.IndexFlatL2(dim)
+
+def build_index(vectors, index_type, quantization=VECTOR_QUANTIZATION):
+    """
+    Build an index of the given type holding the vectors, in order
+    
+    Positions in the new index match row numbers in `vectors`, so a
+    chunk store written in the same order stays valid.
+    
+    Args:
+        vectors (np.ndarray): float32 array of shape (n, dim)
+        index_type (str): "flat", "ivf" or "hnsw"
+        quantization (str): None, "sq8" or "pq"
+    
+    Returns:
+        faiss.Index: Populated index with search parameters applied
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    num_vectors, dim = vectors.shape
+    index_type = choose_index_type(num_vectors, index_type)
+    quantization = choose_quantization(num_vectors, dim, quantization)
+    
+    index = _new_index(dim, num_vectors, index_type, quantization)
+    if not index.is_trained:
+        index.train(vectors)
+    
+    if num_vectors:
+        index.add(vectors)
+    return apply_search_params(index)
+
+def reconstruct_all(index):
+    """
+    Read every stored vector back out of an index, in position order
+    
+    The vectors of a quantized index come back decoded, i.e. only
+    approximately equal to the ones that were added.
+    
+    Returns:
+        np.ndarray: float32 array of shape (ntotal, dim)
+    """
+    if isinstance(index, faiss.IndexIVF):
+        index.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+def supports_reconstruct(index):
+    """
+    Whether single vectors can be read back without changing the index
+    
+    IVF needs a direct map for that, which would modify a shared index.
+    """
+    return index_type_of(index) != "ivf"
+
+def supports_selector(index):
+    """
+    Whether a search can be restricted to some positions with an IDSelector
+    
+    IndexPQ (flat PQ) rejects selectors; every other index built here
+    accepts them.
+    """
+    return not isinstance(index, faiss.IndexPQ)
+
+def supports_remove(index):
+    """
+    Whether removing vectors keeps positions contiguous
+    
+    Only the unquantized flat index compacts on remove_ids. HNSW cannot
+    remove at all and IVF keeps the old labels, so both are rebuilt
+    instead, as are quantized indexes so they are retrained from full
+    precision vectors.
+    """
+    return index_type_of(index) == "flat" and quantization_of(index) is None
+
+def reindex_if_needed(
+    index,
+    vectors=None,
+    index_type=FAISS_INDEX_TYPE,
+    quantization=VECTOR_QUANTIZATION
+):
+    """
+    Convert an index to the configured type and quantization if it is not already
+    
+    Ingestion always appends to whatever index exists; this is run before
+    saving so the corpus moves to IVF/HNSW once it is large enough (and
+    IVF is trained on the whole corpus rather than the first batch).
+    
+    Args:
+        index (faiss.Index): Current index
+        vectors (np.ndarray, optional): Full precision vectors of the index,
+            in position order; read back from the index if not given
+        index_type (str): Configured type ("auto" resolves by corpus size)
+        quantization (str): Configured quantization
+    
+    Returns:
+        faiss.Index: The same index, or a rebuilt one
+    """
+    wanted = choose_index_type(index.ntotal, index_type)
+    wanted_quantization = choose_quantization(index.ntotal, index.d, quantization)
+    current = index_type_of(index)
+    
+    # IVF lists were sized for the corpus it was trained on; retrain once
+    # the corpus has outgrown them
+    outgrown = current == "ivf" and _ivf_nlist(index.ntotal) > 2 * index.nlist
+    
+    unchanged = wanted == current and wanted_quantization == quantization_of(index)
+    if unchanged and not outgrown:
+        return index
+    
+    if vectors is None:
+        vectors = reconstruct_all(index)
+    return build_index(vectors, wanted, wanted_quantization)
+
+def rerank(vectors, query, positions, k):
+    """
+    Re-order candidate positions by exact distance to the query
+    
+    Only the candidates' rows are read, so `vectors` can be a memmap that
+    mostly stays on disk.
+    
+    Args:
+        vectors (np.ndarray): Full precision vectors, in position order
+        query (np.ndarray): Query vector
+        positions (list): Candidate positions from the (quantized) index
+        k (int): Number of positions to return
+    
+    Returns:
+        list: The k candidate positions nearest to the query, nearest first
+    """
+    if not positions:
+        return []
+    
+    rows = np.asarray(vectors[positions], dtype=np.float32)
+    distances = ((rows - query) ** 2).sum(axis=1)
+    return [positions[i] for i in np.argsort(distances)[:k]]
+
+def _search_parameters(index, selector, k, widen=1.0):
+    """
+    Search parameters restricted to a selector
+    
+    The configured nprobe / efSearch are multiplied by widen, so a search
+    that skips most vectors still meets as many matching ones as an
+    unrestricted search would.
+    """
+    # Parameters passed with a search replace the index's own settings
+    if isinstance(index, faiss.IndexIVF):
+        nprobe = min(index.nlist, math.ceil(IVF_NPROBE * widen))
+        return faiss.SearchParametersIVF(sel=selector, nprobe=nprobe)
+    if isinstance(index, faiss.IndexHNSW):
+        ef_search = math.ceil(max(HNSW_EF_SEARCH, k) * widen)
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=ef_search)
+    return faiss.SearchParameters(sel=selector)
+
+def search_subset(index, query, positions, k):
+    """
+    Search only some positions of an index
+    
+    FAISS skips the other vectors while it searches, so the result is the
+    k nearest of the subset rather than a filtered top-k of the whole
+    index, and no more candidates are fetched than requested. IVF and
+    HNSW only visit part of the index, of which just the subset's share
+    matches, so nprobe / efSearch are scaled up by the inverse of that
+    share to keep recall at its unfiltered level.
+    
+    Args:
+        index (faiss.Index): Index to search
+        query (np.ndarray): float32 array of shape (1, dim)
+        positions (np.ndarray): Sorted int64 positions to search
+        k (int): Number of positions to return
+    
+    Returns:
+        list: Up to k positions, nearest first
+    """
+    positions = np.ascontiguousarray(positions, dtype=np.int64)
+    if not len(positions):
+        return []
+    
+    # IDSelectorBatch copies the IDs into its own hash set
+    selector = faiss.IDSelectorBatch(len(positions), faiss.swig_ptr(positions))
+    widen = max(1.0, index.ntotal / len(positions))
+    _, indices = index.search(query, k, params=_search_parameters(index, selector, k, widen))
+    return [int(i) for i in indices[0] if i != -1]
+
+def exact_search(index, query, positions, k, vectors=None):
+    """
+    Find the k nearest of some positions by computing every distance
+    
+    Cheaper than any index structure once the subset is small, and exact.
+    Vectors are read EXACT_SEARCH_BLOCK rows at a time, so large subsets
+    (for indexes without selector support) do not need them all at once.
+    
+    Args:
+        index (faiss.Index): Index holding the vectors (see supports_reconstruct)
+        query (np.ndarray): Query vector
+        positions (np.ndarray): Positions to compare
+        k (int): Number of positions to return
+        vectors (np.ndarray, optional): Full precision vectors, in position
+            order, read instead of the index's (possibly quantized) ones
+    
+    Returns:
+        list: Up to k positions, nearest first
+    """
+    if not len(positions):
+        return []
+    
+    positions = np.asarray(positions, dtype=np.int64)
+    best_positions = np.zeros(0, dtype=np.int64)
+    best_distances = np.zeros(0, dtype=np.float32)
+    
+    for start in range(0, len(positions), EXACT_SEARCH_BLOCK):
+        block = positions[start:start + EXACT_SEARCH_BLOCK]
+        if vectors is not None:
+            rows = np.asarray(vectors[block], dtype=np.float32)
+        else:
+            rows = index.reconstruct_batch(block)
+        
+        # Keep the running k best of the blocks seen so far
+        best_positions = np.concatenate([best_positions, block])
+        best_distances = np.concatenate([best_distances, ((rows - query) ** 2).sum(axis=1)])
+        if len(best_positions) > k:
+            keep = np.argpartition(best_distances, k)[:k]
+            best_positions, best_distances = best_positions[keep], best_distances[keep]
+    
+    order = np.argsort(best_distances, kind="stable")
+    return [int(position) for position in best_positions[order]]
+
+def memory_footprint(index, index_bytes):
+    """
+    Describe the memory an index takes compared to plain float32 vectors
+    
+    Args:
+        index (faiss.Index): Index to describe
+        index_bytes (int): Serialized size of the index, which is what it
+            occupies once loaded
+    
+    Returns:
+        dict: 'index_type', 'quantization', 'vectors', 'index_bytes',
+            'float32_bytes' and 'compression' (float32 size / index size)
+    """
+    float32_bytes = index.ntotal * index.d * 4
+    return {
+        "index_type": index_type_of(index),
+        "quantization": quantization_of(index),
+        "vectors": int(index.ntotal),
+        "index_bytes": int(index_bytes),
+        "float32_bytes": int(float32_bytes),
+        "compression": float32_bytes / index_bytes if index_bytes else 0.0
+    }
+
+def _search_latencies(index, queries, k):
+    """Search one query at a time, returning results and per-query latency in ms"""
+    results = []
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        _, ids = index.search(query.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        results.append(ids[0])
+    return results, latencies
+
+def _latency_summary(latencies):
+    return {
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95))
+    }
+
+def _recall(found, truth, k):
+    return float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)]))
+
+def recall_report(index, num_queries=100, k=4, seed=0, vectors=None, rerank_candidates=0):
+    """
+    Measure recall and latency of an index against exact flat search
+    
+    Queries are stored vectors with a little noise added, so they are not
+    trivially their own nearest neighbour. For IVF and HNSW the report
+    sweeps nprobe / efSearch to show the recall-versus-latency tradeoff.
+    
+    Args:
+        index (faiss.Index): Index to evaluate
+        num_queries (int): Number of sample queries
+        k (int): Neighbours per query
+        seed (int): Random seed for query sampling
+        vectors (np.ndarray, optional): Full precision vectors of the index;
+            needed for exact ground truth when the index is quantized
+        rerank_candidates (int): If set, also report recall when k * this
+            many candidates are re-ranked with the full precision vectors
+    
+    Returns:
+        dict: 'index_type', 'quantization', 'vectors', 'k', 'flat' latency
+            and a 'sweep' list of {'param', 'value', 'recall', 'p50_ms',
+            'p95_ms'}, plus 'reranked_recall' when re-ranking is measured
+    """
+    if vectors is None:
+        vectors = reconstruct_all(index)
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    sample = vectors[rng.integers(0, len(vectors), size=num_queries)]
+    noise = rng.normal(scale=vectors.std() * 0.1, size=sample.shape)
+    queries = (sample + noise).astype(np.float32)
+    
+    flat = faiss.IndexFlatL2(vectors.shape[1])
+    flat.add(vectors)
+    truth, flat_latencies = _search_latencies(flat, queries, k)
+    
+    index_type = index_type_of(index)
+    if index_type == "ivf":
+        param, values = "nprobe", [1, 2, 4, 8, 16, 32, 64, 128]
+    elif index_type == "hnsw":
+        param, values = "efSearch", [16, 32, 64, 128, 256]
+    else:
+        param, values = None, [None]
+    
+    sweep = []
+    for value in values:
+        if param == "nprobe":
+            index.nprobe = value
+        elif param == "efSearch":
+            index.hnsw.efSearch = value
+        
+        found, latencies = _search_latencies(index, queries, k)
+        result = {
+            "param": param,
+            "value": value,
+            "recall": _recall(found, truth, k),
+            **_latency_summary(latencies)
+        }
+        
+        if rerank_candidates:
+            candidates, _ = _search_latencies(index, queries, k * rerank_candidates)
+            reranked = [
+                rerank(vectors, query, [int(i) for i in ids if i != -1], k)
+                for query, ids in zip(queries, candidates)
+            ]
+            result["reranked_recall"] = _recall(reranked, truth, k)
+        
+        sweep.append(result)
+    
+    # Put the configured parameters back
+    apply_search_params(index)
+    
+    return {
+        "index_type": index_type,
+        "quantization": quantization_of(index),
+        "vectors": int(index.ntotal),
+        "k": k,
+        "flat": _latency_summary(flat_latencies),
+        "sweep": sweep
+    }
@@ -0,0 +1,52 @@
+"""
+Small thread-safe caches shared across Streamlit sessions
+"""
+import threading
+from collections import OrderedDict
+
+class LRUCache:
+    """Least-recently-used cache with a fixed number of entries"""
+    
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0}
+    
+    def get(self, key, default=None):
+        """Return the cached value for key, marking it as recently used"""
+        with self._lock:
+            if key not in self._entries:
+                self._stats["misses"] += 1
+                return default
+            
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return self._entries[key]
+    
+    def put(self, key, value):
+        """Store a value, evicting the least recently used entry if full"""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        """Remove all entries"""
+        with self._lock:
+            self._entries.clear()
+    
+    def get_stats(self):
+        """
+        Get cache counters
+        
+        Returns:
+            dict: 'hits', 'misses' and current 'size'
+        """
+        with self._lock:
+            return {**self._stats, "size": len(self._entries)}
+    
+    def __len__(self):
+        return len(self._entries)
@@ -1,17 +1,42 @@
 """
 Chat service - orchestrates the entire chat workflow with conversation history
+
+The vector store (FAISS) and LLM chain (langchain) modules are imported on
+first use, so importing the service stays cheap.
 """
-from .vector_store import search_similar_documents
-from .llm_chain import get_conversational_chain
-from .database import save_message
+import logging
+import time
+from .database import save_messages, asave_messages
+from .history import pack_conversation_history
+from .metrics import span, timed, trace
+from .tokens import estimate_tokens
+from .config import (
+    EMBEDDING_BATCH_SIZE,
+    PIPELINE_QUEUE_SIZE,
+    DEFAULT_SESSION_ID,
+    HISTORY_TOKEN_BUDGET,
+    CONTEXT_PACKING_ENABLED
+)
+
+logger = logging.getLogger(__name__)
+
+# Source name recorded for text typed into the sidebar
+TEXT_INPUT_SOURCE = "Additional text"
 
-def format_conversation_history(conversation_list, max_messages=10):
+def format_conversation_history(
+    conversation_list,
+    max_messages=10,
+    token_budget=HISTORY_TOKEN_BUDGET,
+    session_id=DEFAULT_SESSION_ID
+):
     """
     Format conversation history for the LLM prompt
     
     Args:
         conversation_list (list): List of conversation messages
-        max_messages (int): Maximum number of recent messages to include
+        max_messages (int): Maximum number of recent exchanges to include verbatim
+        token_budget (int): Token budget for the formatted history
+        session_id (str): Session whose rolling summary covers older messages
     
     Returns:
         str: Formatted conversation history
@@ -19,17 +44,71 @@ def format_conversation_history(conversation_list, max_messages=10):
     if not conversation_list:
         return "No previous conversation."
     
-    # Get last N messages (N*2 because each exchange has user + assistant)
-    recent_messages = conversation_list[-(max_messages * 2):] if len(conversation_list) > max_messages * 2 else conversation_list
+    return pack_conversation_history(
+        conversation_list,
+        max_messages=max_messages,
+        token_budget=token_budget,
+        session_id=session_id
+    )
+
+def _context_tokens(docs):
+    return sum(estimate_tokens(doc.page_content) for doc in docs)
+
+def _format_history_stage(conversation_history, max_history, session_id):
+    """Format conversation history for a question as its own stage"""
+    with span("history", messages=len(conversation_history or [])) as stage:
+        history_text = format_conversation_history(
+            conversation_history if conversation_history else [],
+            max_messages=max_history,
+            session_id=session_id
+        )
+        stage["history_tokens"] = estimate_tokens(history_text)
+    
+    return history_text
+
+def _pack_context_stage(docs):
+    """Merge, dedupe and budget retrieved documents as their own stage"""
+    if not CONTEXT_PACKING_ENABLED:
+        return docs
     
-    formatted = []
-    for msg in recent_messages:
-        role = "User" if msg["role"] == "user" else "Assistant"
-        formatted.append(f"{role}: {msg['content']}")
+    from .context import pack_context
     
-    return "\n".join(formatted)
+    with span("context", chunks=len(docs)) as stage:
+        docs = pack_context(docs)
+        stage["documents"] = len(docs)
+        stage["context_tokens"] = _context_tokens(docs)
+    
+    return docs
+
+def _prompt_tokens(docs, history_text, user_question):
+    """Estimated prompt tokens, for the 'llm' stage"""
+    return _context_tokens(docs) + estimate_tokens(history_text) + estimate_tokens(user_question)
 
-def process_user_question(user_question, conversation_history=None, max_history=5):
+def _prepare_question(user_question, conversation_history, max_history, session_id, agent, source, pages):
+    """Retrieve documents and format history for a question"""
+    from .vector_store import search_similar_documents
+    
+    # Search for similar documents
+    with span("retrieval", filtered=source is not None or pages is not None) as stage:
+        docs = search_similar_documents(user_question, agent=agent, source=source, pages=pages)
+        stage["chunks"] = len(docs)
+        stage["context_tokens"] = _context_tokens(docs)
+    
+    docs = _pack_context_stage(docs)
+    history_text = _format_history_stage(conversation_history, max_history, session_id)
+    
+    return docs, history_text
+
+def process_user_question(
+    user_question,
+    conversation_history=None,
+    max_history=5,
+    session_id=DEFAULT_SESSION_ID,
+    agent=None,
+    source=None,
+    pages=None,
+    profile=False
+):
     """
     Process a user question and return the AI response with conversation context
     
@@ -37,6 +116,11 @@ def process_user_question(user_question, conversation_history=None, max_history=
         user_question (str): User's question
         conversation_history (list, optional): List of previous conversation messages from session state
         max_history (int): Number of previous exchanges to include (default: 5)
+        session_id (str): Conversation the exchange is saved under
+        agent (str, optional): Agent whose documents to answer from
+        source (str, optional): Only answer from this source file
+        pages (tuple, optional): Only answer from pages (first, last)
+        profile (bool): Run the request under cProfile (see core.metrics)
     
     Returns:
         str: AI assistant's response
@@ -44,50 +128,263 @@ def process_user_question(user_question, conversation_history=None, max_history=
     Raises:
         Exception: If vector store is not initialized or other errors occur
     """
-    # Search for similar documents
-    docs = search_similar_documents(user_question)
+    from .llm_chain import get_conversational_chain
     
-    # Format conversation history using the helper function
-    history_text = format_conversation_history(
-        conversation_history if conversation_history else [], 
-        max_messages=max_history
-    )
+    with trace("question", agent=agent, profile=profile):
+        docs, history_text = _prepare_question(
+            user_question, conversation_history, max_history, session_id, agent, source, pages
+        )
+        
+        # Get conversational chain
+        chain = get_conversational_chain()
+        
+        # Generate response with conversation history
+        with span("llm", prompt_tokens=_prompt_tokens(docs, history_text, user_question)) as stage:
+            response = chain.invoke(
+                {
+                    "input_documents": docs,
+                    "conversation_history": history_text,
+                    "question": user_question
+                },
+                return_only_outputs=True
+            )
+            
+            answer = response["output_text"]
+            stage["answer_tokens"] = estimate_tokens(answer)
+        
+        # Save conversation to database
+        with span("db_write", messages=2):
+            save_messages(
+                [("user", user_question), ("assistant", answer)],
+                session_id=session_id
+            )
+    
+    return answer
 
-    # Get conversational chain
-    chain = get_conversational_chain()
-    
-    # Generate response with conversation history
-    response = chain.invoke(
-        {
-            "input_documents": docs,
-            "conversation_history": history_text,
-            "question": user_question
-        },
-        return_only_outputs=True
-    )
+def stream_user_question(
+    user_question,
+    conversation_history=None,
+    max_history=5,
+    session_id=DEFAULT_SESSION_ID,
+    agent=None,
+    source=None,
+    pages=None,
+    profile=False
+):
+    """
+    Process a user question, yielding the AI response as it is generated
+    
+    The exchange is saved once the full answer has been streamed. Time to
+    first token is logged.
+    
+    Args:
+        user_question (str): User's question
+        conversation_history (list, optional): List of previous conversation messages from session state
+        max_history (int): Number of previous exchanges to include (default: 5)
+        session_id (str): Conversation the exchange is saved under
+        agent (str, optional): Agent whose documents to answer from
+        source (str, optional): Only answer from this source file
+        pages (tuple, optional): Only answer from pages (first, last)
+        profile (bool): Run the request under cProfile (see core.metrics)
+    
+    Yields:
+        str: Pieces of the AI assistant's response
+    
+    Raises:
+        Exception: If vector store is not initialized or other errors occur
+    """
+    from .llm_chain import stream_answer
+    
+    with trace("question", agent=agent, streamed=True, profile=profile) as request:
+        started = time.perf_counter()
+        docs, history_text = _prepare_question(
+            user_question, conversation_history, max_history, session_id, agent, source, pages
+        )
+        
+        pieces = []
+        with span("llm", prompt_tokens=_prompt_tokens(docs, history_text, user_question)) as stage:
+            for piece in stream_answer(docs, history_text, user_question):
+                if not pieces:
+                    first_token = time.perf_counter() - started
+                    request["attrs"]["first_token_seconds"] = first_token
+                    logger.info("Time to first token: %.3fs", first_token)
+                pieces.append(piece)
+                yield piece
+            
+            answer = "".join(pieces)
+            stage["answer_tokens"] = estimate_tokens(answer)
+        logger.info("Answer streamed in %.3fs", time.perf_counter() - started)
+        
+        # Save conversation to database
+        with span("db_write", messages=2):
+            save_messages(
+                [("user", user_question), ("assistant", answer)],
+                session_id=session_id
+            )
+
+async def _aprepare_question(user_question, conversation_history, max_history, session_id, agent, source, pages):
+    """Async version of _prepare_question"""
+    from .vector_store import asearch_similar_documents
+    
+    # Retrieval embeds the query, so it runs in the search thread pool
+    with span("retrieval", filtered=source is not None or pages is not None) as stage:
+        docs = await asearch_similar_documents(user_question, agent=agent, source=source, pages=pages)
+        stage["chunks"] = len(docs)
+        stage["context_tokens"] = _context_tokens(docs)
+    
+    docs = _pack_context_stage(docs)
+    history_text = _format_history_stage(conversation_history, max_history, session_id)
+    
+    return docs, history_text
+
+async def aprocess_user_question(
+    user_question,
+    conversation_history=None,
+    max_history=5,
+    session_id=DEFAULT_SESSION_ID,
+    agent=None,
+    source=None,
+    pages=None,
+    profile=False
+):
+    """
+    Async version of process_user_question
+    
+    Waiting on the LLM does not hold a thread, so one event loop can serve
+    many questions concurrently.
     
-    answer = response["output_text"]
+    Args:
+        user_question (str): User's question
+        conversation_history (list, optional): List of previous conversation messages
+        max_history (int): Number of previous exchanges to include (default: 5)
+        session_id (str): Conversation the exchange is saved under
+        agent (str, optional): Agent whose documents to answer from
+        source (str, optional): Only answer from this source file
+        pages (tuple, optional): Only answer from pages (first, last)
+        profile (bool): Run the request under cProfile (see core.metrics)
     
-    # Save conversation to database
-    save_message("user", user_question)
-    save_message("assistant", answer)
+    Returns:
+        str: AI assistant's response
+    
+    Raises:
+        Exception: If vector store is not initialized or other errors occur
+    """
+    from .llm_chain import get_conversational_chain
+    
+    with trace("question", agent=agent, profile=profile):
+        docs, history_text = await _aprepare_question(
+            user_question, conversation_history, max_history, session_id, agent, source, pages
+        )
+        
+        chain = get_conversational_chain()
+        
+        with span("llm", prompt_tokens=_prompt_tokens(docs, history_text, user_question)) as stage:
+            response = await chain.ainvoke(
+                {
+                    "input_documents": docs,
+                    "conversation_history": history_text,
+                    "question": user_question
+                },
+                return_only_outputs=True
+            )
+            
+            answer = response["output_text"]
+            stage["answer_tokens"] = estimate_tokens(answer)
+        
+        # Save conversation to database
+        with span("db_write", messages=2):
+            await asave_messages(
+                [("user", user_question), ("assistant", answer)],
+                session_id=session_id
+            )
     
     return answer
 
-def process_documents(pdf_files=None, text_input=None):
+async def astream_user_question(
+    user_question,
+    conversation_history=None,
+    max_history=5,
+    session_id=DEFAULT_SESSION_ID,
+    agent=None,
+    source=None,
+    pages=None,
+    profile=False
+):
     """
-    Process documents (PDFs and/or text) and create vector store
+    Async version of stream_user_question
+    
+    Args:
+        user_question (str): User's question
+        conversation_history (list, optional): List of previous conversation messages
+        max_history (int): Number of previous exchanges to include (default: 5)
+        session_id (str): Conversation the exchange is saved under
+        agent (str, optional): Agent whose documents to answer from
+        source (str, optional): Only answer from this source file
+        pages (tuple, optional): Only answer from pages (first, last)
+        profile (bool): Run the request under cProfile (see core.metrics)
+    
+    Yields:
+        str: Pieces of the AI assistant's response
+    """
+    from .llm_chain import astream_answer
+    
+    with trace("question", agent=agent, streamed=True, profile=profile) as request:
+        started = time.perf_counter()
+        docs, history_text = await _aprepare_question(
+            user_question, conversation_history, max_history, session_id, agent, source, pages
+        )
+        
+        pieces = []
+        with span("llm", prompt_tokens=_prompt_tokens(docs, history_text, user_question)) as stage:
+            async for piece in astream_answer(docs, history_text, user_question):
+                if not pieces:
+                    first_token = time.perf_counter() - started
+                    request["attrs"]["first_token_seconds"] = first_token
+                    logger.info("Time to first token: %.3fs", first_token)
+                pieces.append(piece)
+                yield piece
+            
+            answer = "".join(pieces)
+            stage["answer_tokens"] = estimate_tokens(answer)
+        logger.info("Answer streamed in %.3fs", time.perf_counter() - started)
+        
+        # Save conversation to database
+        with span("db_write", messages=2):
+            await asave_messages(
+                [("user", user_question), ("assistant", answer)],
+                session_id=session_id
+            )
+
+def process_documents(
+    pdf_files=None,
+    text_input=None,
+    append=True,
+    progress_callback=None,
+    agent=None
+):
+    """
+    Process documents (PDFs and/or text) and add them to the vector store
+    
+    Pages stream from the PDF loader through the chunker into fixed-size
+    embedding batches that are added to the index one at a time. Stages run
+    in their own threads connected by bounded queues, so memory stays flat
+    regardless of upload size.
     
     Args:
         pdf_files: List of PDF file objects (optional)
         text_input (str): Additional text input (optional)
+        append (bool): Add to the existing index (default) instead of replacing it
+        progress_callback (callable, optional): Called with a dict of 'pages',
+            'chunks' and 'embedded' counts as batches are indexed
+        agent (str, optional): Agent whose index the documents go to
     
     Returns:
         dict: Status information with 'success', 'warning', 'error' keys
     """
-    from .pdf_loader import extract_text_from_pdfs, validate_extracted_text
-    from .text_splitter import split_text_into_chunks
-    from .vector_store import create_vector_store
+    from .pdf_loader import iter_pdf_pages, format_skipped_warning
+    from .pipeline import threaded, batched
+    from .text_splitter import iter_text_chunks
+    from .vector_store import add_chunk_batches
     
     result = {
         "success": False,
@@ -95,34 +392,51 @@ def process_documents(pdf_files=None, text_input=None):
         "error": None
     }
     
-    raw_text = ""
+    skipped_files = []
+    progress = {"pages": 0, "chunks": 0, "embedded": 0}
     
-    # Process PDFs
-    if pdf_files:
-        pdf_text, skipped_files = extract_text_from_pdfs(pdf_files)
-        validation = validate_extracted_text(pdf_text, skipped_files)
-        
-        if validation["warning"]:
-            result["warning"] = validation["warning"]
-        
-        if validation["error"] and not text_input:
-            result["error"] = validation["error"]
-            return result
+    def pages():
+        # Process PDFs
+        if pdf_files:
+            for page in timed("pdf_extract", iter_pdf_pages(pdf_files, skipped_files)):
+                progress["pages"] += 1
+                yield page
         
-        raw_text += pdf_text
+        # Add text input; typed text has no pages
+        if text_input and text_input.strip():
+            yield TEXT_INPUT_SOURCE, None, text_input
     
-    # Add text input
-    if text_input:
-        raw_text += "\n" + text_input
+    def chunk_batches():
+        # Time waiting on extraction is its own stage, not chunking time
+        pages_ready = timed("chunk_input_wait", threaded(pages(), PIPELINE_QUEUE_SIZE))
+        chunks = timed("chunking", iter_text_chunks(pages_ready))
+        for batch in batched(threaded(chunks, PIPELINE_QUEUE_SIZE), EMBEDDING_BATCH_SIZE):
+            progress["chunks"] += len(batch)
+            yield batch
     
-    # Validate we have some text
-    if not raw_text.strip():
-        result["error"] = "Please provide either PDF files or text input."
-        return result
+    def on_batch(stats):
+        progress["embedded"] = stats["added"]
+        if progress_callback:
+            progress_callback(dict(progress))
+    
+    with trace("ingest", agent=agent, append=append) as request:
+        add_chunk_batches(
+            chunk_batches(),
+            replace=not append,
+            progress_callback=on_batch,
+            agent=agent
+        )
+        request["attrs"].update(progress)
     
-    # Create chunks and vector store
-    text_chunks = split_text_into_chunks(raw_text)
-    create_vector_store(text_chunks)
+    result["warning"] = format_skipped_warning(skipped_files)
+    
+    # Validate we had some text
+    if not progress["chunks"]:
+        if pdf_files and not text_input:
+            result["error"] = "No readable text found in the uploaded PDFs."
+        else:
+            result["error"] = "Please provide either PDF files or text input."
+        return result
     
     result["success"] = True
     return result
\ No newline at end of file
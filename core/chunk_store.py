@@ -0,0 +1,395 @@
+"""
+Memory-mapped chunk text and metadata of an index snapshot
+"""
+import json
+import os
+import numpy as np
+
+# Files inside the index directory
+CHUNKS_FILE = "chunks.jsonl"           # One JSON record per chunk, in position order
+CHUNK_OFFSETS_FILE = "chunks.offsets"  # int64 byte offset of each record, plus the end
+CHUNK_IDS_FILE = "chunks.ids"          # Chunk ID (content hash) of each position
+CHUNK_PAGES_FILE = "chunks.pages"      # Page number of each position, NO_PAGE if unknown
+CHUNK_COUNT_FILE = "chunks.count"      # Number of committed chunks; the files may hold more
+COMMIT_FILE = "commit.json"            # Steps of a commit in progress (see commit_files)
+
+_ID_DTYPE = "S64"
+_PAGE_DTYPE = np.int32
+
+# Stored page number of chunks without one
+NO_PAGE = -1
+
+def encode_record(text, metadata):
+    """Encode a chunk as one line of the chunks file"""
+    record = json.dumps({"text": text, "metadata": metadata}, ensure_ascii=False)
+    return (record + "\n").encode("utf-8")
+
+def _page_number(metadata):
+    page = metadata.get("page")
+    return NO_PAGE if page is None else page
+
+def map_array(path, dtype, length=None):
+    """
+    Memory-map a flat array file read-only (mmap cannot map empty files)
+    
+    Args:
+        path (str): Array file
+        dtype: Item type
+        length (int, optional): Map only the first length items; by default
+            the whole file
+    """
+    if length is None:
+        length = os.path.getsize(path) // np.dtype(dtype).itemsize
+    if length == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(length,))
+
+def append_array(path, length, array):
+    """
+    Append items to a flat array file after its first length items
+    
+    Anything past them (left by a writer that never committed) is dropped
+    first. Readers only map committed items, so they are not disturbed.
+    """
+    with open(path, "r+b") as f:
+        f.truncate(length * array.dtype.itemsize)
+        f.seek(0, os.SEEK_END)
+        array.tofile(f)
+
+def read_counts(path, name):
+    """Read a count file (see write_counts), or None if there is none"""
+    try:
+        with open(os.path.join(path, name)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def write_counts(path, name, counts):
+    """
+    Atomically write the committed sizes of a set of append-only files
+    
+    Writers append to the files first and replace the count file last, so
+    readers never see records an interrupted writer left half written.
+    """
+    count_path = os.path.join(path, name)
+    tmp_path = count_path + ".tmp"
+    
+    with open(tmp_path, "w") as f:
+        json.dump(counts, f)
+    
+    os.replace(tmp_path, count_path)
+
+def commit_files(path, steps):
+    """
+    Publish the files staged for a snapshot, as one atomic commit
+    
+    The steps are recorded in COMMIT_FILE before any is carried out, so a
+    writer stopped midway is finished by replay_commit() on the next open,
+    and a writer stopped before that leaves the previous snapshot intact.
+    
+    Args:
+        path (str): Index directory
+        steps (list): ("replace", name) moves the staged name + ".tmp" over
+            name; ("remove", name) deletes name. Carried out in order.
+    """
+    write_counts(path, COMMIT_FILE, [list(step) for step in steps])
+    replay_commit(path)
+
+def replay_commit(path):
+    """
+    Carry out the steps of a recorded commit that has not finished
+    
+    Every step can be repeated: a staged file already moved into place, or
+    a file already deleted, is skipped.
+    
+    Returns:
+        bool: Whether there was a commit to finish
+    """
+    steps = read_counts(path, COMMIT_FILE)
+    if steps is None:
+        return False
+    
+    for action, name in steps:
+        target = os.path.join(path, name)
+        try:
+            if action == "replace":
+                os.replace(target + ".tmp", target)
+            else:
+                os.remove(target)
+        except FileNotFoundError:
+            pass
+    
+    try:
+        os.remove(os.path.join(path, COMMIT_FILE))
+    except FileNotFoundError:
+        pass
+    return True
+
+def stage_counts(path, name, counts):
+    """Write a count file next to its current one, for commit_files to publish"""
+    with open(os.path.join(path, name + ".tmp"), "w") as f:
+        json.dump(counts, f)
+    return ("replace", name)
+
+def committed_chunks(path):
+    """Number of chunks committed to the chunk files of a directory"""
+    counts = read_counts(path, CHUNK_COUNT_FILE)
+    if counts is not None:
+        return counts["chunks"]
+    # Written before appends existed: the files hold exactly the committed chunks
+    return os.path.getsize(os.path.join(path, CHUNK_IDS_FILE)) // np.dtype(_ID_DTYPE).itemsize
+
+class ChunkStore:
+    """
+    The chunks at each position of a FAISS index, read only when asked for
+    
+    Opening a store maps its files without reading them, so opening costs
+    the same for any corpus size and only the pages of returned chunks
+    become resident. Only the committed chunks are mapped, when the store
+    is opened, so it keeps reading the same snapshot after a writer appends
+    to or replaces the files.
+    
+    Args:
+        path (str): Index directory
+        limit (int, optional): Map at most this many chunks: those paired
+            with the vectors of the FAISS index opened with them
+    """
+    
+    def __init__(self, path, limit=None):
+        self.path = path
+        count = committed_chunks(path)
+        if limit is not None:
+            count = min(count, limit)
+        self._ids = map_array(os.path.join(path, CHUNK_IDS_FILE), _ID_DTYPE, count)
+        self._offsets = map_array(os.path.join(path, CHUNK_OFFSETS_FILE), np.int64, count + 1)
+        self._blob = map_array(os.path.join(path, CHUNKS_FILE), np.uint8, int(self._offsets[-1]))
+        pages_path = os.path.join(path, CHUNK_PAGES_FILE)
+        # Older snapshots have no pages file; theirs are read on first use
+        self._pages = map_array(pages_path, _PAGE_DTYPE, count) if os.path.exists(pages_path) else None
+        self._positions = None  # ID -> position, built on first lookup by ID
+    
+    @staticmethod
+    def exists(path):
+        """Whether a chunk store has been written to a directory"""
+        return os.path.exists(os.path.join(path, CHUNK_IDS_FILE))
+    
+    def __len__(self):
+        return len(self._ids)
+    
+    def __contains__(self, chunk_id):
+        return self.position_of(chunk_id) is not None
+    
+    def id_at(self, position):
+        """Get the chunk ID at a position"""
+        return self._ids[position].decode("ascii")
+    
+    def ids(self):
+        """Get every chunk ID, in position order"""
+        return [chunk_id.decode("ascii") for chunk_id in self._ids]
+    
+    def position_of(self, chunk_id):
+        """
+        Get the position of a chunk ID
+        
+        The lookup table is built on the first call, so stores only searched
+        by vector never pay for it.
+        
+        Returns:
+            int: Position, or None if the chunk is not in the store
+        """
+        if self._positions is None:
+            self._positions = {chunk_id: i for i, chunk_id in enumerate(self.ids())}
+        position = self._positions.get(chunk_id)
+        # The table may be shared with stores appended to this one since
+        return position if position is not None and position < len(self) else None
+    
+    def share_positions(self, base):
+        """
+        Take over the lookup table of the store this one was appended to
+        
+        Only the appended IDs are added to it, so a writer appending to
+        each new snapshot in turn does not decode every ID again. The base
+        keeps using the table: positions past its own are ignored.
+        
+        Args:
+            base (ChunkStore): Store whose committed chunks this one starts with
+        """
+        if base._positions is None or len(base) > len(self):
+            return
+        
+        for position in range(len(base), len(self)):
+            base._positions.setdefault(self.id_at(position), position)
+        self._positions = base._positions
+    
+    def pages(self):
+        """
+        Get the page number of every position, NO_PAGE where unknown
+        
+        Snapshots written before page numbers were stored have no pages
+        file; their pages are read from the chunk records once instead.
+        
+        Returns:
+            np.ndarray: int32 page numbers, in position order
+        """
+        if self._pages is None:
+            self._pages = np.array(
+                [_page_number(json.loads(self.record(i))["metadata"]) for i in range(len(self))],
+                dtype=_PAGE_DTYPE
+            )
+        return self._pages
+    
+    def record(self, position):
+        """Get the encoded record at a position"""
+        return bytes(self._blob[self._offsets[position]:self._offsets[position + 1]])
+    
+    def get(self, position):
+        """
+        Read the chunk at a position
+        
+        Returns:
+            Document: Chunk text and metadata
+        """
+        from langchain_core.documents import Document
+        
+        record = json.loads(self.record(position))
+        return Document(page_content=record["text"], metadata=record["metadata"])
+
+class ChunkWriter:
+    """
+    Writes the chunk files of a new snapshot
+    
+    The new snapshot holds the records of a base store first (minus skipped
+    positions), so positions line up with a FAISS index that appends new
+    vectors and compacts removed ones. When nothing is skipped and the base
+    is the store committed in the directory, new records are appended to
+    its files and only they are written; otherwise the snapshot is written
+    to temporary files next to the current ones. Records are streamed to
+    disk as they are added. Readers do not see them until the staged files
+    are committed (see stage()).
+    """
+    
+    def __init__(self, path, base=None, skip=()):
+        self.path = path
+        self.base = base
+        self.skip = set(skip)
+        
+        self._blob = None
+        self._appending = False
+        self._offsets = [0]
+        self._ids = []
+        self._pages = []
+        self._staged = False
+    
+    def _file(self, name):
+        return os.path.join(self.path, name)
+    
+    def _tmp(self, name):
+        return self._file(name + ".tmp")
+    
+    def _can_append(self):
+        """Whether the base store's own files can be appended to"""
+        return (
+            self.base is not None
+            and not self.skip
+            and self.base.path == self.path
+            and os.path.exists(self._file(CHUNK_PAGES_FILE))
+            and committed_chunks(self.path) == len(self.base)
+        )
+    
+    def _open(self):
+        """Open the chunk file to write to, copying the base store over if needed"""
+        if self._blob is not None:
+            return
+        
+        if self._can_append():
+            self._appending = True
+            size = int(self.base._offsets[-1])
+            self._blob = open(self._file(CHUNKS_FILE), "r+b")
+            # Drop records an interrupted writer appended but never committed
+            self._blob.truncate(size)
+            self._blob.seek(size)
+            self._offsets = [size]
+            return
+        
+        self._blob = open(self._tmp(CHUNKS_FILE), "wb")
+        if self.base is None:
+            return
+        
+        if not self.skip:
+            # Nothing removed: copy the files wholesale
+            self._blob.write(self.base._blob)
+            self._offsets.extend(int(offset) for offset in self.base._offsets[1:])
+            self._ids = self.base.ids()
+            self._pages = self.base.pages().tolist()
+            return
+        
+        base_pages = self.base.pages()
+        for position in range(len(self.base)):
+            if position not in self.skip:
+                self._write(self.base.id_at(position), self.base.record(position), int(base_pages[position]))
+    
+    def _write(self, chunk_id, record, page):
+        self._blob.write(record)
+        self._offsets.append(self._offsets[-1] + len(record))
+        self._ids.append(chunk_id)
+        self._pages.append(page)
+    
+    def add(self, chunk_id, text, metadata):
+        """Append a chunk at the next position"""
+        self._open()
+        self._write(chunk_id, encode_record(text, metadata), _page_number(metadata))
+    
+    def stage(self):
+        """
+        Write everything but the commit itself
+        
+        Returns:
+            list: Steps that publish the staged files (see commit_files)
+        """
+        self._open()
+        self._blob.close()
+        self._staged = True
+        
+        offsets = np.array(self._offsets, dtype=np.int64)
+        ids = np.array(self._ids, dtype=_ID_DTYPE)
+        pages = np.array(self._pages, dtype=_PAGE_DTYPE)
+        
+        if self._appending:
+            # Past the committed count, so invisible until the count moves
+            count = len(self.base)
+            append_array(self._file(CHUNK_OFFSETS_FILE), count + 1, offsets[1:])
+            append_array(self._file(CHUNK_IDS_FILE), count, ids)
+            append_array(self._file(CHUNK_PAGES_FILE), count, pages)
+            return [stage_counts(self.path, CHUNK_COUNT_FILE, {"chunks": count + len(ids)})]
+        
+        offsets.tofile(self._tmp(CHUNK_OFFSETS_FILE))
+        ids.tofile(self._tmp(CHUNK_IDS_FILE))
+        pages.tofile(self._tmp(CHUNK_PAGES_FILE))
+        
+        # Without a count file readers take the files whole while they are
+        # replaced; the IDs file marks a complete store (see exists()), so
+        # it goes last
+        names = (CHUNKS_FILE, CHUNK_OFFSETS_FILE, CHUNK_PAGES_FILE, CHUNK_IDS_FILE)
+        steps = [("remove", CHUNK_COUNT_FILE)] + [("replace", name) for name in names]
+        steps.append(stage_counts(self.path, CHUNK_COUNT_FILE, {"chunks": len(ids)}))
+        return steps
+    
+    def commit(self):
+        """Make the written chunks the committed ones, atomically"""
+        commit_files(self.path, self.stage())
+    
+    def close(self):
+        """Discard the written records if they were not staged for a commit"""
+        if self._blob is None or self._staged:
+            return
+        
+        self._blob.close()
+        if self._appending:
+            # Past the committed count, so ignored until the next writer drops them
+            return
+        
+        for name in (CHUNKS_FILE, CHUNK_OFFSETS_FILE, CHUNK_PAGES_FILE, CHUNK_IDS_FILE):
+            try:
+                os.remove(self._tmp(name))
+            except FileNotFoundError:
+                pass
\ No newline at end of file
@@ -2,10 +2,9 @@
 Configuration and environment validation
 """
 import os
-from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
+# The .env file is read on first use of a setting from the environment
+_env_loaded = False
 
 # Constants
 CHUNK_SIZE = 1000
@@ -16,18 +15,127 @@ LLM_TEMPERATURE = 0.6
 FAISS_INDEX_PATH = "storage/faiss_index"
 DATABASE_PATH = "storage/chat_history.db"
 
+# Per-agent indexes
+AGENT_INDEX_ROOT = "storage/agents"           # One index directory per agent under here
+VECTOR_STORE_POOL_MAX_STORES = 64             # Opened indexes kept in memory at once
+VECTOR_STORE_POOL_MAX_BYTES = 2 * 1024 ** 3   # Memory cap for opened indexes; LRU evicted beyond it
+
+# FAISS index settings
+FAISS_INDEX_TYPE = "auto"            # "flat", "ivf", "hnsw" or "auto" (by corpus size)
+ANN_AUTO_HNSW_MIN_VECTORS = 50_000   # "auto" switches from flat to HNSW here
+ANN_AUTO_IVF_MIN_VECTORS = 1_000_000 # ... and from HNSW to IVF here
+IVF_NLIST = None                     # IVF lists; None for about 4 * sqrt(n)
+IVF_NPROBE = 16                      # IVF lists scanned per query
+HNSW_M = 32                          # HNSW graph neighbours per node
+HNSW_EF_CONSTRUCTION = 200           # HNSW build-time search width
+HNSW_EF_SEARCH = 64                  # HNSW query-time search width
+VECTOR_QUANTIZATION = None           # None, "sq8" (4x smaller) or "pq" (PQ_M bytes per vector)
+PQ_M = 96                            # PQ sub-quantizers; must divide the embedding dimension
+RERANK_CANDIDATES = 4                # Re-score k * this many quantized hits at full precision; 0 disables
+
+# PDF extraction settings
+PDF_EXTRACT_WORKERS = min(os.cpu_count() or 1, 8)  # Processes used to extract pages
+PDF_PAGES_PER_TASK = 16      # Pages handed to a worker at a time
+PDF_PARALLEL_MIN_PAGES = 32  # Smaller uploads are extracted by one process
+PDF_FILE_TIMEOUT = 120       # Seconds before a single PDF is skipped
+
+# Embedding backend settings
+EMBEDDING_BACKEND = "sentence_transformers"  # Tuned CPU encoder, or "huggingface" (langchain defaults)
+EMBEDDING_MODEL_BATCH_SIZE = 32  # Texts per forward pass
+EMBEDDING_TORCH_THREADS = None   # Intra-op threads for torch, process-wide; None keeps its default (all cores)
+EMBEDDING_QUANTIZE_INT8 = False  # Dynamic int8 quantization of the model's Linear layers
+EMBEDDING_SORT_BY_LENGTH = True  # Batch texts of similar length to cut padding
+EMBEDDING_DRIFT_MAX = 0.01       # Largest 1 - cosine allowed against HuggingFaceEmbeddings
+
+# Embedding cache settings
+EMBEDDING_CACHE_ENABLED = True
+EMBEDDING_CACHE_PATH = "storage/embedding_cache"
+EMBEDDING_CACHE_MAX_ENTRIES = 100_000  # ~150 MB of MiniLM vectors on disk
+
+# Retrieval settings
+RETRIEVAL_MODE = "hybrid"  # "dense" (FAISS only) or "hybrid" (FAISS + BM25)
+HYBRID_CANDIDATES = 20     # Results taken from each retriever before fusion
+RRF_K = 60                 # Reciprocal rank fusion damping constant
+
+# Filtered search settings (by source file / page range)
+FILTER_EXACT_MAX_CHUNKS = 2048  # Filters matching at most this many chunks are searched exactly
+FILTER_EXACT_MAX_SHARE = 0.01   # ... or at most this share of the index
+FILTER_CACHE_SIZE = 64          # Filters whose chunk positions are kept per open index
+
+# Context assembly settings (between retrieval and the LLM)
+CONTEXT_PACKING_ENABLED = True     # Merge, dedupe and budget retrieved chunks before prompting
+CONTEXT_TOKEN_BUDGET = 1500        # Prompt tokens for the retrieved documents
+CONTEXT_DUPLICATE_THRESHOLD = 0.8  # Share of a chunk's shingles found in a better one to drop it
+CONTEXT_SHINGLE_WORDS = 5          # Words per shingle for near-duplicate detection
+
+# Retrieval cache settings
+QUERY_EMBEDDING_CACHE_SIZE = 1024  # Distinct queries whose embedding is kept
+SEARCH_RESULTS_CACHE_SIZE = 256    # (query, k, index version) results kept
+SEARCH_WORKER_THREADS = 4          # Threads running searches for async callers
+
+# Query embedding batching (used by the HTTP server)
+QUERY_BATCHING_ENABLED = False     # Embed concurrent queries in one model call
+QUERY_BATCH_MAX_SIZE = 32          # Queries embedded per call at most
+QUERY_BATCH_MAX_WAIT_MS = 5        # How long the first query waits for company
+
+# HTTP server settings
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8000
+SERVER_MAX_BODY_BYTES = 200 * 1024 ** 2  # Largest accepted request (ingest uploads)
+
+# Ingestion pipeline settings
+EMBEDDING_BATCH_SIZE = 64   # Chunks embedded and added to the index at a time
+PIPELINE_QUEUE_SIZE = 64    # Items buffered between pipeline stages
+
+# Message storage settings
+DB_WRITE_BEHIND = False    # Persist messages from a background thread (opt-in)
+DB_WRITE_BATCH_SIZE = 64   # Queued saves written per transaction
+DB_WRITE_RETRIES = 3       # Attempts per queued save before it is dropped
+DB_WRITE_RETRY_DELAY = 0.1 # Seconds before the first retry, doubled after each
+DEFAULT_SESSION_ID = "default"  # Session of messages saved without one
+HISTORY_PAGE_SIZE = 500    # Messages read per query when loading full history
+
+# Background ingestion jobs
+JOB_WORKERS = 1               # Ingestion jobs run at the same time
+JOB_SPOOL_PATH = "storage/jobs"  # Uploads are kept here until their job finishes
+JOB_PROGRESS_INTERVAL = 0.5   # Seconds between progress writes of a running job
+JOB_POLL_INTERVAL = 1         # Seconds between UI refreshes of running jobs
+
 # Conversation memory settings
 DEFAULT_MAX_HISTORY = 5  # Default number of conversation exchanges to remember
 MAX_HISTORY_LIMIT = 20   # Maximum allowed conversation history
+HISTORY_TOKEN_BUDGET = 1500       # Prompt tokens for summary + recent messages
+HISTORY_SUMMARY_MAX_TOKENS = 300  # Share of the budget kept for the summary
+HISTORY_SUMMARY_CACHE_SIZE = 1024 # Sessions whose rolling summary is kept
+CHARS_PER_TOKEN = 4               # Used to estimate token counts
+
+# Instrumentation settings
+METRICS_ENABLED = True                # Time pipeline stages into histograms
+METRICS_LOG_PATH = None               # Append one JSON line per request here (or $METRICS_LOG_PATH)
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)  # Seconds
+METRICS_RECENT_TRACES = 50            # Request breakdowns kept for the debug panel
+PROFILE_TOP_FUNCTIONS = 30            # Functions listed in a profiled request's report
+IMPORT_TIME_BUDGET = 0.5              # Seconds an entry point's core imports may take (python -m core.startup --check)
+
+def load_env():
+    """Load the .env file into the environment, once per process"""
+    global _env_loaded
+    
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
 
 def validate_env():
     """
     Validate that required environment variables are set.
     Raises an exception if validation fails.
     """
+    load_env()
     if not os.getenv("GROQ_API_KEY"):
         raise ValueError("GROQ_API_KEY not found. Please set it in your .env file.")
     
 def get_groq_api_key():
     """Get GROQ API key from environment"""
+    load_env()
     return os.getenv("GROQ_API_KEY")
\ No newline at end of file
@@ -0,0 +1,158 @@
+"""
+Assembly of retrieved chunks into the context sent to the LLM
+"""
+import re
+from .config import (
+    CONTEXT_TOKEN_BUDGET,
+    CONTEXT_DUPLICATE_THRESHOLD,
+    CONTEXT_SHINGLE_WORDS
+)
+from .tokens import estimate_tokens, truncate_to_tokens
+
+# Consecutive chunks of a page are either overlapping or separated only by
+# the whitespace the chunker trimmed; other chunks are far further apart
+_MAX_WHITESPACE_GAP = 8
+
+_WORD = re.compile(r"\w+")
+
+def _has_offsets(doc):
+    metadata = doc.metadata
+    return metadata.get("page") is not None and "start" in metadata and "end" in metadata
+
+def _merge_adjacent(docs):
+    """
+    Merge overlapping and adjacent chunks of the same page
+    
+    Args:
+        docs (list): Documents, best first
+    
+    Returns:
+        list: (rank, Document) pairs, where rank is that of the best chunk
+            merged into the document
+    """
+    from langchain_core.documents import Document
+    
+    merged = []
+    groups = {}
+    for rank, doc in enumerate(docs):
+        if _has_offsets(doc):
+            key = (doc.metadata.get("source"), doc.metadata["page"])
+            groups.setdefault(key, []).append((rank, doc))
+        else:
+            merged.append((rank, doc))
+    
+    for group in groups.values():
+        group.sort(key=lambda item: item[1].metadata["start"])
+        
+        runs = []
+        for rank, doc in group:
+            start, end = doc.metadata["start"], doc.metadata["end"]
+            if runs and start <= runs[-1]["end"] + _MAX_WHITESPACE_GAP:
+                run = runs[-1]
+                if end > run["end"]:
+                    if start >= run["end"]:
+                        run["parts"].append(" ")
+                        run["parts"].append(doc.page_content)
+                    else:
+                        # Both chunks are slices of the same page text
+                        run["parts"].append(doc.page_content[run["end"] - start:])
+                    run["end"] = end
+                run["rank"] = min(run["rank"], rank)
+                run["chunks"] += 1
+            else:
+                runs.append({
+                    "rank": rank,
+                    "doc": doc,
+                    "parts": [doc.page_content],
+                    "end": end,
+                    "chunks": 1
+                })
+        
+        for run in runs:
+            doc = run["doc"]
+            if run["chunks"] == 1:
+                merged.append((run["rank"], doc))
+                continue
+            
+            metadata = {key: value for key, value in doc.metadata.items() if key != "hash"}
+            metadata["end"] = run["end"]
+            metadata["chunks"] = run["chunks"]
+            merged.append((run["rank"], Document(page_content="".join(run["parts"]), metadata=metadata)))
+    
+    merged.sort(key=lambda item: item[0])
+    return merged
+
+def _shingles(text):
+    """Word n-grams of a text, for near-duplicate detection"""
+    words = _WORD.findall(text.lower())
+    if len(words) <= CONTEXT_SHINGLE_WORDS:
+        return {tuple(words)} if words else set()
+    return {
+        tuple(words[i:i + CONTEXT_SHINGLE_WORDS])
+        for i in range(len(words) - CONTEXT_SHINGLE_WORDS + 1)
+    }
+
+def _drop_near_duplicates(docs, threshold):
+    """
+    Drop documents whose text is mostly contained in a better one
+    
+    Catches the same passage indexed from two files, or extracted with
+    slightly different whitespace, which content hashes do not.
+    """
+    kept = []
+    kept_shingles = []
+    for doc in docs:
+        shingles = _shingles(doc.page_content)
+        duplicate = shingles and any(
+            len(shingles & other) >= threshold * len(shingles)
+            for other in kept_shingles
+        )
+        if not duplicate:
+            kept.append(doc)
+            kept_shingles.append(shingles)
+    return kept
+
+def pack_context(docs, token_budget=CONTEXT_TOKEN_BUDGET, duplicate_threshold=CONTEXT_DUPLICATE_THRESHOLD):
+    """
+    Turn retrieved chunks into the documents sent to the LLM
+    
+    Overlapping and adjacent chunks of the same page are merged, so text
+    the chunker repeated in both is sent once. Chunks that mostly repeat a
+    better ranked one are dropped. What is left is kept in rank order
+    while it fits the token budget; the best document is truncated if it
+    does not fit on its own.
+    
+    Args:
+        docs (list): Retrieved documents, best first
+        token_budget (int): Token budget for all documents together
+        duplicate_threshold (float): Share of a document's word shingles
+            found in a better document that makes it a duplicate
+    
+    Returns:
+        list: Documents to send, best first
+    """
+    from langchain_core.documents import Document
+    
+    candidates = _drop_near_duplicates(
+        [doc for _, doc in _merge_adjacent(docs)],
+        duplicate_threshold
+    )
+    
+    packed = []
+    used = 0
+    for doc in candidates:
+        cost = estimate_tokens(doc.page_content)
+        if used + cost > token_budget:
+            # Always keep (part of) the best document
+            if not packed:
+                packed.append(Document(
+                    page_content=truncate_to_tokens(doc.page_content, token_budget),
+                    metadata=doc.metadata
+                ))
+                used = token_budget
+            continue
+        
+        packed.append(doc)
+        used += cost
+    
+    return packed
\ No newline at end of file
@@ -1,81 +1,359 @@
 """
 Database connection and message storage
 """
+import asyncio
+import atexit
+import logging
+import queue
 import sqlite3
 import os
-from .config import DATABASE_PATH
+import threading
+import time
+from .config import (
+    DATABASE_PATH,
+    DB_WRITE_BEHIND,
+    DB_WRITE_BATCH_SIZE,
+    DB_WRITE_RETRIES,
+    DB_WRITE_RETRY_DELAY,
+    DEFAULT_SESSION_ID,
+    HISTORY_PAGE_SIZE
+)
+
+# Bumped whenever _migrate_database learns a new step
+SCHEMA_VERSION = 1
+
+logger = logging.getLogger(__name__)
+
+# One connection per thread, reused for every query on that thread
+_local = threading.local()
+
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+# Messages waiting to be written by the write-behind thread
+_write_queue = queue.Queue()
+_writer_lock = threading.Lock()
+_writer_thread = None
 
 def get_db_connection():
-    """Create and return a database connection"""
-    # Ensure storage directory exists
-    os.makedirs(os.path.dirname(DATABASE_PATH), exist_ok=True)
+    """
+    Get this thread's database connection, opening it on first use
+    
+    The connection is shared by every call on the thread and must not be
+    closed by callers.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        _ensure_schema()
+        
+        conn = sqlite3.connect(DATABASE_PATH)
+        # WAL is persisted in the file; synchronous is per connection.
+        # NORMAL only fsyncs at checkpoints, which is safe under WAL.
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _local.conn = conn
     
-    conn = sqlite3.connect(DATABASE_PATH)
-    _initialize_database(conn)
     return conn
 
+def _ensure_schema():
+    """Create the storage directory, schema and WAL journal once per process"""
+    global _schema_ready
+    
+    with _schema_lock:
+        if _schema_ready:
+            return
+        
+        # Ensure storage directory exists
+        os.makedirs(os.path.dirname(DATABASE_PATH), exist_ok=True)
+        
+        conn = sqlite3.connect(DATABASE_PATH)
+        conn.execute("PRAGMA journal_mode=WAL")
+        _initialize_database(conn)
+        _migrate_database(conn)
+        conn.close()
+        
+        _schema_ready = True
+
 def _initialize_database(conn):
-    """Create messages table if it doesn't exist"""
+    """Create messages, sessions and jobs tables if they don't exist"""
     cursor = conn.cursor()
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS messages (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL DEFAULT 'default',
             role TEXT NOT NULL,
             content TEXT NOT NULL,
             timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
         )
     """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            agent TEXT,
+            status TEXT NOT NULL,
+            progress TEXT NOT NULL DEFAULT '{}',
+            result TEXT,
+            error TEXT,
+            worker TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
     conn.commit()
 
-def save_message(role, content):
+def _migrate_database(conn):
+    """
+    Bring an existing database up to SCHEMA_VERSION
+    
+    Version 1 adds the session_id column (existing messages go to the
+    default session) and the (session_id, id) index used by history reads.
+    """
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return
+    
+    with conn:
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(messages)")]
+        if "session_id" not in columns:
+            # A fixed literal, as in the CREATE TABLE: DDL cannot take
+            # bound parameters, so no configured value is spliced into it
+            conn.execute(
+                "ALTER TABLE messages ADD COLUMN session_id TEXT NOT NULL DEFAULT 'default'"
+            )
+            if DEFAULT_SESSION_ID != "default":
+                conn.execute(
+                    "UPDATE messages SET session_id = ? WHERE session_id = 'default'",
+                    (DEFAULT_SESSION_ID,)
+                )
+        
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_messages_session_id
+            ON messages (session_id, id)
+        """)
+        conn.execute(
+            "INSERT OR IGNORE INTO sessions (id) SELECT DISTINCT session_id FROM messages"
+        )
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+def _insert_messages(session_id, messages):
+    """Insert (role, content) pairs of one session in a single transaction"""
+    _insert_batch([(session_id, messages)])
+
+def _insert_batch(batch):
+    """Insert several queued (session_id, messages) saves in one transaction"""
+    conn = get_db_connection()
+    
+    with conn:
+        for session_id, messages in batch:
+            conn.execute(
+                "INSERT OR IGNORE INTO sessions (id) VALUES (?)",
+                (session_id,)
+            )
+            conn.executemany(
+                "INSERT INTO messages (session_id, role, content) VALUES (?, ?, ?)",
+                [(session_id, role, content) for role, content in messages]
+            )
+
+def _insert_with_retry(session_id, messages):
+    """Insert one queued save, retrying transient errors such as a locked database"""
+    for attempt in range(DB_WRITE_RETRIES):
+        try:
+            _insert_messages(session_id, messages)
+            return
+        except sqlite3.Error:
+            if attempt == DB_WRITE_RETRIES - 1:
+                # Keep the writer alive; losing one save beats blocking every flush
+                logger.exception(
+                    "Dropped %d queued message(s) of session %s", len(messages), session_id
+                )
+                return
+            time.sleep(DB_WRITE_RETRY_DELAY * 2 ** attempt)
+
+def _write_batch(batch):
+    """Write queued (session_id, messages) saves, falling back to one by one"""
+    try:
+        _insert_batch(batch)
+    except sqlite3.Error:
+        # The transaction rolled back as a whole: write each save on its
+        # own so one failing save does not take the others with it
+        logger.warning("Batched write of %d save(s) failed, retrying one by one", len(batch))
+        for session_id, messages in batch:
+            _insert_with_retry(session_id, messages)
+
+def _write_behind_worker():
+    """Drain the write queue, inserting queued messages in batches"""
+    while True:
+        batch = [_write_queue.get()]
+        while len(batch) < DB_WRITE_BATCH_SIZE:
+            try:
+                batch.append(_write_queue.get_nowait())
+            except queue.Empty:
+                break
+        
+        try:
+            _write_batch(batch)
+        finally:
+            for _ in batch:
+                _write_queue.task_done()
+
+def _start_writer():
+    """Start the write-behind thread if it is not running"""
+    global _writer_thread
+    
+    with _writer_lock:
+        if _writer_thread is None:
+            _writer_thread = threading.Thread(
+                target=_write_behind_worker,
+                name="message-writer",
+                daemon=True
+            )
+            _writer_thread.start()
+            atexit.register(flush_messages)
+
+def save_messages(messages, session_id=DEFAULT_SESSION_ID, background=DB_WRITE_BEHIND):
+    """
+    Save several messages at once
+    
+    Args:
+        messages (list): (role, content) pairs, in order
+        session_id (str): Conversation the messages belong to
+        background (bool): Queue the write for the write-behind thread
+            instead of waiting for it
+    """
+    if background:
+        _start_writer()
+        _write_queue.put((session_id, list(messages)))
+    else:
+        _insert_messages(session_id, messages)
+
+def save_message(role, content, session_id=DEFAULT_SESSION_ID, background=DB_WRITE_BEHIND):
     """
     Save a message to the database
     
     Args:
         role (str): 'user' or 'assistant'
         content (str): message content
+        session_id (str): Conversation the message belongs to
+        background (bool): Queue the write for the write-behind thread
+            instead of waiting for it
     """
+    save_messages([(role, content)], session_id=session_id, background=background)
+
+def flush_messages():
+    """Wait until every queued message has been written"""
+    if _writer_thread is not None:
+        _write_queue.join()
+
+async def asave_message(role, content, session_id=DEFAULT_SESSION_ID):
+    """
+    Save a message to the database without blocking the event loop
+    
+    Args:
+        role (str): 'user' or 'assistant'
+        content (str): message content
+        session_id (str): Conversation the message belongs to
+    """
+    await asave_messages([(role, content)], session_id=session_id)
+
+async def asave_messages(messages, session_id=DEFAULT_SESSION_ID):
+    """
+    Save several messages at once without blocking the event loop
+    
+    Args:
+        messages (list): (role, content) pairs, in order
+        session_id (str): Conversation the messages belong to
+    """
+    if DB_WRITE_BEHIND:
+        # Only a queue put, no need for a thread
+        save_messages(messages, session_id=session_id, background=True)
+    else:
+        await asyncio.to_thread(save_messages, messages, session_id, False)
+
+def get_history_page(session_id=DEFAULT_SESSION_ID, page_size=50, before_id=None):
+    """
+    Retrieve one page of a conversation, newest page first
+    
+    Pages are found through the (session_id, id) index with a keyset
+    (id < before_id) rather than OFFSET, so every page costs the same
+    however long the conversation is.
+    
+    Args:
+        session_id (str): Conversation to read
+        page_size (int): Maximum number of messages to return
+        before_id (int, optional): Only return messages older than this ID
+    
+    Returns:
+        dict: 'messages' in chronological order and 'next_before_id' to
+            pass for the previous page (None when there is no more history)
+    """
+    # Make sure queued writes are visible
+    flush_messages()
+    
     conn = get_db_connection()
-    cursor = conn.cursor()
     
-    cursor.execute(
-        "INSERT INTO messages (role, content) VALUES (?, ?)",
-        (role, content)
-    )
+    query = "SELECT id, role, content, timestamp FROM messages WHERE session_id = ?"
+    params = [session_id]
+    if before_id is not None:
+        query += " AND id < ?"
+        params.append(before_id)
+    query += " ORDER BY id DESC LIMIT ?"
+    params.append(page_size)
     
-    conn.commit()
-    conn.close()
+    rows = conn.execute(query, params).fetchall()
+    messages = [
+        {"id": row[0], "role": row[1], "content": row[2], "timestamp": row[3]}
+        for row in reversed(rows)  # Reverse to get chronological order
+    ]
+    
+    return {
+        "messages": messages,
+        "next_before_id": messages[0]["id"] if len(rows) == page_size else None
+    }
 
-def get_conversation_history(limit=None):
+def get_conversation_history(limit=None, session_id=DEFAULT_SESSION_ID):
     """
     Retrieve conversation history from database
     
     Args:
         limit (int, optional): Number of recent messages to retrieve
+        session_id (str): Conversation to read
     
     Returns:
         list: List of message dictionaries
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    query = "SELECT role, content, timestamp FROM messages ORDER BY timestamp DESC"
     if limit:
-        query += f" LIMIT {limit}"
+        return get_history_page(session_id, page_size=limit)["messages"]
     
-    cursor.execute(query)
-    messages = [
-        {"role": row[0], "content": row[1], "timestamp": row[2]}
-        for row in cursor.fetchall()
-    ]
+    # Whole conversation: walk it page by page from the newest end
+    pages = []
+    before_id = None
+    while True:
+        page = get_history_page(session_id, page_size=HISTORY_PAGE_SIZE, before_id=before_id)
+        pages.append(page["messages"])
+        before_id = page["next_before_id"]
+        if before_id is None:
+            break
     
-    conn.close()
-    return messages[::-1]  # Reverse to get chronological order
+    return [message for page in reversed(pages) for message in page]
 
-def clear_history():
-    """Clear all messages from the database"""
+def clear_history(session_id=None):
+    """
+    Clear messages from the database
+    
+    Args:
+        session_id (str, optional): Only clear this conversation
+    """
+    flush_messages()
+    
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM messages")
-    conn.commit()
-    conn.close()
\ No newline at end of file
+    with conn:
+        if session_id is None:
+            conn.execute("DELETE FROM messages")
+        else:
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
@@ -1,23 +1,619 @@
 """
 Embedding model handling
+
+Usage:
+    python -m core.embeddings --check-drift   # compare the configured backend to HuggingFaceEmbeddings
 """
-from langchain_huggingface import HuggingFaceEmbeddings
-from .config import EMBEDDING_MODEL
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError:
+    # Windows: the embedding cache is then only safe within one process
+    fcntl = None
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from .config import (
+    EMBEDDING_MODEL,
+    EMBEDDING_BACKEND,
+    EMBEDDING_MODEL_BATCH_SIZE,
+    EMBEDDING_TORCH_THREADS,
+    EMBEDDING_QUANTIZE_INT8,
+    EMBEDDING_SORT_BY_LENGTH,
+    EMBEDDING_DRIFT_MAX,
+    EMBEDDING_CACHE_ENABLED,
+    EMBEDDING_CACHE_PATH,
+    EMBEDDING_CACHE_MAX_ENTRIES
+)
 
 _embeddings_instance = None
 
+# Texts for the drift check when none are given
+DRIFT_SAMPLE_TEXTS = [
+    "What was the total revenue in the third quarter?",
+    "The supplier shall deliver the goods within thirty days of the order.",
+    "Invoice INV-2024-0042 is overdue by 45 days.",
+    "Section 4.2 describes the warranty exclusions for water damage.",
+    "hello",
+    "Summarize the key findings of the audit report, including every open "
+    "recommendation, its owner and the agreed remediation date, and list "
+    "the controls that were found to be operating effectively.",
+    "Der Vertrag kann mit einer Frist von drei Monaten gekündigt werden.",
+    "Table 3: latency p50 12 ms, p95 48 ms, p99 120 ms"
+]
+
+class SentenceTransformerEmbeddings(Embeddings):
+    """
+    CPU-tuned sentence-transformers encoder
+    
+    Produces the same vectors as HuggingFaceEmbeddings for the same model
+    (unnormalized), with control over what matters on CPU: texts per
+    forward pass, torch threads, dynamic int8 quantization of the Linear
+    layers, and sorting texts by length so each batch pads to a similar
+    length. Sorting spans the texts of one embed_documents() call, so the
+    ingestion batch size (EMBEDDING_BATCH_SIZE) sets its window.
+    
+    The thread count is global: torch has one intra-op thread pool per
+    process, so it applies to every torch model in the process, and the
+    last instance created wins.
+    """
+    
+    def __init__(
+        self,
+        model_name=EMBEDDING_MODEL,
+        batch_size=EMBEDDING_MODEL_BATCH_SIZE,
+        threads=EMBEDDING_TORCH_THREADS,
+        quantize=EMBEDDING_QUANTIZE_INT8,
+        sort_by_length=EMBEDDING_SORT_BY_LENGTH
+    ):
+        import torch
+        from sentence_transformers import SentenceTransformer
+        
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.quantize = quantize
+        self.sort_by_length = sort_by_length
+        
+        if threads:
+            # Process-wide, see the class docstring
+            torch.set_num_threads(threads)
+        
+        model = SentenceTransformer(model_name, device="cpu")
+        model.eval()
+        if quantize:
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model = model
+    
+    def _encode(self, texts):
+        vectors = self.model.encode(
+            texts,
+            batch_size=len(texts),
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+        return vectors.astype(np.float32, copy=False)
+    
+    def embed_documents(self, texts):
+        """
+        Embed texts in forward passes of batch_size
+        
+        Args:
+            texts (list): Texts to embed
+        
+        Returns:
+            list: One vector per text, in input order
+        """
+        if not texts:
+            return []
+        
+        order = list(range(len(texts)))
+        if self.sort_by_length:
+            order.sort(key=lambda i: len(texts[i]))
+        
+        vectors = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            for i, vector in zip(batch, self._encode([texts[i] for i in batch])):
+                vectors[i] = vector.tolist()
+        return vectors
+    
+    def embed_query(self, text):
+        """Embed a query"""
+        return self._encode([text])[0].tolist()
+
+def embedding_model_id():
+    """
+    Identify the vectors the configured backend produces
+    
+    Batch size, threads and sorting do not change the vectors; int8
+    quantization does, so it gets its own embedding cache entries.
+    
+    Returns:
+        str: Model name, with a suffix for quantized backends
+    """
+    if EMBEDDING_BACKEND == "sentence_transformers" and EMBEDDING_QUANTIZE_INT8:
+        return f"{EMBEDDING_MODEL}:int8"
+    return EMBEDDING_MODEL
+
+def _huggingface_backend():
+    """The langchain HuggingFaceEmbeddings model, with its default settings"""
+    # Pulls in sentence-transformers and torch, so only on first use
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+
+def _create_backend():
+    """Create the configured embedding model, without the cache"""
+    if EMBEDDING_BACKEND == "sentence_transformers":
+        return SentenceTransformerEmbeddings()
+    
+    if EMBEDDING_BACKEND == "huggingface":
+        return _huggingface_backend()
+    
+    raise ValueError(f"Unknown embedding backend: {EMBEDDING_BACKEND}")
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that keeps document vectors on disk, keyed by content
+    
+    Vectors are stored in a memory-mapped float32 array (vectors.f32).
+    keys.log maps sha256(model, text) to a row of that array and is only
+    ever appended to, so a crash cannot corrupt it. When the cache is full
+    the least recently used rows are reused. A hit on an entry that has
+    drifted into the older half of the log appends it again, so the order
+    of use survives restarts (and is shared between processes) without a
+    line per hit.
+    
+    Processes sharing the directory (the app and the HTTP server) take
+    turns through an flock on cache.lock, and each catches up on the rows
+    the others assigned before looking up or assigning any, so two
+    processes never hand out the same row.
+    """
+    
+    def __init__(self, embeddings, model_name, path, max_entries):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.path = path
+        self.max_entries = max_entries
+        
+        self._lock = threading.Lock()
+        self._slots = OrderedDict()  # key -> row, least recently used first
+        self._owners = {}  # row -> key
+        self._lines = {}  # key -> number of its latest keys.log line
+        self._vectors = None
+        self._log_lines = 0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+        
+        # What of the files this process has already read
+        self._meta_inode = None
+        self._log_inode = None
+        self._log_position = 0
+        
+        self._load()
+    
+    def _file(self, name):
+        return os.path.join(self.path, name)
+    
+    def _key(self, text):
+        """Cache key of a text for the wrapped model"""
+        digest = hashlib.sha256()
+        digest.update(self.model_name.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(text.encode("utf-8"))
+        return digest.hexdigest()
+    
+    @contextmanager
+    def _locked(self, shared=False):
+        """Hold the cache against other threads and, through cache.lock, other processes"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            
+            os.makedirs(self.path, exist_ok=True)
+            with open(self._file("cache.lock"), "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    def _load(self):
+        """Open an existing cache, discarding it if it was built differently"""
+        with self._locked():
+            try:
+                with open(self._file("meta.json")) as f:
+                    meta = json.load(f)
+            except (FileNotFoundError, ValueError):
+                return
+            
+            stale = (
+                meta.get("model") != self.model_name
+                or meta.get("max_entries") != self.max_entries
+                or not os.path.exists(self._file("vectors.f32"))
+            )
+            if stale:
+                self._reset()
+                return
+            
+            self._sync()
+    
+    def _sync(self):
+        """
+        Catch up with the cache files, which other processes may have written
+        
+        Called with the lock held. Replays the keys.log lines appended since
+        the last call; a cache created, reset or compacted in the meantime is
+        read again from the start.
+        """
+        try:
+            meta_inode = os.stat(self._file("meta.json")).st_ino
+        except FileNotFoundError:
+            meta_inode = None
+        
+        if meta_inode != self._meta_inode:
+            self._forget()
+            self._meta_inode = meta_inode
+            if meta_inode is None:
+                return
+            with open(self._file("meta.json")) as f:
+                self._open_vectors(json.load(f)["dim"], mode="r+")
+        
+        if self._vectors is None:
+            return
+        
+        try:
+            log = open(self._file("keys.log"), "rb")
+        except FileNotFoundError:
+            return
+        
+        with log:
+            inode = os.fstat(log.fileno()).st_ino
+            if inode != self._log_inode:
+                # Rewritten by a compaction: it restates every live key
+                self._slots.clear()
+                self._owners.clear()
+                self._lines.clear()
+                self._log_lines = 0
+                self._log_inode = inode
+                self._log_position = 0
+            log.seek(self._log_position)
+            data = log.read()
+        
+        # A line cut short by a crash is left for later (or forever)
+        data = data[:data.rfind(b"\n") + 1]
+        self._log_position += len(data)
+        
+        # A row written later belongs to the later key, and a key written
+        # again was used again
+        for line in data.decode("ascii").splitlines():
+            key, _, slot = line.partition(" ")
+            if not slot:
+                continue
+            self._assign(key, int(slot))
+            self._lines[key] = self._log_lines
+            self._log_lines += 1
+    
+    def _assign(self, key, slot):
+        """Record that a row holds a key's vector, replacing its previous owner"""
+        previous = self._owners.get(slot)
+        if previous is not None:
+            self._slots.pop(previous, None)
+            self._lines.pop(previous, None)
+        self._slots.pop(key, None)
+        self._slots[key] = slot
+        self._owners[slot] = key
+    
+    def _forget(self):
+        """Drop what this process knows of the cache files"""
+        self._slots.clear()
+        self._owners.clear()
+        self._lines.clear()
+        self._vectors = None
+        self._log_lines = 0
+        self._meta_inode = None
+        self._log_inode = None
+        self._log_position = 0
+    
+    def _reset(self):
+        """Delete the cache files"""
+        for name in ("meta.json", "keys.log", "vectors.f32"):
+            try:
+                os.remove(self._file(name))
+            except FileNotFoundError:
+                pass
+        self._forget()
+    
+    def _open_vectors(self, dim, mode):
+        self._vectors = np.memmap(
+            self._file("vectors.f32"),
+            dtype=np.float32,
+            mode=mode,
+            shape=(self.max_entries, dim)
+        )
+    
+    def _create(self, dim):
+        """Create an empty cache for vectors of the given dimension"""
+        os.makedirs(self.path, exist_ok=True)
+        self._reset()
+        self._open_vectors(dim, mode="w+")
+        
+        with open(self._file("meta.json"), "w") as f:
+            json.dump({
+                "model": self.model_name,
+                "dim": dim,
+                "max_entries": self.max_entries
+            }, f)
+        self._meta_inode = os.stat(self._file("meta.json")).st_ino
+    
+    def _compact_log(self):
+        """Rewrite keys.log with one line per live key"""
+        tmp_path = self._file("keys.log.tmp")
+        with open(tmp_path, "w") as f:
+            for key, slot in self._slots.items():
+                f.write(f"{key} {slot}\n")
+        os.replace(tmp_path, self._file("keys.log"))
+        
+        stat = os.stat(self._file("keys.log"))
+        self._log_inode = stat.st_ino
+        self._log_position = stat.st_size
+        self._log_lines = len(self._slots)
+        self._lines = {key: line for line, key in enumerate(self._slots)}
+    
+    def _append_log(self, records):
+        """
+        Append (key, row) records to keys.log
+        
+        Called with the lock held exclusively, after _sync().
+        """
+        if not records:
+            return
+        
+        with open(self._file("keys.log"), "a") as f:
+            f.writelines(f"{key} {slot}\n" for key, slot in records)
+        for key, _ in records:
+            self._lines[key] = self._log_lines
+            self._log_lines += 1
+        
+        # Nobody else wrote meanwhile, so this process has now read it all
+        stat = os.stat(self._file("keys.log"))
+        self._log_inode = stat.st_ino
+        self._log_position = stat.st_size
+        
+        if self._log_lines > 2 * self.max_entries:
+            self._compact_log()
+    
+    def _drifted(self, key):
+        """Whether a key was last written to the older half of the log's recent lines"""
+        return self._log_lines - self._lines.get(key, 0) > self.max_entries // 2
+    
+    def _touch(self, keys):
+        """
+        Record the use of cached keys that drifted toward eviction
+        
+        Called with the lock held exclusively, after _sync().
+        """
+        records = []
+        for key in keys:
+            if key in self._slots and self._drifted(key):
+                self._slots.move_to_end(key)
+                records.append((key, self._slots[key]))
+        self._append_log(records)
+    
+    def _store(self, keys, vectors):
+        """
+        Write new vectors, evicting least recently used rows when full
+        
+        Called with the lock held exclusively, after _sync().
+        """
+        if self._vectors is None:
+            self._create(len(vectors[0]))
+        
+        records = []
+        for key, vector in zip(keys, vectors):
+            if key in self._slots:
+                continue
+            
+            if len(self._slots) < self.max_entries:
+                slot = len(self._slots)
+            else:
+                _, slot = self._slots.popitem(last=False)
+                self._stats["evictions"] += 1
+            
+            self._vectors[slot] = vector
+            self._assign(key, slot)
+            records.append((key, slot))
+        
+        # Vectors hit the disk before the keys that point at them
+        self._vectors.flush()
+        self._append_log(records)
+    
+    def embed_documents(self, texts):
+        """
+        Embed documents, computing only the ones not already cached
+        
+        Args:
+            texts (list): Texts to embed
+        
+        Returns:
+            list: One vector per text
+        """
+        keys = [self._key(text) for text in texts]
+        vectors = [None] * len(texts)
+        missing = OrderedDict()  # key -> positions in texts
+        drifted = []
+        
+        with self._locked(shared=True):
+            self._sync()
+            for i, key in enumerate(keys):
+                slot = self._slots.get(key)
+                if slot is None:
+                    missing.setdefault(key, []).append(i)
+                    continue
+                self._slots.move_to_end(key)
+                vectors[i] = self._vectors[slot].tolist()
+                if self._drifted(key):
+                    drifted.append(key)
+            
+            self._stats["hits"] += len(texts) - len(missing)
+            self._stats["misses"] += len(missing)
+        
+        new_vectors = []
+        if missing:
+            # Run the model outside the lock so cache hits are never blocked on it
+            new_vectors = self.embeddings.embed_documents(
+                [texts[positions[0]] for positions in missing.values()]
+            )
+            for positions, vector in zip(missing.values(), new_vectors):
+                for i in positions:
+                    vectors[i] = vector
+        
+        if drifted or missing:
+            with self._locked():
+                self._sync()
+                # Before storing, so the new vectors do not evict them
+                self._touch(drifted)
+                if missing:
+                    self._store(list(missing), new_vectors)
+        
+        return vectors
+    
+    def embed_query(self, text):
+        """Embed a query (queries are not cached on disk)"""
+        return self.embeddings.embed_query(text)
+    
+    def get_stats(self):
+        """
+        Get cache statistics
+        
+        Returns:
+            dict: 'hits', 'misses', 'evictions', 'entries' and 'hit_rate'
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._slots)
+        
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
 def get_embeddings():
     """
     Get or create embeddings model instance (singleton pattern)
     
     Returns:
-        HuggingFaceEmbeddings: Embeddings model
+        Embeddings: Embeddings model, wrapped in the on-disk cache if enabled
     """
     global _embeddings_instance
     
     if _embeddings_instance is None:
-        _embeddings_instance = HuggingFaceEmbeddings(
-            model_name=EMBEDDING_MODEL
-        )
+        embeddings = _create_backend()
+        
+        if EMBEDDING_CACHE_ENABLED:
+            embeddings = CachedEmbeddings(
+                embeddings,
+                model_name=embedding_model_id(),
+                path=EMBEDDING_CACHE_PATH,
+                max_entries=EMBEDDING_CACHE_MAX_ENTRIES
+            )
+        
+        _embeddings_instance = embeddings
+    
+    return _embeddings_instance
+
+def embed_queries(texts):
+    """
+    Embed several queries in one call to the model
+    
+    Queries skip the on-disk document cache, as embed_query() does.
     
-    return _embeddings_instance
\ No newline at end of file
+    Args:
+        texts (list): Query texts
+    
+    Returns:
+        list: One vector per text
+    """
+    embeddings = get_embeddings()
+    if isinstance(embeddings, CachedEmbeddings):
+        embeddings = embeddings.embeddings
+    return embeddings.embed_documents(texts)
+
+def get_embedding_cache_stats():
+    """
+    Get statistics of the embedding cache
+    
+    Returns:
+        dict: Cache statistics, or None if the cache is disabled or unused
+    """
+    if isinstance(_embeddings_instance, CachedEmbeddings):
+        return _embeddings_instance.get_stats()
+    return None
+
+def check_embedding_drift(texts=None, max_drift=EMBEDDING_DRIFT_MAX):
+    """
+    Compare the configured backend's vectors to the reference backend
+    
+    The reference is langchain's HuggingFaceEmbeddings, the full precision
+    model the indexes were built with before the tuned backend existed.
+    Run the check after changing the backend or turning on quantization:
+    queries embedded differently from the vectors already in the indexes
+    would no longer line up with them.
+    
+    Args:
+        texts (list): Texts to compare (defaults to DRIFT_SAMPLE_TEXTS)
+        max_drift (float): Largest 1 - cosine similarity allowed per text
+    
+    Returns:
+        dict: 'texts' compared, 'mean_cosine', 'min_cosine', 'max_drift'
+            and 'ok' if every text stayed within max_drift
+    """
+    texts = list(texts or DRIFT_SAMPLE_TEXTS)
+    
+    reference = _huggingface_backend()
+    expected = np.asarray(reference.embed_documents(texts), dtype=np.float32)
+    actual = np.asarray(_create_backend().embed_documents(texts), dtype=np.float32)
+    
+    cosines = (expected * actual).sum(axis=1) / (
+        np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1)
+    )
+    drift = float(1.0 - cosines.min())
+    return {
+        "texts": len(texts),
+        "mean_cosine": float(cosines.mean()),
+        "min_cosine": float(cosines.min()),
+        "max_drift": drift,
+        "ok": drift <= max_drift
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Embedding backend checks")
+    parser.add_argument("--check-drift", action="store_true", help="Compare the configured backend to HuggingFaceEmbeddings")
+    parser.add_argument("--texts", help="File with one sample text per line")
+    parser.add_argument("--max-drift", type=float, default=EMBEDDING_DRIFT_MAX)
+    args = parser.parse_args(argv)
+    
+    if not args.check_drift:
+        parser.print_help()
+        return 0
+    
+    texts = None
+    if args.texts:
+        with open(args.texts, encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+    
+    report = check_embedding_drift(texts, max_drift=args.max_drift)
+    print(f"Backend: {EMBEDDING_BACKEND} ({embedding_model_id()})")
+    print(f"  {report['texts']} texts, mean cosine {report['mean_cosine']:.5f}, min cosine {report['min_cosine']:.5f}")
+    print(f"  max drift {report['max_drift']:.5f} (limit {args.max_drift})")
+    if not report["ok"]:
+        print("Drift over the limit")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""
+Conversation history packing with rolling summaries
+"""
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .cache import LRUCache
+from .config import (
+    HISTORY_SUMMARY_MAX_TOKENS,
+    HISTORY_SUMMARY_CACHE_SIZE,
+    CHARS_PER_TOKEN
+)
+from .tokens import estimate_tokens, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+# session_id -> (folded message count, fingerprint of last folded message, summary)
+_summaries = LRUCache(HISTORY_SUMMARY_CACHE_SIZE)
+
+# Summaries are updated off the response path, one at a time
+_summary_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-summary")
+_folding_lock = threading.Lock()
+_folding = set()
+
+def format_message(msg):
+    """Format one conversation message as a prompt line"""
+    role = "User" if msg["role"] == "user" else "Assistant"
+    return f"{role}: {msg['content']}"
+
+def _fingerprint(msg):
+    return hashlib.sha256(format_message(msg).encode("utf-8")).hexdigest()
+
+def _cached_summary(session_id, older):
+    """
+    Get the cached summary that still matches a prefix of the older messages
+    
+    Returns:
+        tuple: (number of messages folded into the summary, summary)
+    """
+    cached = _summaries.get(session_id)
+    if cached is None:
+        return 0, ""
+    
+    count, fingerprint, summary = cached
+    # The session's conversation may have been cleared or replaced
+    if count > len(older) or (count and _fingerprint(older[count - 1]) != fingerprint):
+        return 0, ""
+    
+    return count, summary
+
+def _fold(session_id, older):
+    """Fold the not yet summarized older messages into the session summary"""
+    from .llm_chain import summarize_conversation
+    
+    try:
+        count, summary = _cached_summary(session_id, older)
+        pending = older[count:]
+        if not pending:
+            return
+        
+        max_words = HISTORY_SUMMARY_MAX_TOKENS * CHARS_PER_TOKEN // 6
+        summary = summarize_conversation(
+            summary,
+            "\n".join(format_message(msg) for msg in pending),
+            max_words
+        )
+        _summaries.put(session_id, (len(older), _fingerprint(older[-1]), summary))
+    except Exception:
+        # The next question retries; until then the old summary is used
+        logger.exception("Failed to update conversation summary")
+    finally:
+        with _folding_lock:
+            _folding.discard(session_id)
+
+def _schedule_fold(session_id, older):
+    """Start folding older messages in the background unless already running"""
+    with _folding_lock:
+        if session_id in _folding:
+            return
+        _folding.add(session_id)
+    
+    _summary_executor.submit(_fold, session_id, list(older))
+
+def pack_conversation_history(conversation_list, max_messages, token_budget, session_id):
+    """
+    Pack conversation history into a token budget
+    
+    At most max_messages exchanges are kept verbatim: the most recent ones,
+    as long as they fit. A history within both limits is returned whole,
+    with no summary to make. Everything older is represented by a rolling
+    summary cached per session. The summary is extended in the background
+    with messages that have just aged out, so each message is summarized
+    once and the question being answered never waits on it. Until the
+    summary covers them, those messages stay verbatim as far as the budget
+    and max_messages allow.
+    
+    Args:
+        conversation_list (list): List of conversation messages
+        max_messages (int): Maximum number of recent exchanges kept verbatim
+        token_budget (int): Token budget for the whole history block
+        session_id (str): Session whose summary cache to use
+    
+    Returns:
+        str: Formatted conversation history
+    """
+    max_verbatim = max_messages * 2
+    messages = [format_message(msg) for msg in conversation_list]
+    costs = [estimate_tokens(line) for line in messages]
+    if len(messages) <= max_verbatim and sum(costs) <= token_budget:
+        # Nothing needs summarizing, so no LLM call is spent on it
+        return "\n".join(messages)
+    
+    verbatim_budget = token_budget - HISTORY_SUMMARY_MAX_TOKENS
+    oldest_allowed = max(0, len(conversation_list) - max_verbatim)
+    
+    lines = []
+    used = 0
+    start = len(conversation_list)
+    for i in range(len(conversation_list) - 1, oldest_allowed - 1, -1):
+        if used + costs[i] > verbatim_budget:
+            # Always keep (part of) the latest message
+            if not lines:
+                lines.append(truncate_to_tokens(messages[i], verbatim_budget))
+                used = verbatim_budget
+                start = i
+            break
+        
+        lines.append(messages[i])
+        used += costs[i]
+        start = i
+    
+    older = conversation_list[:start]
+    if not older:
+        lines.reverse()
+        return "\n".join(lines)
+    
+    folded, summary = _cached_summary(session_id, older)
+    if folded < len(older):
+        _schedule_fold(session_id, older)
+    
+    header = []
+    if summary:
+        summary = truncate_to_tokens(summary, HISTORY_SUMMARY_MAX_TOKENS)
+        header.append(f"Summary of earlier conversation: {summary}")
+    
+    # Older messages the summary does not cover yet, newest first, in
+    # whatever budget and message count the recent messages leave
+    remaining = token_budget - used - sum(estimate_tokens(line) for line in header)
+    for i in range(start - 1, folded - 1, -1):
+        if costs[i] > remaining or len(lines) >= max_verbatim:
+            break
+        lines.append(messages[i])
+        remaining -= costs[i]
+    
+    lines.reverse()
+    return "\n".join(header + lines)
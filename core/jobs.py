@@ -0,0 +1,310 @@
+"""
+Background ingestion jobs with persisted progress
+"""
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+import uuid
+from .config import JOB_WORKERS, JOB_SPOOL_PATH, JOB_PROGRESS_INTERVAL
+from .database import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+INPUTS_FILE = "inputs.json"
+
+# Tells this process apart from an earlier one that had the same PID
+_INSTANCE_ID = uuid.uuid4().hex
+
+_job_queue = queue.Queue()
+_workers_lock = threading.Lock()
+_workers = []
+
+class SpooledUpload:
+    """
+    A spooled upload under its original name
+    
+    Left on disk: the PDF loader reads it from path (see iter_pdf_pages),
+    so a job never holds its uploads in memory.
+    """
+    
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+
+def _spool_dir(job_id):
+    return os.path.join(JOB_SPOOL_PATH, job_id)
+
+def _spool_inputs(job_id, pdf_files, text_input, append, agent):
+    """Copy a job's uploads to disk, so the job outlives the request"""
+    path = _spool_dir(job_id)
+    os.makedirs(path, exist_ok=True)
+    
+    names = []
+    for i, pdf in enumerate(pdf_files or []):
+        pdf.seek(0)
+        with open(os.path.join(path, f"{i}.pdf"), "wb") as f:
+            shutil.copyfileobj(pdf, f)
+        names.append(pdf.name)
+    
+    with open(os.path.join(path, INPUTS_FILE), "w", encoding="utf-8") as f:
+        json.dump({
+            "files": names,
+            "text": text_input,
+            "append": append,
+            "agent": agent
+        }, f)
+
+def _load_inputs(job_id):
+    """Read a job's spooled inputs back, its uploads as SpooledUpload"""
+    path = _spool_dir(job_id)
+    with open(os.path.join(path, INPUTS_FILE), encoding="utf-8") as f:
+        inputs = json.load(f)
+    
+    inputs["files"] = [
+        SpooledUpload(name, os.path.join(path, f"{i}.pdf"))
+        for i, name in enumerate(inputs["files"])
+    ]
+    return inputs
+
+def _update_job(job_id, **fields):
+    """Write some columns of a job; dict values are stored as JSON"""
+    columns = []
+    values = []
+    for name, value in fields.items():
+        columns.append(f"{name} = ?")
+        values.append(json.dumps(value) if isinstance(value, dict) else value)
+    
+    conn = get_db_connection()
+    with conn:
+        conn.execute(
+            f"UPDATE jobs SET {', '.join(columns)}, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+            values + [job_id]
+        )
+
+def _claim_job(job_id):
+    """Mark a queued job as running; False if another worker got it first"""
+    conn = get_db_connection()
+    with conn:
+        cursor = conn.execute(
+            "UPDATE jobs SET status = ?, worker = ?, updated_at = CURRENT_TIMESTAMP "
+            "WHERE id = ? AND status = ?",
+            (RUNNING, f"{os.getpid()}:{_INSTANCE_ID}", job_id, QUEUED)
+        )
+    return cursor.rowcount == 1
+
+def _run_job(job_id):
+    """Run one ingestion job to completion, recording its outcome"""
+    from .chat_service import process_documents
+    
+    if not _claim_job(job_id):
+        return
+    
+    progress = {}
+    last_write = [0.0]
+    
+    def track(update):
+        progress.update(update)
+        # Progress is for display; writing every batch would only add load
+        now = time.monotonic()
+        if now - last_write[0] >= JOB_PROGRESS_INTERVAL:
+            last_write[0] = now
+            _update_job(job_id, progress=progress)
+    
+    try:
+        inputs = _load_inputs(job_id)
+        result = process_documents(
+            pdf_files=inputs["files"],
+            text_input=inputs["text"],
+            append=inputs["append"],
+            progress_callback=track,
+            agent=inputs["agent"]
+        )
+    except Exception as e:
+        logger.exception("Ingestion job %s failed", job_id)
+        _update_job(job_id, status=FAILED, progress=progress, error=str(e))
+    else:
+        _update_job(
+            job_id,
+            status=FAILED if result["error"] else SUCCEEDED,
+            progress=progress,
+            result=result,
+            error=result["error"]
+        )
+    finally:
+        shutil.rmtree(_spool_dir(job_id), ignore_errors=True)
+
+def _worker():
+    while True:
+        job_id = _job_queue.get()
+        try:
+            _run_job(job_id)
+        except Exception:
+            logger.exception("Ingestion job %s could not be run", job_id)
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _worker_alive(worker):
+    """
+    Whether the process that claimed a job is still running
+    
+    PIDs are reused across restarts (in a container the app is PID 1 every
+    time), so a job claimed under this process's PID but by another
+    instance was left behind by a dead process, not by this one.
+    
+    Args:
+        worker (str): 'pid:instance' stored by _claim_job() (older rows
+            hold just the PID)
+    """
+    pid, _, instance = worker.partition(":")
+    if int(pid) == os.getpid():
+        return instance == _INSTANCE_ID
+    return _process_alive(int(pid))
+
+def _recover_jobs():
+    """
+    Re-queue the jobs a previous process left behind
+    
+    Queued jobs are picked up again. Jobs whose process died while running
+    them are run again from their spooled inputs (ingestion skips chunks
+    that are already indexed), or failed if the inputs are gone.
+    """
+    conn = get_db_connection()
+    rows = conn.execute(
+        "SELECT id, status, worker FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+        ACTIVE_STATES
+    ).fetchall()
+    
+    for job_id, status, worker in rows:
+        if status == RUNNING:
+            if worker and _worker_alive(worker):
+                continue
+            if not os.path.exists(os.path.join(_spool_dir(job_id), INPUTS_FILE)):
+                _update_job(job_id, status=FAILED, error="Interrupted by a restart")
+                continue
+            _update_job(job_id, status=QUEUED)
+        _job_queue.put(job_id)
+
+def _start_workers():
+    """Start the worker threads and recover old jobs, once per process"""
+    with _workers_lock:
+        if _workers:
+            return
+        
+        for i in range(JOB_WORKERS):
+            thread = threading.Thread(target=_worker, name=f"ingest-worker-{i}", daemon=True)
+            thread.start()
+            _workers.append(thread)
+        
+        _recover_jobs()
+
+def submit_ingest_job(pdf_files=None, text_input=None, append=True, agent=None):
+    """
+    Queue documents for ingestion in the background
+    
+    The uploads are copied to JOB_SPOOL_PATH first, so the job does not
+    depend on the caller's session and survives a restart. Queries keep
+    being answered from the current index until the job publishes the new
+    one.
+    
+    Args:
+        pdf_files: List of PDF file objects (optional)
+        text_input (str): Additional text input (optional)
+        append (bool): Add to the existing index instead of replacing it
+        agent (str, optional): Agent whose index the documents go to
+    
+    Returns:
+        str: Job ID to poll with get_job()
+    """
+    _start_workers()
+    
+    job_id = uuid.uuid4().hex
+    _spool_inputs(job_id, pdf_files, text_input, append, agent)
+    
+    conn = get_db_connection()
+    with conn:
+        conn.execute(
+            "INSERT INTO jobs (id, kind, agent, status, progress) VALUES (?, ?, ?, ?, ?)",
+            (job_id, "ingest", agent, QUEUED, json.dumps({"pages": 0, "chunks": 0, "embedded": 0}))
+        )
+    
+    _job_queue.put(job_id)
+    return job_id
+
+def _job_from_row(row):
+    job_id, kind, agent, status, progress, result, error, created_at, updated_at = row
+    return {
+        "id": job_id,
+        "kind": kind,
+        "agent": agent,
+        "status": status,
+        "progress": json.loads(progress),
+        "result": json.loads(result) if result else None,
+        "error": error,
+        "created_at": created_at,
+        "updated_at": updated_at
+    }
+
+_JOB_COLUMNS = "id, kind, agent, status, progress, result, error, created_at, updated_at"
+
+def get_job(job_id):
+    """
+    Get the state of a job
+    
+    Args:
+        job_id (str): ID returned by submit_ingest_job()
+    
+    Returns:
+        dict: 'id', 'kind', 'agent', 'status', 'progress' ('pages',
+            'chunks', 'embedded'), 'result', 'error' and timestamps, or
+            None if there is no such job
+    """
+    row = get_db_connection().execute(
+        f"SELECT {_JOB_COLUMNS} FROM jobs WHERE id = ?",
+        (job_id,)
+    ).fetchone()
+    return _job_from_row(row) if row else None
+
+def list_jobs(agent=None, active_only=False, limit=20):
+    """
+    List recent jobs, newest first
+    
+    Also makes sure this process is working through the queue, so jobs
+    queued before a restart resume once the app asks about them.
+    
+    Args:
+        agent (str, optional): Only jobs for this agent
+        active_only (bool): Only queued and running jobs
+        limit (int): Maximum number of jobs to return
+    
+    Returns:
+        list: Jobs as returned by get_job()
+    """
+    _start_workers()
+    
+    query = f"SELECT {_JOB_COLUMNS} FROM jobs WHERE agent IS ?"
+    params = [agent]
+    if active_only:
+        query += " AND status IN (?, ?)"
+        params.extend(ACTIVE_STATES)
+    query += " ORDER BY created_at DESC, rowid DESC LIMIT ?"
+    params.append(limit)
+    
+    return [_job_from_row(row) for row in get_db_connection().execute(query, params)]
\ No newline at end of file
@@ -4,10 +4,25 @@ LLM conversational chain setup
 from langchain_groq import ChatGroq
 from langchain.chains.question_answering import load_qa_chain
 from langchain.prompts import PromptTemplate
-from .config import LLM_MODEL, LLM_TEMPERATURE
+from langchain_core.prompts import format_document
+from .config import LLM_MODEL, LLM_TEMPERATURE, load_env
 
 _chain_instance = None
 
+SUMMARY_PROMPT_TEMPLATE = """
+Update the running summary of a conversation between a user and an assistant.
+Keep facts, names, numbers and open questions; drop pleasantries.
+Reply with the updated summary only, in at most {max_words} words.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}
+
+Updated summary:
+"""
+
 def get_conversational_chain():
     """
     Get or create conversational chain (singleton pattern)
@@ -36,6 +51,8 @@ Question:\n{question}\n
 Answer:
         """
         
+        # ChatGroq reads GROQ_API_KEY from the environment
+        load_env()
         model = ChatGroq(
             model_name=LLM_MODEL,
             temperature=LLM_TEMPERATURE
@@ -54,6 +71,79 @@ Answer:
     
     return _chain_instance
 
+def _build_prompt(docs, conversation_history, question):
+    """Build exactly the prompt text the "stuff" chain would send"""
+    chain = get_conversational_chain()
+    
+    context = chain.document_separator.join(
+        format_document(doc, chain.document_prompt) for doc in docs
+    )
+    return chain.llm_chain.prompt.format(**{
+        chain.document_variable_name: context,
+        "conversation_history": conversation_history,
+        "question": question
+    })
+
+def stream_answer(docs, conversation_history, question):
+    """
+    Stream the answer token by token as the model generates it
+    
+    Builds exactly the prompt the "stuff" chain would send, then streams
+    the chat model directly (the chain itself only returns the full text).
+    
+    Args:
+        docs (list): Retrieved documents
+        conversation_history (str): Formatted conversation history
+        question (str): User's question
+    
+    Yields:
+        str: Pieces of the answer text
+    """
+    prompt_text = _build_prompt(docs, conversation_history, question)
+    
+    for chunk in get_conversational_chain().llm_chain.llm.stream(prompt_text):
+        if chunk.content:
+            yield chunk.content
+
+async def astream_answer(docs, conversation_history, question):
+    """
+    Async version of stream_answer
+    
+    Args:
+        docs (list): Retrieved documents
+        conversation_history (str): Formatted conversation history
+        question (str): User's question
+    
+    Yields:
+        str: Pieces of the answer text
+    """
+    prompt_text = _build_prompt(docs, conversation_history, question)
+    
+    async for chunk in get_conversational_chain().llm_chain.llm.astream(prompt_text):
+        if chunk.content:
+            yield chunk.content
+
+def summarize_conversation(summary, messages, max_words):
+    """
+    Fold new messages into a running conversation summary
+    
+    Args:
+        summary (str): Current summary ('' if none yet)
+        messages (str): Formatted messages to fold in
+        max_words (int): Length limit for the new summary
+    
+    Returns:
+        str: Updated summary
+    """
+    prompt_text = SUMMARY_PROMPT_TEMPLATE.format(
+        summary=summary or "(none yet)",
+        messages=messages,
+        max_words=max_words
+    )
+    
+    response = get_conversational_chain().llm_chain.llm.invoke(prompt_text)
+    return response.content.strip()
+
 def reset_chain():
     """Reset the chain instance (useful for testing or reloading)"""
     global _chain_instance
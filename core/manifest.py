@@ -0,0 +1,97 @@
+"""
+Index directories and the manifest of what each one holds
+
+Kept free of faiss and numpy so pages can list agents and sources before
+the vector store is loaded.
+"""
+import hashlib
+import json
+import os
+import re
+from .config import FAISS_INDEX_PATH, AGENT_INDEX_ROOT
+
+# File inside the index directory mapping each source to its chunk hashes
+SOURCES_FILE = "sources.json"
+
+# File inside an agent's index directory recording the agent's name
+AGENT_FILE = "agent.json"
+
+def index_path(agent=None):
+    """
+    Get the index directory of an agent
+    
+    Each agent has its own namespace: a directory under AGENT_INDEX_ROOT
+    named after the agent (made filesystem safe, plus a hash so different
+    names never share a directory).
+    
+    Args:
+        agent (str, optional): Agent name; None for the default index
+    
+    Returns:
+        str: Index directory
+    """
+    if agent is None:
+        return FAISS_INDEX_PATH
+    
+    slug = re.sub(r"[^A-Za-z0-9_-]+", "_", agent).strip("_")[:40] or "agent"
+    suffix = hashlib.sha256(agent.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(AGENT_INDEX_ROOT, f"{slug}-{suffix}")
+
+def read_sources(path):
+    """
+    Read the source -> chunk hashes manifest stored next to the index
+    
+    The hashes of each source are returned as a dict with None values: it
+    keeps their order like the stored list, and membership tests are O(1).
+    """
+    try:
+        with open(os.path.join(path, SOURCES_FILE)) as f:
+            sources = json.load(f)
+    except FileNotFoundError:
+        return {}
+    return {source: dict.fromkeys(hashes) for source, hashes in sources.items()}
+
+def stage_sources(path, sources):
+    """
+    Write the source -> chunk hashes manifest next to the current one
+    
+    Returns:
+        tuple: The step that publishes it (see chunk_store.commit_files)
+    """
+    with open(os.path.join(path, SOURCES_FILE + ".tmp"), "w") as f:
+        json.dump({source: list(hashes) for source, hashes in sources.items()}, f)
+    return ("replace", SOURCES_FILE)
+
+def list_sources(agent=None):
+    """
+    List the source documents in the index
+    
+    Args:
+        agent (str, optional): Agent whose index to list
+    
+    Returns:
+        list: Source names in ingestion order
+    """
+    return list(read_sources(index_path(agent)))
+
+def list_agents():
+    """
+    List the agents that have an index
+    
+    Returns:
+        list: Agent names, sorted
+    """
+    agents = []
+    try:
+        entries = os.listdir(AGENT_INDEX_ROOT)
+    except FileNotFoundError:
+        return agents
+    
+    for entry in entries:
+        try:
+            with open(os.path.join(AGENT_INDEX_ROOT, entry, AGENT_FILE)) as f:
+                agents.append(json.load(f)["name"])
+        except (FileNotFoundError, ValueError, KeyError):
+            continue
+    
+    return sorted(agents)
\ No newline at end of file
@@ -0,0 +1,377 @@
+"""
+Per-stage latency spans, histograms and metrics export
+"""
+import contextvars
+import io
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from .config import (
+    METRICS_ENABLED,
+    METRICS_LOG_PATH,
+    METRICS_BUCKETS,
+    METRICS_RECENT_TRACES,
+    PROFILE_TOP_FUNCTIONS,
+    load_env
+)
+
+_lock = threading.Lock()
+_histograms = {}  # Stage name -> Histogram
+_recent_traces = deque(maxlen=METRICS_RECENT_TRACES)
+
+# Request trace the current code runs under, if any
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+# Self-time accounting for nested timed() iterables, per thread
+_timer_stack = threading.local()
+
+# cProfile allows one active profiler per process
+_profiler_lock = threading.Lock()
+_profile_next = threading.Event()
+
+class Histogram:
+    """Latency histogram with fixed buckets, plus totals of span attributes"""
+    
+    def __init__(self, buckets=METRICS_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.totals = {}
+    
+    def observe(self, seconds, attrs=None):
+        """Record one duration and add its numeric attributes to the totals"""
+        i = 0
+        while i < len(self.buckets) and seconds > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += seconds
+        
+        for key, value in (attrs or {}).items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                self.totals[key] = self.totals.get(key, 0) + value
+    
+    def quantile(self, q):
+        """
+        Estimate a quantile by interpolating within its bucket
+        
+        Args:
+            q (float): Quantile between 0 and 1
+        
+        Returns:
+            float: Seconds, or None if nothing was observed
+        """
+        if not self.count:
+            return None
+        
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                if i == len(self.buckets):
+                    return lower  # Beyond the last bucket
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+def _log_path():
+    load_env()
+    return os.getenv("METRICS_LOG_PATH") or METRICS_LOG_PATH
+
+def _write_log(record):
+    """Append a record to the JSONL metrics log, if one is configured"""
+    path = _log_path()
+    if not path:
+        return
+    
+    line = json.dumps(record, default=str) + "\n"
+    with _lock:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+def record(name, seconds, attrs=None, trace=None):
+    """
+    Record a finished stage
+    
+    Args:
+        name (str): Stage name
+        seconds (float): Duration
+        attrs (dict, optional): Counts to attach, e.g. tokens or chunks
+        trace (dict, optional): Trace to add the stage to; defaults to the
+            request the caller runs under
+    """
+    if not METRICS_ENABLED:
+        return
+    
+    attrs = attrs or {}
+    if trace is None:
+        trace = _current_trace.get()
+    
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.observe(seconds, attrs)
+        
+        if trace:
+            # Repeated stages (e.g. one per embedding batch) are summed
+            stage = trace["stages"].setdefault(name, {"seconds": 0.0, "calls": 0})
+            stage["seconds"] += seconds
+            stage["calls"] += 1
+            for key, value in attrs.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    stage[key] = stage.get(key, 0) + value
+                else:
+                    stage[key] = value
+    
+    if trace is None:
+        _write_log({"stage": name, "seconds": seconds, **attrs, "at": time.time()})
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Time a block of code as one stage
+    
+    Counts known only inside the block can be added to the yielded dict:
+    
+        with span("retrieval") as s:
+            docs = search(...)
+            s["chunks"] = len(docs)
+    
+    Args:
+        name (str): Stage name
+        **attrs: Counts to attach
+    
+    Yields:
+        dict: The stage's attributes
+    """
+    if not METRICS_ENABLED:
+        yield attrs
+        return
+    
+    started = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs["error"] = type(e).__name__
+        raise
+    finally:
+        record(name, time.perf_counter() - started, attrs)
+
+def timed(name, iterable, **attrs):
+    """
+    Time the work done producing the items of an iterable as one stage
+    
+    Pipeline stages run as generators pulling from each other, so the time
+    spent inside an inner timed() iterable on the same thread is not
+    counted again for the outer one. The stage is recorded once the
+    iterable is exhausted or closed, under the request it was created in
+    (it may be consumed on a pipeline thread).
+    
+    Args:
+        name (str): Stage name
+        iterable: Items to pass through
+        **attrs: Counts to attach; 'items' is added
+    
+    Returns:
+        iterator: Items of the iterable
+    """
+    if not METRICS_ENABLED:
+        return iter(iterable)
+    
+    # Taken now: a generator would only look it up on the consuming thread
+    return _timed(name, iterable, attrs, _current_trace.get())
+
+def _timed(name, iterable, attrs, trace):
+    iterator = iter(iterable)
+    busy = 0.0
+    items = 0
+    
+    try:
+        while True:
+            stack = getattr(_timer_stack, "frames", None)
+            if stack is None:
+                stack = _timer_stack.frames = []
+            frame = [0.0]  # Time spent in nested timed() iterables
+            stack.append(frame)
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed = time.perf_counter() - started
+                stack.pop()
+                busy += elapsed - frame[0]
+                if stack:
+                    stack[-1][0] += elapsed
+            items += 1
+            yield item
+    finally:
+        record(name, busy, {**attrs, "items": items}, trace=trace)
+
+def profile_next_request():
+    """Profile the next request that starts, then switch profiling off again"""
+    _profile_next.set()
+
+def _start_profiler(trace):
+    """Start a profiler for a trace if one may run"""
+    import cProfile
+    
+    if not _profiler_lock.acquire(blocking=False):
+        trace["profile"] = "Skipped: another request is being profiled"
+        return None
+    
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as e:  # Another profiling tool is active
+        _profiler_lock.release()
+        trace["profile"] = f"Skipped: {e}"
+        return None
+    return profiler
+
+def _stop_profiler(profiler, trace):
+    """Stop a profiler and attach its report to the trace"""
+    import pstats
+    
+    profiler.disable()
+    _profiler_lock.release()
+    
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+    trace["profile"] = out.getvalue()
+
+@contextmanager
+def trace(name, profile=False, **attrs):
+    """
+    Time one request and collect the stages it runs
+    
+    Inside another trace this is an ordinary span. With profiling switched
+    on (here or by profile_next_request()), the request's thread runs under
+    cProfile and the report is attached to the trace.
+    
+    Args:
+        name (str): Request type, e.g. 'question' or 'ingest'
+        profile (bool): Profile this request
+        **attrs: Values to attach, e.g. the agent
+    
+    Yields:
+        dict: The trace; its 'attrs' can be added to
+    """
+    if not METRICS_ENABLED or _current_trace.get() is not None:
+        with span(name, **attrs) as s:
+            yield {"attrs": s}
+        return
+    
+    current = {
+        "name": name,
+        "at": time.time(),
+        "attrs": attrs,
+        "stages": {}
+    }
+    token = _current_trace.set(current)
+    
+    profiler = None
+    if profile or _profile_next.is_set():
+        _profile_next.clear()
+        profiler = _start_profiler(current)
+    
+    started = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current["attrs"]["error"] = type(e).__name__
+        raise
+    finally:
+        current["seconds"] = time.perf_counter() - started
+        if profiler is not None:
+            _stop_profiler(profiler, current)
+        
+        try:
+            _current_trace.reset(token)
+        except ValueError:
+            # A generator closed from another context (e.g. garbage collected)
+            pass
+        
+        record(name, current["seconds"], current["attrs"], trace=False)
+        with _lock:
+            _recent_traces.append(current)
+        _write_log(current)
+
+def get_metrics():
+    """
+    Get a summary of every stage recorded so far
+    
+    Returns:
+        dict: Stage name -> 'count', 'total_seconds', 'p50_ms', 'p95_ms',
+            'p99_ms' and 'totals' of attached counts
+    """
+    with _lock:
+        summary = {}
+        for name, histogram in sorted(_histograms.items()):
+            summary[name] = {
+                "count": histogram.count,
+                "total_seconds": histogram.sum,
+                **{
+                    f"p{int(q * 100)}_ms": histogram.quantile(q) * 1000
+                    for q in (0.5, 0.95, 0.99)
+                },
+                "totals": dict(histogram.totals)
+            }
+        return summary
+
+def get_recent_traces():
+    """Get the most recent request traces, newest first"""
+    with _lock:
+        return list(reversed(_recent_traces))
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def render_prometheus():
+    """
+    Render all metrics in the Prometheus text exposition format
+    
+    Returns:
+        str: Metrics text
+    """
+    lines = [
+        "# HELP rag_stage_duration_seconds Time spent in each pipeline stage",
+        "# TYPE rag_stage_duration_seconds histogram"
+    ]
+    totals = {}
+    
+    with _lock:
+        for name, histogram in sorted(_histograms.items()):
+            stage = _label(name)
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                cumulative += count
+                lines.append(f'rag_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'rag_stage_duration_seconds_sum{{stage="{stage}"}} {histogram.sum}')
+            lines.append(f'rag_stage_duration_seconds_count{{stage="{stage}"}} {histogram.count}')
+            
+            for key, value in histogram.totals.items():
+                totals.setdefault(key, []).append((stage, value))
+    
+    for key, values in sorted(totals.items()):
+        metric = "rag_stage_" + "".join(c if c.isalnum() else "_" for c in key) + "_total"
+        lines.append(f"# HELP {metric} Sum of '{key}' over all stage runs")
+        lines.append(f"# TYPE {metric} counter")
+        for stage, value in values:
+            lines.append(f'{metric}{{stage="{stage}"}} {value}')
+    
+    return "\n".join(lines) + "\n"
+
+def reset_metrics():
+    """Forget all recorded stages and traces"""
+    with _lock:
+        _histograms.clear()
+        _recent_traces.clear()
\ No newline at end of file
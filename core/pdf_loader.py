@@ -1,68 +1,261 @@
 """
 PDF text extraction functionality
 """
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
 from pypdf import PdfReader
-from pypdf.errors import PdfStreamError
+from .config import (
+    PDF_EXTRACT_WORKERS,
+    PDF_PAGES_PER_TASK,
+    PDF_PARALLEL_MIN_PAGES,
+    PDF_FILE_TIMEOUT
+)
 
-def extract_text_from_pdfs(pdf_files):
+logger = logging.getLogger(__name__)
+
+# (path, PdfReader) of the file last opened by this worker process
+_worker_reader = None
+
+class _WorkerContext:
+    """Spawn context that keeps the worker processes it starts, so they can be stopped"""
+    
+    def __init__(self):
+        # spawn rather than fork: the Streamlit server is multi-threaded
+        self._context = multiprocessing.get_context("spawn")
+        self.processes = []
+    
+    def Process(self, *args, **kwargs):
+        process = self._context.Process(*args, **kwargs)
+        self.processes.append(process)
+        return process
+    
+    def __getattr__(self, name):
+        return getattr(self._context, name)
+
+def _start_pool(workers):
+    """
+    Start a process pool for one extraction call
+    
+    Every call gets its own pool, so stopping the workers stuck on one
+    caller's PDF never breaks the extraction of concurrent uploads.
+    
+    Returns:
+        tuple: (pool, worker context to pass to _stop_pool)
+    """
+    context = _WorkerContext()
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context), context
+
+def _stop_pool(pool, context):
+    """Stop a pool, including workers that may be stuck on a pathological PDF"""
+    # Running tasks cannot be cancelled, so stop the worker processes directly
+    for process in context.processes:
+        if process.is_alive():
+            process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def _reader(path):
+    """Parse a PDF once per worker process, not once per task"""
+    global _worker_reader
+    
+    if _worker_reader is None or _worker_reader[0] != path:
+        _worker_reader = (path, PdfReader(path))
+    return _worker_reader[1]
+
+def _count_pages(path):
+    """Count the pages of a PDF (runs in a worker process)"""
+    return len(_reader(path).pages)
+
+def _extract_pages(path, start, stop):
     """
-    Extract text from a list of PDF files
+    Extract the text of a range of pages (runs in a worker process)
+    
+    The file is read from disk and parsed once per worker, not sent with
+    every page range.
     
     Args:
-        pdf_files: List of file-like objects (from Streamlit file_uploader)
+        path (str): Path of the PDF file
+        start (int): Index of the first page
+        stop (int): Index after the last page
     
     Returns:
-        tuple: (extracted_text, skipped_files)
+        list: Text of each page ('' for pages without text)
+    """
+    pdf_reader = _reader(path)
+    return [pdf_reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+def _spool_pdfs(pdf_files, spool_dir):
     """
-    text = ""
-    skipped_files = []
+    Write every upload to disk for the worker processes to read
     
-    for pdf in pdf_files:
-        try:
+    Uploads with a path are already on disk and are read from there.
+    
+    Returns:
+        list: (file_name, path) of each upload
+    """
+    spooled = []
+    
+    for i, pdf in enumerate(pdf_files):
+        path = getattr(pdf, "path", None)
+        if path is None:
             # Reset stream pointer (Streamlit quirk)
             pdf.seek(0)
-            
-            pdf_reader = PdfReader(pdf)
-            
-            for page in pdf_reader.pages:
-                extracted = page.extract_text()
-                if extracted:
-                    text += extracted
+            path = os.path.join(spool_dir, f"{i}.pdf")
+            with open(path, "wb") as f:
+                shutil.copyfileobj(pdf, f)
+        spooled.append((pdf.name, path))
+    
+    return spooled
+
+def _run_per_file(files, submit, skipped_files, workers):
+    """
+    Run the tasks of each file in worker processes, one file at a time
+    
+    A file whose tasks exceed PDF_FILE_TIMEOUT (or crash a worker) is
+    skipped; the pool is then replaced and the remaining files are
+    resubmitted. A file whose tasks fail is skipped on its own.
+    
+    Args:
+        files (list): Tuples whose first item is the file name
+        submit (callable): Called with the pool and a file, returns the
+            file's futures
+        skipped_files (list): Names of skipped files are appended here
+        workers (int): Worker processes
+    
+    Yields:
+        tuple: (file, list of task results), in the order of files
+    """
+    pending = files
+    
+    while pending:
+        pool, context = _start_pool(workers)
+        remaining = []
         
-        except PdfStreamError:
-            skipped_files.append(pdf.name)
+        try:
+            # Submit every task up front so workers stay busy across files
+            tasks = [(file, submit(pool, file)) for file in pending]
+            
+            for i, (file, futures) in enumerate(tasks):
+                name = file[0]
+                # The timeout counts from when this file is waited on, so time
+                # spent queued behind earlier files is not held against it
+                deadline = time.monotonic() + PDF_FILE_TIMEOUT
+                
+                try:
+                    results = [
+                        future.result(timeout=max(0, deadline - time.monotonic()))
+                        for future in futures
+                    ]
+                
+                except (FutureTimeoutError, BrokenProcessPool):
+                    logger.warning("Skipping %s: it timed out or crashed its worker", name)
+                    skipped_files.append(name)
+                    remaining = pending[i + 1:]
+                    break
+                
+                except Exception:
+                    logger.warning("Skipping unreadable PDF %s", name, exc_info=True)
+                    skipped_files.append(name)
+                    continue
+                
+                yield file, results
+        finally:
+            _stop_pool(pool, context)
         
-        except Exception as e:
-            skipped_files.append(pdf.name)
+        pending = remaining
+
+def _open_pdfs(spooled, skipped_files):
+    """
+    Count the pages of every spooled file, skipping unreadable files
+    
+    Parsing runs in a worker process like extraction, so a file that
+    hangs the parser is held to PDF_FILE_TIMEOUT as well.
+    
+    Returns:
+        list: (file_name, path, page_count) for each readable file
+    """
+    return [
+        (name, path, page_count)
+        for (name, path), (page_count,) in _run_per_file(
+            spooled,
+            lambda pool, file: [pool.submit(_count_pages, file[1])],
+            skipped_files,
+            workers=1
+        )
+    ]
+
+def _iter_pages_pooled(opened, skipped_files, workers):
+    """
+    Extract pages in worker processes, split into page ranges across files
     
-    return text, skipped_files
+    Files are yielded in upload order as soon as all of their page ranges
+    are done.
+    """
+    def submit(pool, file):
+        _, path, page_count = file
+        return [
+            pool.submit(_extract_pages, path, start, min(start + PDF_PAGES_PER_TASK, page_count))
+            for start in range(0, page_count, PDF_PAGES_PER_TASK)
+        ]
+    
+    for (name, _, _), ranges in _run_per_file(opened, submit, skipped_files, workers):
+        pages = [text for texts in ranges for text in texts]
+        for page_number, text in enumerate(pages, start=1):
+            if text:
+                yield name, page_number, text
 
-def validate_extracted_text(text, skipped_files):
+def iter_pdf_pages(pdf_files, skipped_files, parallel=None):
     """
-    Validate extracted text and return status
+    Extract text from a list of PDF files page by page, in upload order
+    
+    Extraction always runs in worker processes, so PDF_FILE_TIMEOUT holds
+    for small uploads too.
+    
+    Args:
+        pdf_files: List of file-like objects (from Streamlit file_uploader),
+            or of objects with the name and path of a PDF already on disk
+        skipped_files (list): Names of files that could not be read are appended here
+        parallel (bool, optional): Use up to PDF_EXTRACT_WORKERS processes
+            instead of one; by default only uploads of at least
+            PDF_PARALLEL_MIN_PAGES pages do
+    
+    Yields:
+        tuple: (file_name, page_number, text) for every page with text
+    """
+    with tempfile.TemporaryDirectory(prefix="pdf-extract-") as spool_dir:
+        opened = _open_pdfs(_spool_pdfs(pdf_files, spool_dir), skipped_files)
+        
+        total_pages = sum(page_count for _, _, page_count in opened)
+        if parallel is None:
+            parallel = total_pages >= PDF_PARALLEL_MIN_PAGES
+        
+        workers = 1
+        if parallel:
+            tasks = sum(-(-page_count // PDF_PAGES_PER_TASK) for _, _, page_count in opened)
+            workers = max(1, min(PDF_EXTRACT_WORKERS, tasks))
+        
+        yield from _iter_pages_pooled(opened, skipped_files, workers)
+
+def format_skipped_warning(skipped_files):
+    """
+    Build the warning shown for files that could not be read
     
     Args:
-        text (str): Extracted text
         skipped_files (list): List of files that couldn't be processed
     
     Returns:
-        dict: Status information with 'success', 'warning', 'error' keys
-    """
-    result = {
-        "success": False,
-        "warning": None,
-        "error": None
-    }
-    
-    if skipped_files:
-        result["warning"] = (
-            f"Skipped {len(skipped_files)} file(s) due to read errors: "
-            + ", ".join(skipped_files)
-        )
-    
-    if not text.strip():
-        result["error"] = "No readable text found in the uploaded PDFs."
-        return result
+        str: Warning message, or None if no file was skipped
+    """
+    if not skipped_files:
+        return None
     
-    result["success"] = True
-    return result
\ No newline at end of file
+    return (
+        f"Skipped {len(skipped_files)} file(s) due to read errors: "
+        + ", ".join(skipped_files)
+    )
\ No newline at end of file
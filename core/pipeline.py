@@ -0,0 +1,94 @@
+"""
+Streaming helpers for the ingestion pipeline
+"""
+import contextvars
+import queue
+import threading
+from itertools import islice
+
+# Marks the end of a stage's output
+_DONE = object()
+
+class _StageError:
+    """Carries an exception raised inside a stage to its consumer"""
+    def __init__(self, error):
+        self.error = error
+
+def threaded(iterable, maxsize):
+    """
+    Run an iterable in a background thread, handing items over a bounded queue
+    
+    The producer blocks once `maxsize` items are waiting, so a fast stage
+    cannot run ahead of a slow one and buffer the whole upload in memory.
+    Exceptions raised by the producer are re-raised in the consumer. The
+    producer runs in a copy of the caller's context, so it reports its
+    timings under the caller's request.
+    
+    Args:
+        iterable: Stage to run in the background
+        maxsize (int): Maximum number of items waiting in the queue
+    
+    Yields:
+        Items of the iterable, in order
+    """
+    items = queue.Queue(maxsize=maxsize)
+    stopped = threading.Event()
+    
+    def put(item):
+        # Poll so the producer exits if the consumer goes away
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except BaseException as e:
+            put(_StageError(e))
+            return
+        put(_DONE)
+    
+    context = contextvars.copy_context()
+    thread = threading.Thread(target=context.run, args=(produce,), daemon=True)
+    thread.start()
+    
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _StageError):
+                # Drop the frame's reference to the error, or the traceback
+                # cycle keeps upstream stages alive until garbage collection
+                error, item = item.error, None
+                try:
+                    raise error
+                finally:
+                    del error
+            yield item
+    finally:
+        stopped.set()
+
+def batched(iterable, size):
+    """
+    Group an iterable into lists of at most `size` items
+    
+    Args:
+        iterable: Items to group
+        size (int): Batch size
+    
+    Yields:
+        list: Next batch
+    """
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
@@ -0,0 +1,142 @@
+"""
+Micro-batching of concurrent query embeddings
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from .config import (
+    QUERY_BATCHING_ENABLED,
+    QUERY_BATCH_MAX_SIZE,
+    QUERY_BATCH_MAX_WAIT_MS
+)
+
+logger = logging.getLogger(__name__)
+
+_batcher_instance = None
+_batcher_lock = threading.Lock()
+
+class QueryBatcher:
+    """
+    Embeds queries submitted from many threads in shared model calls
+    
+    The first waiting query opens a batch. The batch is sent to the model
+    once it holds max_batch_size queries or max_wait seconds have passed,
+    so a lone query pays at most max_wait extra while concurrent queries
+    share one forward pass instead of queueing for one each.
+    """
+    
+    def __init__(self, embed_many, max_batch_size=QUERY_BATCH_MAX_SIZE, max_wait=QUERY_BATCH_MAX_WAIT_MS / 1000):
+        self.embed_many = embed_many
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        
+        self._pending = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="query-batcher", daemon=True)
+        self._stats_lock = threading.Lock()
+        self._stats = {"queries": 0, "batches": 0, "largest_batch": 0}
+        self._thread.start()
+    
+    def submit(self, text):
+        """
+        Queue a query for the next batch
+        
+        Returns:
+            Future: Resolves to the query's embedding
+        """
+        future = Future()
+        self._pending.put((text, future))
+        return future
+    
+    def embed(self, text):
+        """Embed a query, waiting for its batch"""
+        return self.submit(text).result()
+    
+    def _collect(self):
+        """Block for the first query, then gather more until the batch closes"""
+        batch = [self._pending.get()]
+        deadline = time.monotonic() + self.max_wait
+        
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        
+        return batch
+    
+    def _run(self):
+        while True:
+            batch = self._collect()
+            
+            # Identical queries in a batch are embedded once
+            futures_by_text = {}
+            for text, future in batch:
+                futures_by_text.setdefault(text, []).append(future)
+            texts = list(futures_by_text)
+            
+            try:
+                vectors = self.embed_many(texts)
+            except Exception as e:
+                logger.exception("Failed to embed a batch of %d queries", len(texts))
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            
+            for text, vector in zip(texts, vectors):
+                for future in futures_by_text[text]:
+                    future.set_result(vector)
+            
+            with self._stats_lock:
+                self._stats["queries"] += len(batch)
+                self._stats["batches"] += 1
+                self._stats["largest_batch"] = max(self._stats["largest_batch"], len(batch))
+    
+    def get_stats(self):
+        """
+        Get batching statistics
+        
+        Returns:
+            dict: 'queries', 'batches', 'largest_batch' and 'mean_batch'
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["mean_batch"] = stats["queries"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
+
+def enable_query_batching(max_batch_size=QUERY_BATCH_MAX_SIZE, max_wait_ms=QUERY_BATCH_MAX_WAIT_MS):
+    """
+    Route query embeddings through a shared batcher from now on
+    
+    Only worth it when many threads search at once, as in the HTTP server;
+    a single Streamlit session would just wait max_wait_ms per query.
+    
+    Args:
+        max_batch_size (int): Queries embedded per call at most
+        max_wait_ms (float): How long a batch stays open for more queries
+    
+    Returns:
+        QueryBatcher: The batcher
+    """
+    global _batcher_instance
+    from .embeddings import embed_queries
+    
+    with _batcher_lock:
+        if _batcher_instance is None:
+            _batcher_instance = QueryBatcher(embed_queries, max_batch_size, max_wait_ms / 1000)
+    return _batcher_instance
+
+def get_query_batcher():
+    """
+    Get the query batcher, if batching is enabled
+    
+    Returns:
+        QueryBatcher: The batcher, or None to embed queries directly
+    """
+    if _batcher_instance is None and QUERY_BATCHING_ENABLED:
+        return enable_query_batching()
+    return _batcher_instance
\ No newline at end of file
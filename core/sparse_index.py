@@ -0,0 +1,423 @@
+"""
+BM25 inverted index for exact-term retrieval
+"""
+import math
+import os
+import re
+from collections import Counter
+import numpy as np
+from .chunk_store import append_array, commit_files, map_array, read_counts, stage_counts
+
+# Standard BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Files inside the index directory
+BM25_VOCAB_FILE = "bm25.vocab"      # One term per line; a term's ID is its line number
+BM25_OFFSETS_FILE = "bm25.offsets"  # int64 offset of each chunk's entries, plus the end
+BM25_TERMS_FILE = "bm25.terms"      # int32 term ID of each entry
+BM25_FREQS_FILE = "bm25.freqs"      # int32 frequency of each entry
+BM25_COUNT_FILE = "bm25.count"      # Committed chunks, terms and vocabulary bytes
+
+_TERM_DTYPE = np.int32
+_FREQ_DTYPE = np.int32
+
+# Words, keeping identifiers like "AB-1234", "4.2.1" or "ISO/IEC" together
+_TOKEN_PATTERN = re.compile(r"\w+(?:[-./]\w+)*")
+_TOKEN_SEPARATORS = re.compile(r"[-./]")
+
+def tokenize(text):
+    """
+    Split text into lowercase index terms
+    
+    Compound identifiers are indexed both whole and by their parts, so
+    "AB-1234" matches queries for "AB-1234" as well as "1234".
+    
+    Args:
+        text (str): Text to tokenize
+    
+    Returns:
+        list: Terms, with repeats
+    """
+    terms = []
+    for token in _TOKEN_PATTERN.findall(text.lower()):
+        terms.append(token)
+        if _TOKEN_SEPARATORS.search(token):
+            terms.extend(part for part in _TOKEN_SEPARATORS.split(token) if part)
+    return terms
+
+def _count_terms(text, vocab, term_ids):
+    """
+    Term IDs and frequencies of a text, adding unseen terms to the vocabulary
+    
+    Returns:
+        tuple: (term IDs, frequencies) lists, in first occurrence order
+    """
+    ids = []
+    counts = []
+    for term, count in Counter(tokenize(text)).items():
+        term_id = term_ids.get(term)
+        if term_id is None:
+            term_id = term_ids[term] = len(vocab)
+            vocab.append(term)
+        ids.append(term_id)
+        counts.append(count)
+    return ids, counts
+
+class BM25Index:
+    """
+    BM25 over the chunks of an index snapshot, keyed by chunk position
+    
+    Stored chunk by chunk like the chunk store: the (term ID, frequency)
+    entries of every chunk in position order, the offset of each chunk's
+    entries, and the vocabulary. Loading maps the files and inverts the
+    entries with one sort, so nothing is parsed and a query only visits
+    the postings of its own terms.
+    """
+    
+    def __init__(self, vocab=None, offsets=None, terms=None, freqs=None, path=None, base=None):
+        self.path = path  # Directory the index was loaded from, if any
+        self.vocab = vocab if vocab is not None else []  # Terms, by ID
+        self.offsets = offsets if offsets is not None else np.zeros(1, dtype=np.int64)
+        self.terms = terms if terms is not None else np.zeros(0, dtype=_TERM_DTYPE)
+        self.freqs = freqs if freqs is not None else np.zeros(0, dtype=_FREQ_DTYPE)
+        self.term_ids = {term: i for i, term in enumerate(self.vocab)}
+        
+        if base is not None and len(base) <= len(self) and len(base.vocab) <= len(self.vocab):
+            self._extend_postings(base)
+        else:
+            self._invert()
+        
+        average_length = self._lengths.mean() if len(self._lengths) else 0.0
+        self._length_norms = (
+            BM25_K1 * (1 - BM25_B + BM25_B * self._lengths / average_length)
+            if average_length else np.full(len(self._lengths), BM25_K1)
+        ).astype(np.float32)
+    
+    def _invert(self):
+        """Build the postings: the entries sorted by term, each term's run found by its ID"""
+        counts = np.diff(self.offsets)
+        entry_positions = np.repeat(np.arange(len(counts), dtype=np.int32), counts)
+        order = np.argsort(self.terms, kind="stable")
+        self._posting_positions = entry_positions[order]
+        self._posting_freqs = np.asarray(self.freqs, dtype=np.float32)[order]
+        self._posting_starts = np.searchsorted(
+            self.terms[order],
+            np.arange(len(self.vocab) + 1, dtype=_TERM_DTYPE)
+        )
+        self._lengths = self._entry_lengths(self.offsets, self.freqs)
+    
+    def _extend_postings(self, base):
+        """
+        Build the postings from those of a base index this one appends to
+        
+        Only the appended entries are sorted. Their positions all follow the
+        base's, so each goes at the end of its term's run, and the base's
+        postings are copied over once rather than sorted again.
+        """
+        start = int(self.offsets[len(base)])
+        offsets = np.asarray(self.offsets[len(base):]) - start
+        terms = np.asarray(self.terms[start:])
+        freqs = np.asarray(self.freqs[start:])
+        
+        positions = np.repeat(np.arange(len(base), len(self), dtype=np.int32), np.diff(offsets))
+        order = np.argsort(terms, kind="stable")
+        terms = terms[order]
+        
+        # Terms new to this index have empty runs at the end of the base's
+        base_starts = np.concatenate([
+            base._posting_starts,
+            np.full(len(self.vocab) - len(base.vocab), base._posting_starts[-1])
+        ])
+        run_ends = base_starts[terms.astype(np.int64) + 1]
+        self._posting_positions = np.insert(base._posting_positions, run_ends, positions[order])
+        self._posting_freqs = np.insert(base._posting_freqs, run_ends, freqs[order].astype(np.float32))
+        added = np.bincount(terms, minlength=len(self.vocab))
+        self._posting_starts = base_starts + np.concatenate([[0], np.cumsum(added)])
+        self._lengths = np.concatenate([base._lengths, self._entry_lengths(offsets, freqs)])
+    
+    @staticmethod
+    def _entry_lengths(offsets, freqs):
+        """Number of terms in each chunk"""
+        cumulative = np.concatenate([[0], np.cumsum(freqs, dtype=np.int64)])
+        return cumulative[offsets[1:]] - cumulative[offsets[:-1]]
+    
+    def __len__(self):
+        return len(self.offsets) - 1
+    
+    @classmethod
+    def from_texts(cls, texts):
+        """
+        Build an index in memory
+        
+        Args:
+            texts: Text of the chunk at each position
+        """
+        vocab = []
+        term_ids = {}
+        offsets = [0]
+        terms = []
+        freqs = []
+        
+        for text in texts:
+            ids, counts = _count_terms(text, vocab, term_ids)
+            terms.extend(ids)
+            freqs.extend(counts)
+            offsets.append(len(terms))
+        
+        return cls(
+            vocab,
+            np.array(offsets, dtype=np.int64),
+            np.array(terms, dtype=_TERM_DTYPE),
+            np.array(freqs, dtype=_FREQ_DTYPE)
+        )
+    
+    @staticmethod
+    def exists(path):
+        """Whether a BM25 index has been written to a directory"""
+        return os.path.exists(os.path.join(path, BM25_OFFSETS_FILE))
+    
+    @classmethod
+    def load(cls, path, limit=None, base=None):
+        """
+        Open the index written to a directory by BM25Writer
+        
+        Args:
+            path (str): Index directory
+            limit (int, optional): Load at most this many chunks (see
+                ChunkStore); terms only they would use are kept unused
+            base (BM25Index, optional): Index of the snapshot this one was
+                appended to, whose postings are reused
+        
+        Raises:
+            FileNotFoundError: If no index was written there
+        """
+        counts = read_counts(path, BM25_COUNT_FILE)
+        if counts is None:
+            # Written before appends existed: the files are exactly the index
+            counts = {"chunks": None, "vocab_bytes": -1}
+        
+        chunks = counts["chunks"]
+        if limit is not None:
+            chunks = limit if chunks is None else min(chunks, limit)
+        offsets = map_array(
+            os.path.join(path, BM25_OFFSETS_FILE),
+            np.int64,
+            None if chunks is None else chunks + 1
+        )
+        with open(os.path.join(path, BM25_VOCAB_FILE), "rb") as f:
+            vocab = f.read(counts["vocab_bytes"]).decode("utf-8").splitlines()
+        
+        entries = int(offsets[-1])
+        return cls(
+            vocab,
+            offsets,
+            map_array(os.path.join(path, BM25_TERMS_FILE), _TERM_DTYPE, entries),
+            map_array(os.path.join(path, BM25_FREQS_FILE), _FREQ_DTYPE, entries),
+            path=path,
+            base=base
+        )
+    
+    def memory_bytes(self):
+        """Approximate memory held by the postings"""
+        return (
+            self._posting_positions.nbytes
+            + self._posting_freqs.nbytes
+            + self._posting_starts.nbytes
+            + self._length_norms.nbytes
+            + self._lengths.nbytes
+        )
+    
+    def search(self, query, k, mask=None):
+        """
+        Find the chunks scoring highest for a query
+        
+        Only the postings of the query's terms are visited.
+        
+        Args:
+            query (str): Query text
+            k (int): Number of chunks to return
+            mask (np.ndarray, optional): Only score positions where this
+                boolean array is true
+        
+        Returns:
+            list: (position, score) pairs, best first
+        """
+        doc_count = len(self)
+        if not doc_count:
+            return []
+        
+        scores = np.zeros(doc_count, dtype=np.float32)
+        
+        for term in set(tokenize(query)):
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                continue
+            
+            start, stop = self._posting_starts[term_id], self._posting_starts[term_id + 1]
+            if start == stop:
+                continue  # Only in chunks that were removed since
+            
+            positions = self._posting_positions[start:stop]
+            frequencies = self._posting_freqs[start:stop]
+            idf = math.log(1 + (doc_count - (stop - start) + 0.5) / (stop - start + 0.5))
+            scores[positions] += idf * frequencies * (BM25_K1 + 1) / (
+                frequencies + self._length_norms[positions]
+            )
+        
+        if mask is not None:
+            scores[~mask] = 0
+        
+        hits = np.flatnonzero(scores)
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        # Best first, ties in position order
+        hits = hits[np.lexsort((hits, -scores[hits]))]
+        return [(int(position), float(scores[position])) for position in hits]
+
+class BM25Writer:
+    """
+    Writes the BM25 files of a new snapshot
+    
+    Used alongside a ChunkWriter: chunks are added in the same order, so
+    their entries line up with chunk positions. The entries of a base index
+    come first, minus skipped positions. As for chunks, when nothing is
+    skipped and the base is the index committed in the directory, only the
+    new entries and terms are appended to its files; otherwise the index is
+    written to temporary files next to the current ones. Readers do not see
+    the new entries until the staged files are committed (see stage()).
+    """
+    
+    def __init__(self, path, base=None, skip=()):
+        self.path = path
+        self.base = base
+        self.skip = set(skip)
+        self.vocab = list(base.vocab) if base is not None else []
+        self.term_ids = dict(base.term_ids) if base is not None else {}
+        
+        self._offsets = []
+        self._terms = []
+        self._freqs = []
+        self._size = 0  # Entries added, which the offsets count from
+        self._staged = False
+        self._appended = False
+    
+    def _file(self, name):
+        return os.path.join(self.path, name)
+    
+    def _tmp(self, name):
+        return self._file(name + ".tmp")
+    
+    def _can_append(self):
+        """Whether the base index's own files can be appended to"""
+        if self.base is None or self.skip or self.base.path != self.path:
+            return False
+        
+        counts = read_counts(self.path, BM25_COUNT_FILE)
+        return (
+            counts is not None
+            and counts["chunks"] == len(self.base)
+            and counts["terms"] == len(self.base.vocab)
+        )
+    
+    def add(self, text):
+        """Index the chunk at the next position"""
+        ids, counts = _count_terms(text, self.vocab, self.term_ids)
+        self._terms.extend(ids)
+        self._freqs.extend(counts)
+        self._size += len(ids)
+        self._offsets.append(self._size)
+    
+    def _base_entries(self):
+        """Offsets, terms and frequencies of the base index, minus skipped positions"""
+        if self.base is None:
+            return np.zeros(1, dtype=np.int64), np.zeros(0, _TERM_DTYPE), np.zeros(0, _FREQ_DTYPE)
+        
+        counts = np.diff(self.base.offsets)
+        keep = np.ones(len(counts), dtype=bool)
+        keep[list(self.skip)] = False
+        kept_entries = np.repeat(keep, counts)
+        
+        offsets = np.concatenate([[0], np.cumsum(counts[keep], dtype=np.int64)])
+        return offsets, np.asarray(self.base.terms)[kept_entries], np.asarray(self.base.freqs)[kept_entries]
+    
+    def stage(self):
+        """
+        Write everything but the commit itself
+        
+        Returns:
+            list: Steps that publish the staged files (see commit_files)
+        """
+        offsets = np.array(self._offsets, dtype=np.int64)
+        terms = np.array(self._terms, dtype=_TERM_DTYPE)
+        freqs = np.array(self._freqs, dtype=_FREQ_DTYPE)
+        self._staged = True
+        
+        if self._can_append():
+            self._appended = True
+            committed = read_counts(self.path, BM25_COUNT_FILE)
+            new_vocab = "".join(term + "\n" for term in self.vocab[committed["terms"]:]).encode("utf-8")
+            with open(self._file(BM25_VOCAB_FILE), "r+b") as f:
+                # Drop terms an interrupted writer appended but never committed
+                f.truncate(committed["vocab_bytes"])
+                f.seek(0, os.SEEK_END)
+                f.write(new_vocab)
+            
+            entries = int(self.base.offsets[-1])
+            append_array(self._file(BM25_TERMS_FILE), entries, terms)
+            append_array(self._file(BM25_FREQS_FILE), entries, freqs)
+            append_array(self._file(BM25_OFFSETS_FILE), len(self.base) + 1, offsets + entries)
+            return [stage_counts(self.path, BM25_COUNT_FILE, {
+                "chunks": len(self.base) + len(offsets),
+                "terms": len(self.vocab),
+                "vocab_bytes": committed["vocab_bytes"] + len(new_vocab)
+            })]
+        
+        base_offsets, base_terms, base_freqs = self._base_entries()
+        all_offsets = np.concatenate([base_offsets, offsets + base_offsets[-1]])
+        
+        vocab = "".join(term + "\n" for term in self.vocab).encode("utf-8")
+        with open(self._tmp(BM25_VOCAB_FILE), "wb") as f:
+            f.write(vocab)
+        np.concatenate([base_terms, terms]).tofile(self._tmp(BM25_TERMS_FILE))
+        np.concatenate([base_freqs, freqs]).tofile(self._tmp(BM25_FREQS_FILE))
+        all_offsets.tofile(self._tmp(BM25_OFFSETS_FILE))
+        
+        # Without a count file readers take the files whole while they are
+        # replaced; the offsets file marks a complete index (see exists()), so
+        # it goes last
+        names = (BM25_VOCAB_FILE, BM25_TERMS_FILE, BM25_FREQS_FILE, BM25_OFFSETS_FILE)
+        steps = [("remove", BM25_COUNT_FILE)] + [("replace", name) for name in names]
+        steps.append(stage_counts(self.path, BM25_COUNT_FILE, {
+            "chunks": len(all_offsets) - 1,
+            "terms": len(self.vocab),
+            "vocab_bytes": len(vocab)
+        }))
+        return steps
+    
+    def commit(self):
+        """Make the written entries the committed ones, atomically"""
+        commit_files(self.path, self.stage())
+    
+    def load(self, limit=None):
+        """
+        Open the index once the staged files are committed
+        
+        When the new entries were appended, the base's postings are extended
+        with them instead of inverting every entry again.
+        
+        Args:
+            limit (int, optional): As for BM25Index.load()
+        """
+        return BM25Index.load(self.path, limit, base=self.base if self._appended else None)
+    
+    def close(self):
+        """Discard the temporary files if they were not staged for a commit"""
+        if self._staged:
+            return
+        
+        for name in (BM25_VOCAB_FILE, BM25_TERMS_FILE, BM25_FREQS_FILE, BM25_OFFSETS_FILE):
+            try:
+                os.remove(self._tmp(name))
+            except FileNotFoundError:
+                pass
\ No newline at end of file
@@ -0,0 +1,201 @@
+"""
+Background warm-up and import-time reporting
+
+Usage:
+    python -m core.startup              # import-time report
+    python -m core.startup --check      # ... failing above IMPORT_TIME_BUDGET
+"""
+import argparse
+import logging
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from .config import IMPORT_TIME_BUDGET
+
+logger = logging.getLogger(__name__)
+
+# What each entry point imports before it can do anything
+REPORT_STATEMENTS = {
+    "core": "import core",
+    "app": (
+        "from core import validate_env, stream_user_question, submit_ingest_job, get_job, "
+        "list_jobs, list_sources, get_metrics, get_recent_traces, render_prometheus, "
+        "profile_next_request, start_warmup, get_warmup_status; "
+        "from core.jobs import ACTIVE_STATES, SUCCEEDED"
+    ),
+    "server": "from core import process_user_question, process_documents"
+}
+
+_IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+_warmup_lock = threading.Lock()
+_warmup_thread = None
+_warmup_status = {"state": "idle", "steps": {}}
+
+def _warm_step(name, func):
+    """Run one warm-up step, recording how long it took or why it failed"""
+    from .metrics import span
+    
+    started = time.perf_counter()
+    step = {}
+    try:
+        with span(f"warmup.{name}"):
+            outcome = func()
+        if outcome:
+            step["note"] = outcome
+    except Exception as e:
+        logger.warning("Warm-up step %s failed: %s", name, e)
+        step["error"] = str(e)
+    step["seconds"] = time.perf_counter() - started
+    
+    with _warmup_lock:
+        _warmup_status["steps"][name] = step
+
+def _warm_up(agents):
+    def import_modules():
+        from . import chat_service, llm_chain, vector_store
+    
+    def load_embedding_model():
+        from .embeddings import get_embeddings
+        # The first call also initializes the model's kernels
+        get_embeddings().embed_query("warm-up")
+    
+    def build_chain():
+        from .llm_chain import get_conversational_chain
+        get_conversational_chain()
+    
+    def open_index(agent):
+        from .vector_store import get_index_version, get_vector_store
+        if get_index_version(agent) is None:
+            return "No index yet"
+        get_vector_store(agent).get_sparse_index()
+    
+    _warm_step("imports", import_modules)
+    _warm_step("embedding_model", load_embedding_model)
+    _warm_step("llm_chain", build_chain)
+    for agent in agents:
+        _warm_step(f"index:{agent or 'default'}", lambda: open_index(agent))
+    
+    with _warmup_lock:
+        _warmup_status["state"] = "done"
+
+def start_warmup(agents=(None,)):
+    """
+    Preload the embedding model, LLM chain and indexes in the background
+    
+    Call it once the first page has been rendered: the first question then
+    finds everything loaded instead of paying for it. Only the first call
+    per process starts a warm-up; later calls return immediately.
+    
+    Args:
+        agents: Agents whose indexes to open (None is the default index)
+    """
+    global _warmup_thread
+    
+    with _warmup_lock:
+        if _warmup_thread is not None:
+            return
+        _warmup_status["state"] = "running"
+        _warmup_thread = threading.Thread(
+            target=_warm_up,
+            args=(list(agents),),
+            name="warm-up",
+            daemon=True
+        )
+        _warmup_thread.start()
+
+def get_warmup_status():
+    """
+    Get the progress of the background warm-up
+    
+    Returns:
+        dict: 'state' ('idle', 'running' or 'done') and the 'steps' run so
+            far with their 'seconds' and any 'error'
+    """
+    with _warmup_lock:
+        return {
+            "state": _warmup_status["state"],
+            "steps": {name: dict(step) for name, step in _warmup_status["steps"].items()}
+        }
+
+def import_time_report(statement="import core", top=15):
+    """
+    Measure what a statement imports, in a fresh interpreter
+    
+    Uses `python -X importtime`, so the numbers match a cold worker start.
+    
+    Args:
+        statement (str): Python code to time, e.g. 'import core'
+        top (int): Number of slowest top-level imports to list
+    
+    Returns:
+        dict: 'seconds' the statement took, 'modules' imported and the
+            'slowest' top-level imports as (module, cumulative seconds)
+    
+    Raises:
+        RuntimeError: If the statement fails
+    """
+    code = f"import time; _t = time.perf_counter(); {statement}; print(time.perf_counter() - _t)"
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"{statement!r} failed:\n{proc.stderr[-2000:]}")
+    
+    modules = 0
+    top_level = []
+    for line in proc.stderr.splitlines():
+        match = _IMPORT_TIME_LINE.match(line)
+        if not match:
+            continue
+        modules += 1
+        _, cumulative_us, indent, module = match.groups()
+        # Nested imports are indented under the module that triggered them
+        if len(indent) <= 1:
+            top_level.append((module, int(cumulative_us) / 1e6))
+    
+    return {
+        "seconds": float(proc.stdout.strip().splitlines()[-1]),
+        "modules": modules,
+        "slowest": sorted(top_level, key=lambda item: item[1], reverse=True)[:top]
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report import times of the core package")
+    parser.add_argument("--statement", action="append", help="Code to time (repeatable)")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help=f"Exit with an error if a statement takes longer than IMPORT_TIME_BUDGET ({IMPORT_TIME_BUDGET}s)"
+    )
+    args = parser.parse_args(argv)
+    
+    statements = (
+        {statement: statement for statement in args.statement}
+        if args.statement else REPORT_STATEMENTS
+    )
+    
+    over_budget = []
+    for label, statement in statements.items():
+        report = import_time_report(statement, top=args.top)
+        print(f"{label}: {statement}")
+        print(f"  {report['seconds']:.3f}s, {report['modules']} modules")
+        for module, seconds in report["slowest"]:
+            print(f"  {seconds:8.3f}s  {module}")
+        if report["seconds"] > IMPORT_TIME_BUDGET:
+            over_budget.append(label)
+    
+    if args.check and over_budget:
+        print(f"Over the {IMPORT_TIME_BUDGET}s import budget: {', '.join(over_budget)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
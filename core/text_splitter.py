@@ -1,9 +1,83 @@
 """
 Text chunking functionality
 """
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+import hashlib
+import re
+from collections import namedtuple
 from .config import CHUNK_SIZE, CHUNK_OVERLAP
 
+# Split points, best first: paragraph, line, sentence, word
+SEPARATORS = ("\n\n", "\n", ". ", " ")
+
+_NON_SPACE = re.compile(r"\S")
+_WORD_START = re.compile(r"(?<=\s)\S")
+
+# A chunk and where it came from: character offsets [start, end) into the
+# text of one page, and the content hash that identifies it in the index
+Chunk = namedtuple("Chunk", ["text", "source", "page", "start", "end", "hash"])
+
+def content_hash(text):
+    """
+    Get the content hash used as the document ID of a chunk
+    
+    Args:
+        text (str): Chunk text
+    
+    Returns:
+        str: Hex sha256 digest of the text
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def make_chunk(text, source, page=None, start=0):
+    """Build the record of a chunk starting at an offset of its page"""
+    return Chunk(text, source, page, start, start + len(text), content_hash(text))
+
+def chunk_offsets(text, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """
+    Find the chunks of a text in one pass, as character offsets
+    
+    Each chunk ends at the best separator in the second half of its
+    chunk_size window (paragraph, then line, sentence and word breaks), and
+    the next one starts about chunk_overlap characters earlier, at a word
+    boundary. Every window is scanned once, so the cost is linear in the
+    length of the text.
+    
+    Args:
+        text (str): Text to split
+        chunk_size (int): Maximum characters per chunk
+        chunk_overlap (int): Characters shared with the previous chunk
+    
+    Yields:
+        tuple: (start, end) of each chunk, without surrounding whitespace
+    """
+    length = len(text)
+    match = _NON_SPACE.search(text)
+    start = match.start() if match else length
+    
+    while start < length:
+        end = min(start + chunk_size, length)
+        if end < length:
+            floor = start + chunk_size // 2
+            for separator in SEPARATORS:
+                cut = text.rfind(separator, floor, end)
+                if cut != -1:
+                    end = cut + len(separator)
+                    break
+        
+        stop = end
+        while stop > start and text[stop - 1].isspace():
+            stop -= 1
+        yield start, stop
+        
+        if end >= length:
+            break
+        
+        next_start = max(end - chunk_overlap, start + 1)
+        match = _WORD_START.search(text, next_start, end)
+        if match is None:
+            match = _NON_SPACE.search(text, end)
+        start = match.start() if match else length
+
 def split_text_into_chunks(text):
     """
     Split text into smaller chunks for embedding
@@ -14,10 +88,22 @@ def split_text_into_chunks(text):
     Returns:
         list: List of text chunks
     """
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=CHUNK_SIZE,
-        chunk_overlap=CHUNK_OVERLAP
-    )
+    return [text[start:end] for start, end in chunk_offsets(text)]
+
+def iter_text_chunks(pages):
+    """
+    Split a stream of pages into chunk records, one page at a time
+    
+    Chunks do not span pages, so each one has a single page and offsets
+    into that page's text, and only one page is held at a time.
     
-    chunks = text_splitter.split_text(text)
-    return chunks
\ No newline at end of file
+    Args:
+        pages: Iterable of (source, page_number, text) tuples, page_number
+            None for text that has no pages
+    
+    Yields:
+        Chunk: Each chunk with its source, page, offsets and hash
+    """
+    for source, page, text in pages:
+        for start, end in chunk_offsets(text):
+            yield make_chunk(text[start:end], source, page, start)
@@ -0,0 +1,35 @@
+"""
+Cheap token estimates for prompt budgeting
+"""
+from .config import CHARS_PER_TOKEN
+
+def estimate_tokens(text):
+    """
+    Estimate the number of tokens in a text
+    
+    Counting with the real tokenizer costs more than the estimate is
+    worth; about four characters per token holds well for English text.
+    
+    Args:
+        text (str): Text to measure
+    
+    Returns:
+        int: Estimated token count
+    """
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def truncate_to_tokens(text, max_tokens):
+    """
+    Cut a text down to roughly max_tokens tokens
+    
+    Args:
+        text (str): Text to truncate
+        max_tokens (int): Token budget
+    
+    Returns:
+        str: The text, shortened with a trailing '...' if it did not fit
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    return text[:max(0, max_chars - 3)] + "..."
@@ -1,66 +1,1109 @@
 """
 FAISS vector store operations
 """
+import asyncio
+import contextvars
+import json
+import logging
 import os
-from langchain_community.vectorstores import FAISS
+import pickle
+import shutil
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import faiss
+import numpy as np
+from . import ann
+from .cache import LRUCache
+from .chunk_store import COMMIT_FILE, ChunkStore, ChunkWriter, append_array, commit_files, replay_commit
 from .embeddings import get_embeddings
-from .config import FAISS_INDEX_PATH
+from .manifest import (
+    AGENT_FILE,
+    index_path,
+    list_agents,
+    list_sources,
+    read_sources,
+    stage_sources
+)
+from .metrics import span
+from .query_batcher import get_query_batcher
+from .sparse_index import BM25Index, BM25Writer
+from .text_splitter import make_chunk
+from .config import (
+    VECTOR_STORE_POOL_MAX_STORES,
+    VECTOR_STORE_POOL_MAX_BYTES,
+    RETRIEVAL_MODE,
+    HYBRID_CANDIDATES,
+    RRF_K,
+    SEARCH_WORKER_THREADS,
+    QUERY_EMBEDDING_CACHE_SIZE,
+    SEARCH_RESULTS_CACHE_SIZE,
+    VECTOR_QUANTIZATION,
+    RERANK_CANDIDATES,
+    FILTER_EXACT_MAX_CHUNKS,
+    FILTER_EXACT_MAX_SHARE,
+    FILTER_CACHE_SIZE
+)
 
-def create_vector_store(text_chunks):
+# File inside the index directory holding the FAISS index itself
+INDEX_FILE = "index.faiss"
+
+# Pickled docstore written by LangChain's FAISS wrapper, converted on first load
+LEGACY_DOCSTORE_FILE = "index.pkl"
+
+# File inside the index directory holding a counter bumped on every write
+INDEX_VERSION_FILE = "version"
+
+# BM25 index written as one JSON file by older versions, dropped on the next
+# write (the BM25 files are named in sparse_index)
+LEGACY_SPARSE_INDEX_FILE = "bm25.json"
+
+# File inside the index directory holding the full precision vectors of a
+# quantized index, in position order, for re-ranking and rebuilding
+FULL_VECTORS_FILE = "vectors.f32"
+
+# Source name used when chunks are added without one
+DEFAULT_SOURCE = "unknown"
+
+logger = logging.getLogger(__name__)
+
+# Per index directory locks: writers of one index are serialized (readers
+# keep using the pooled store meanwhile) and a store is loaded only once.
+# Reentrant, since a writer opens the store it adds to while holding its lock.
+_locks_guard = threading.Lock()
+_write_locks = {}
+_load_locks = {}
+
+# Process-wide pool of opened vector stores, keyed by index directory and
+# shared by all sessions; least recently used first
+_pool_lock = threading.Lock()
+_pool = OrderedDict()
+_pool_stats = {"hits": 0, "reloads": 0, "evictions": 0}
+
+# Query embeddings depend only on the model; search results also depend on
+# the index and are keyed by its directory and version
+_query_embedding_cache = LRUCache(QUERY_EMBEDDING_CACHE_SIZE)
+_search_results_cache = LRUCache(SEARCH_RESULTS_CACHE_SIZE)
+
+# Threads that run query embedding and FAISS search for async callers,
+# keeping that CPU work off the event loop
+_search_executor = ThreadPoolExecutor(
+    max_workers=SEARCH_WORKER_THREADS,
+    thread_name_prefix="vector-search"
+)
+
+class VectorStore:
+    """An opened index snapshot: the FAISS index and the chunks at its positions"""
+    
+    def __init__(self, path, index, chunks, version):
+        self.path = path
+        self.index = index
+        self.chunks = chunks
+        self.version = version
+        self.full_vectors = _load_full_vectors(path, index)  # Quantized indexes only
+        self.footprint = None
+        
+        self._sparse_index = None  # Loaded on first hybrid search
+        self._sparse_lock = threading.Lock()
+        
+        self._manifest = None  # Read on first filter by source
+        self._filters = LRUCache(FILTER_CACHE_SIZE)
+    
+    def get_sparse_index(self):
+        """Get the BM25 index of this snapshot, loading it on first use"""
+        with self._sparse_lock:
+            loaded = self._sparse_index is None
+            if loaded:
+                self._sparse_index = _load_sparse_index(self)
+        
+        if loaded:
+            # The pool is now holding more memory than it accounted for
+            _enforce_pool_limits()
+        return self._sparse_index
+    
+    def set_sparse_index(self, sparse_index):
+        """Use a BM25 index already in memory (the one a writer just saved)"""
+        with self._sparse_lock:
+            self._sparse_index = sparse_index
+    
+    def get_filter(self, source=None, pages=None):
+        """
+        Get the chunks matching a filter on source and page range
+        
+        Worked out once per filter and snapshot, then kept in memory, so
+        filtered queries only pay for the search itself.
+        
+        Args:
+            source (str, optional): Only chunks of this source
+            pages (tuple, optional): Only chunks on pages (first, last),
+                inclusive; chunks without a page never match
+        
+        Returns:
+            dict: Sorted int64 'positions' and a boolean 'mask' over all
+                positions, or None if neither source nor pages is given
+        """
+        if source is None and pages is None:
+            return None
+        
+        key = (source, pages)
+        matching = self._filters.get(key)
+        if matching is None:
+            mask = np.ones(len(self.chunks), dtype=bool)
+            
+            if source is not None:
+                if self._manifest is None:
+                    self._manifest = read_sources(self.path)
+                in_source = np.zeros(len(self.chunks), dtype=bool)
+                for chunk_hash in self._manifest.get(source, []):
+                    position = self.chunks.position_of(chunk_hash)
+                    if position is not None:
+                        in_source[position] = True
+                mask &= in_source
+            
+            if pages is not None:
+                first, last = pages
+                page_numbers = self.chunks.pages()
+                mask &= (page_numbers >= first) & (page_numbers <= last)
+            
+            matching = {"positions": np.flatnonzero(mask).astype(np.int64), "mask": mask}
+            self._filters.put(key, matching)
+        
+        return matching
+    
+    def memory_bytes(self):
+        """
+        Approximate memory held by this store
+        
+        Counts the index file (resident once searched) and the BM25 postings
+        if they have been loaded. Chunk text is mapped and only read for
+        hits, so it is not counted.
+        """
+        total = self.footprint["index_bytes"] if self.footprint else 0
+        if self._sparse_index is not None:
+            total += self._sparse_index.memory_bytes()
+        return total
+
+def _lock_for(locks, path):
+    """Get the lock of an index directory from a lock table, creating it on first use"""
+    with _locks_guard:
+        lock = locks.get(path)
+        if lock is None:
+            lock = locks[path] = threading.RLock()
+        return lock
+
+def _read_version_counter(path):
+    """Read the write counter stored next to the index (0 if missing)"""
+    try:
+        with open(os.path.join(path, INDEX_VERSION_FILE)) as f:
+            return int(f.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+def _bump_version_counter(path):
+    """Increment the write counter stored next to the index"""
+    version_path = os.path.join(path, INDEX_VERSION_FILE)
+    tmp_path = version_path + ".tmp"
+    
+    with open(tmp_path, "w") as f:
+        f.write(str(_read_version_counter(path) + 1))
+    
+    os.replace(tmp_path, version_path)
+
+def _index_version(path):
+    """Version of the index in a directory (see get_index_version)"""
+    try:
+        stat = os.stat(os.path.join(path, INDEX_FILE))
+    except FileNotFoundError:
+        return None
+    
+    return (_read_version_counter(path), stat.st_mtime_ns, stat.st_size)
+
+def get_index_version(agent=None):
     """
-    Create and save FAISS vector store from text chunks
+    Get the version of the index currently on disk
+    
+    The version combines the write counter with the modification time and
+    size of the index file, so an index replaced by another process is
+    detected as well.
+    
+    Args:
+        agent (str, optional): Agent whose index to check
+    
+    Returns:
+        tuple: Index version, or None if no index has been written yet
+    """
+    return _index_version(index_path(agent))
+
+def _add_to_pool(vector_store):
+    """Make a vector store the pooled one for its directory"""
+    with _pool_lock:
+        _pool[vector_store.path] = vector_store
+        _pool.move_to_end(vector_store.path)
+    _enforce_pool_limits()
+
+def _enforce_pool_limits():
+    """Close least recently used stores until the pool is within its limits"""
+    with _pool_lock:
+        while len(_pool) > 1:
+            total_bytes = sum(store.memory_bytes() for store in _pool.values())
+            within_limits = (
+                len(_pool) <= VECTOR_STORE_POOL_MAX_STORES
+                and total_bytes <= VECTOR_STORE_POOL_MAX_BYTES
+            )
+            if within_limits:
+                break
+            
+            # Searches still holding the store finish on it; it is freed after
+            path, _ = _pool.popitem(last=False)
+            _pool_stats["evictions"] += 1
+            logger.info("Evicted vector store %s from the pool", path)
+
+def _publish_vector_store(path, chunk_writer, sparse_writer):
+    """Make a freshly written snapshot the pooled one, BM25 index included"""
+    # Open the snapshot from disk rather than keeping the writer's copy, so
+    # it is memory-mapped like any other load
+    vector_store = _open_vector_store(path)
+    vector_store.footprint = _index_footprint(vector_store, "Built")
+    if chunk_writer.base is not None and not chunk_writer.skip:
+        vector_store.chunks.share_positions(chunk_writer.base)
+    # Built here rather than by the first hybrid query, from the writer's
+    # base index when the new entries were appended to it
+    vector_store.set_sparse_index(sparse_writer.load(limit=len(vector_store.chunks)))
+    _add_to_pool(vector_store)
+
+def _index_footprint(vector_store, action):
+    """Log and return the memory footprint of the index just written or loaded"""
+    index = vector_store.index
+    index_bytes = os.path.getsize(os.path.join(vector_store.path, INDEX_FILE))
+    footprint = ann.memory_footprint(index, index_bytes)
+    
+    logger.info(
+        "%s FAISS index %s (%s, quantization %s): %d vectors, %.1f MiB, %.1fx smaller than float32",
+        action,
+        vector_store.path,
+        footprint["index_type"],
+        footprint["quantization"],
+        footprint["vectors"],
+        index_bytes / 2 ** 20,
+        footprint["compression"]
+    )
+    return footprint
+
+def _stage_full_vectors(path, vectors, kept=0):
+    """
+    Write the full precision vectors of a quantized index
+    
+    The first kept rows are already in the file (those of the snapshot
+    being added to), so only the rows after them are appended; readers map
+    as many rows as their index holds. Otherwise the file is staged next to
+    the current one.
+    
+    Returns:
+        list: Steps that publish the staged file (see commit_files)
+    """
+    vectors_path = os.path.join(path, FULL_VECTORS_FILE)
+    if kept:
+        append_array(vectors_path, kept * vectors.shape[1], np.ascontiguousarray(vectors[kept:], dtype=np.float32))
+        return []
+    
+    np.ascontiguousarray(vectors, dtype=np.float32).tofile(vectors_path + ".tmp")
+    return [("replace", FULL_VECTORS_FILE)]
+
+def _load_full_vectors(path, index):
+    """
+    Open the full precision vectors of a quantized index as a read-only memmap
+    
+    Rows are only paged in when re-ranking reads them, so they cost disk
+    rather than memory.
+    
+    Returns:
+        np.memmap: Vectors in position order, or None if the index is not
+            quantized or the file is missing or does not match it
+    """
+    if ann.quantization_of(index) is None or not index.ntotal:
+        return None
+    
+    vectors_path = os.path.join(path, FULL_VECTORS_FILE)
+    try:
+        size = os.path.getsize(vectors_path)
+    except FileNotFoundError:
+        return None
+    
+    # Rows past the index's own were appended by a writer that never committed
+    if size < index.ntotal * index.d * 4:
+        logger.warning("Ignoring %s: it does not match the index", FULL_VECTORS_FILE)
+        return None
+    
+    return np.memmap(vectors_path, dtype=np.float32, mode="r", shape=(index.ntotal, index.d))
+
+def _chunk_metadata(chunk):
+    """Metadata stored with a chunk, returned with it by every search"""
+    return {
+        "source": chunk.source,
+        "page": chunk.page,
+        "start": chunk.start,
+        "end": chunk.end,
+        "hash": chunk.hash
+    }
+
+def _chunks_from_texts(text_chunks, sources):
+    """Chunk records for bare texts, whose pages and offsets are unknown"""
+    sources = sources or [DEFAULT_SOURCE] * len(text_chunks)
+    return [make_chunk(text, source) for text, source in zip(text_chunks, sources)]
+
+def _dedupe_chunks(chunks, known_hashes, added_hashes=()):
+    """
+    Drop chunks that are already indexed or repeated within the batch
+    
+    Args:
+        chunks (list): Chunk records
+        known_hashes: Container of hashes already in the index (a
+            ChunkStore looks them up by ID)
+        added_hashes: Container of hashes added since
+    
+    Returns:
+        list: The chunks to embed
+    """
+    new_chunks = []
+    seen = set()
+    
+    for chunk in chunks:
+        if chunk.hash in known_hashes or chunk.hash in added_hashes or chunk.hash in seen:
+            continue
+        
+        seen.add(chunk.hash)
+        new_chunks.append(chunk)
+    
+    return new_chunks
+
+def _record_sources(manifest, chunks):
+    """
+    Add the hash of every chunk to the manifest entry of its source
+    
+    Args:
+        manifest (dict): Source -> hashes, as returned by read_sources()
+        chunks (list): Chunk records
+    
+    Returns:
+        bool: Whether the manifest changed
+    """
+    changed = False
+    for chunk in chunks:
+        hashes = manifest.setdefault(chunk.source, {})
+        if chunk.hash not in hashes:
+            hashes[chunk.hash] = None
+            changed = True
+    return changed
+
+def _read_index(path, writable=False):
+    """
+    Read the FAISS index of the current snapshot
+    
+    For searching, the index is memory-mapped where FAISS supports it for
+    the index type. Writers get a private in-memory copy to modify.
+    """
+    file_path = os.path.join(path, INDEX_FILE)
+    if writable:
+        return faiss.read_index(file_path)
+    
+    mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+    try:
+        return faiss.read_index(file_path, mmap_flag | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        return faiss.read_index(file_path)
+
+def _stage_index(path, index):
+    """Write the FAISS index next to the current one, for commit_files to publish"""
+    faiss.write_index(index, os.path.join(path, INDEX_FILE + ".tmp"))
+    return ("replace", INDEX_FILE)
+
+def _prepare_index_dir(path, agent):
+    """Create an index directory, recording which agent it belongs to"""
+    os.makedirs(path, exist_ok=True)
+    
+    agent_path = os.path.join(path, AGENT_FILE)
+    if agent is not None and not os.path.exists(agent_path):
+        with open(agent_path, "w") as f:
+            json.dump({"name": agent}, f)
+
+def _save_snapshot(path, index, chunk_writer, manifest, sparse_writer, full_vectors=None, full_vectors_kept=0):
+    """
+    Persist a snapshot, then make it the cached one
+    
+    Chunks, BM25 entries and full precision vectors added to the current
+    snapshot are appended to its files past their committed sizes (see
+    ChunkWriter); everything else, the FAISS index included, is staged next
+    to the current files. One commit then publishes it all, the index last
+    (see commit_files), so a crash at any point leaves either the previous
+    snapshot or the new one, never chunks without their vectors.
+    
+    Known limit: FAISS only serializes an index whole, so every save reads
+    and rewrites the full index file even when a few vectors were added.
+    Chunks, BM25 entries and full vectors cost only what was appended.
+    
+    Args:
+        full_vectors_kept (int): Leading rows of full_vectors already in
+            the vectors file
+    """
+    steps = chunk_writer.stage()
+    
+    if ann.quantization_of(index) and full_vectors is not None:
+        steps += _stage_full_vectors(path, full_vectors, full_vectors_kept)
+    else:
+        steps.append(("remove", FULL_VECTORS_FILE))
+    
+    steps += sparse_writer.stage()
+    steps.append(("remove", LEGACY_SPARSE_INDEX_FILE))
+    steps.append(stage_sources(path, manifest))
+    steps.append(_stage_index(path, index))
+    
+    commit_files(path, steps)
+    _bump_version_counter(path)
+    
+    _publish_vector_store(path, chunk_writer, sparse_writer)
+
+def create_vector_store(text_chunks, sources=None, agent=None):
+    """
+    Create and save FAISS vector store from text chunks, replacing any existing index
     
     Args:
         text_chunks (list): List of text chunks to embed
+        sources (list, optional): Source name of each chunk
+        agent (str, optional): Agent whose index to replace
+    """
+    add_chunk_batches([_chunks_from_texts(text_chunks, sources)], replace=True, agent=agent)
+
+def add_to_vector_store(text_chunks, sources=None, agent=None):
+    """
+    Add text chunks to the existing index, embedding only chunks not yet indexed
+    
+    Chunks are identified by their content hash, so re-uploading a document
+    (or a document sharing chunks with one already indexed) only records the
+    new source without embedding anything again. Creates the index if none
+    exists yet.
+    
+    Args:
+        text_chunks (list): List of text chunks to embed
+        sources (list, optional): Source name of each chunk
+        agent (str, optional): Agent whose index to add to
+    
+    Returns:
+        dict: Number of chunks 'added' and 'skipped' as already indexed
+    """
+    return add_chunk_batches([_chunks_from_texts(text_chunks, sources)], agent=agent)
+
+def add_chunk_batches(batches, replace=False, progress_callback=None, agent=None):
+    """
+    Embed and add batches of chunks to the index, saving it once at the end
+    
+    Each batch is embedded and added as soon as it arrives, and its text is
+    streamed to the new snapshot's chunk file, so only one batch of chunk
+    text is held at a time. Queries keep using the previously published
+    snapshot until the new one is saved. With quantization enabled the
+    full precision vectors are kept as well and written next to the index.
+    
+    Each chunk's source, page and offsets are stored as its metadata, so
+    search results carry their provenance without another lookup.
+    
+    Args:
+        batches: Iterable of lists of Chunk records (see text_splitter)
+        replace (bool): Start from an empty index instead of the existing one
+        progress_callback (callable, optional): Called after each batch with
+            the running 'added' and 'skipped' counts
+        agent (str, optional): Agent whose index to add to
+    
+    Returns:
+        dict: Number of chunks 'added' and 'skipped' as already indexed
+    """
+    path = index_path(agent)
+    stats = {"added": 0, "skipped": 0}
+    changed = False
+    
+    with _lock_for(_write_locks, path):
+        _prepare_index_dir(path, agent)
+        _finish_commit(path)
+        
+        if replace or _index_version(path) is None:
+            index = None
+            chunk_writer = ChunkWriter(path)
+            known_hashes = ()
+            sparse_writer = BM25Writer(path)
+            manifest = {}
+            base_vectors = None
+        else:
+            current = get_vector_store(agent)
+            index = _read_index(path, writable=True)
+            chunk_writer = ChunkWriter(path, base=current.chunks)
+            # Looked up by ID, which new snapshots keep extending (see share_positions)
+            known_hashes = current.chunks
+            sparse_writer = BM25Writer(path, base=current.get_sparse_index())
+            manifest = read_sources(path)
+            base_vectors = current.full_vectors
+        
+        embeddings = get_embeddings()
+        new_vectors = []
+        added_hashes = set()
+        
+        try:
+            for chunks in batches:
+                new_chunks = _dedupe_chunks(chunks, known_hashes, added_hashes)
+                
+                if new_chunks:
+                    texts = [chunk.text for chunk in new_chunks]
+                    with span("embed", chunks=len(texts)):
+                        vectors = np.array(embeddings.embed_documents(texts), dtype=np.float32)
+                    with span("index_add", chunks=len(texts)):
+                        if index is None:
+                            index = faiss.IndexFlatL2(vectors.shape[1])
+                        index.add(vectors)
+                    new_vectors.append(vectors)
+                
+                for chunk in new_chunks:
+                    chunk_writer.add(chunk.hash, chunk.text, _chunk_metadata(chunk))
+                    sparse_writer.add(chunk.text)
+                    added_hashes.add(chunk.hash)
+                
+                if _record_sources(manifest, chunks):
+                    changed = True
+                
+                stats["added"] += len(new_chunks)
+                stats["skipped"] += len(chunks) - len(new_chunks)
+                if progress_callback:
+                    progress_callback(dict(stats))
+            
+            if index is not None and changed:
+                full_vectors = None
+                if VECTOR_QUANTIZATION or ann.quantization_of(index):
+                    full_vectors = _collect_full_vectors(index, base_vectors, new_vectors)
+                
+                with span("reindex", vectors=index.ntotal):
+                    index = ann.reindex_if_needed(index, full_vectors)
+                with span("save_snapshot", vectors=index.ntotal):
+                    _save_snapshot(
+                        path,
+                        index,
+                        chunk_writer,
+                        manifest,
+                        sparse_writer,
+                        full_vectors,
+                        full_vectors_kept=len(base_vectors) if base_vectors is not None else 0
+                    )
+        finally:
+            chunk_writer.close()
+            sparse_writer.close()
+    
+    return stats
+
+def _collect_full_vectors(index, base_vectors, new_vectors):
+    """
+    Get the full precision vectors of an index that new vectors were added to
+    
+    Args:
+        index (faiss.Index): Index after adding
+        base_vectors (np.ndarray): Full precision vectors kept for the index
+            before adding, or None if there were none
+        new_vectors (list): Arrays of the vectors added since, in order
+    
+    Returns:
+        np.ndarray: Vectors in position order
+    """
+    if base_vectors is None:
+        # Exact for unquantized indexes; an approximation otherwise
+        return ann.reconstruct_all(index)
+    return np.concatenate([base_vectors] + new_vectors)
+
+def _remove_vectors(index, positions, full_vectors):
+    """
+    Remove vectors from an index by position, keeping the rest in order
+    
+    The flat index removes in place. IVF, HNSW and quantized indexes are
+    rebuilt from their remaining vectors (no re-embedding), since they
+    cannot remove while keeping positions contiguous.
+    
+    Args:
+        index (faiss.Index): Writable index
+        positions (list): Positions to remove
+        full_vectors (np.ndarray): Full precision vectors of the index, or
+            None if the index holds them itself
+    
+    Returns:
+        tuple: (index, full precision vectors of the remaining positions, or
+            None if the index was modified in place)
     """
-    # Ensure storage directory exists
-    os.makedirs(FAISS_INDEX_PATH, exist_ok=True)
+    if ann.supports_remove(index):
+        index.remove_ids(np.array(positions, dtype=np.int64))
+        return index, None
     
-    embeddings = get_embeddings()
+    if full_vectors is None:
+        full_vectors = ann.reconstruct_all(index)
+    kept_vectors = full_vectors[np.setdiff1d(np.arange(index.ntotal), positions)]
     
-    vector_store = FAISS.from_texts(
-        text_chunks,
-        embedding=embeddings
+    rebuilt = ann.build_index(
+        kept_vectors,
+        ann.index_type_of(index),
+        ann.quantization_of(index)
     )
+    return rebuilt, kept_vectors
+
+def delete_source(source, agent=None):
+    """
+    Remove the vectors of one source document from the index
+    
+    Chunks that are shared with another source stay in the index.
     
-    vector_store.save_local(FAISS_INDEX_PATH)
+    Args:
+        source (str): Source name as passed at ingestion time
+        agent (str, optional): Agent whose index to remove it from
+    
+    Returns:
+        int: Number of chunks removed from the index
+    """
+    path = index_path(agent)
+    
+    with _lock_for(_write_locks, path):
+        _finish_commit(path)
+        manifest = read_sources(path)
+        hashes = manifest.pop(source, None)
+        if hashes is None:
+            return 0
+        
+        still_used = {h for other in manifest.values() for h in other}
+        current = get_vector_store(agent)
+        
+        to_delete = {}  # hash -> position
+        for chunk_hash in hashes:
+            position = current.chunks.position_of(chunk_hash)
+            if chunk_hash not in still_used and position is not None:
+                to_delete[chunk_hash] = position
+        
+        index = _read_index(path, writable=True)
+        full_vectors = current.full_vectors
+        if to_delete:
+            index, full_vectors = _remove_vectors(index, sorted(to_delete.values()), full_vectors)
+        
+        chunk_writer = ChunkWriter(path, base=current.chunks, skip=to_delete.values())
+        sparse_writer = BM25Writer(path, base=current.get_sparse_index(), skip=to_delete.values())
+        try:
+            _save_snapshot(path, index, chunk_writer, manifest, sparse_writer, full_vectors)
+        finally:
+            chunk_writer.close()
+            sparse_writer.close()
+    
+    return len(to_delete)
 
-def load_vector_store():
+def delete_agent(agent):
     """
-    Load existing FAISS vector store
+    Delete an agent's index and drop it from the pool
+    
+    Args:
+        agent (str): Agent name
+    """
+    path = index_path(agent)
+    
+    with _lock_for(_write_locks, path):
+        with _pool_lock:
+            _pool.pop(path, None)
+        shutil.rmtree(path, ignore_errors=True)
+
+def load_vector_store(agent=None):
+    """
+    Open the snapshot on disk
+    
+    The index and chunk files are memory-mapped rather than read, so this
+    is fast and light whatever the corpus size; chunk text is only read
+    for search hits.
+    
+    Args:
+        agent (str, optional): Agent whose index to open
     
     Returns:
-        FAISS: Loaded vector store
+        VectorStore: Opened vector store
     
     Raises:
-        Exception: If vector store cannot be loaded
+        FileNotFoundError: If no index has been created yet
     """
-    embeddings = get_embeddings()
+    path = index_path(agent)
+    _finish_commit(path)
+    return _open_vector_store(path)
+
+def _finish_commit(path):
+    """Finish a commit whose writer stopped midway (see commit_files)"""
+    if not os.path.exists(os.path.join(path, COMMIT_FILE)):
+        return
     
-    if not os.path.exists(FAISS_INDEX_PATH):
+    with _lock_for(_write_locks, path):
+        if replay_commit(path):
+            _bump_version_counter(path)
+
+def _open_vector_store(path):
+    """Open the snapshot in an index directory (see load_vector_store)"""
+    version = _index_version(path)
+    if version is None:
         raise FileNotFoundError(
             "FAISS index not found. Please upload and process PDFs first."
         )
     
-    vector_store = FAISS.load_local(
-        FAISS_INDEX_PATH,
-        embeddings,
-        allow_dangerous_deserialization=True
+    if not ChunkStore.exists(path):
+        _migrate_legacy_docstore(path)
+    
+    index = _read_index(path)
+    ann.apply_search_params(index)
+    
+    # Chunks past the index's vectors belong to a commit in progress
+    return VectorStore(path, index, ChunkStore(path, limit=index.ntotal), version)
+
+def _migrate_legacy_docstore(path):
+    """
+    Convert the pickled docstore of an index saved by LangChain's FAISS wrapper
+    
+    Runs once per index: the pickle is only trusted because this app wrote
+    it, and is deleted once the chunk files exist. The index file itself is
+    plain FAISS and is used as is.
+    """
+    pickle_path = os.path.join(path, LEGACY_DOCSTORE_FILE)
+    with open(pickle_path, "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    
+    chunk_writer = ChunkWriter(path)
+    try:
+        for position in range(len(index_to_docstore_id)):
+            doc_id = index_to_docstore_id[position]
+            doc = docstore.search(doc_id)
+            chunk_writer.add(doc_id, doc.page_content, doc.metadata)
+        chunk_writer.commit()
+    finally:
+        chunk_writer.close()
+    
+    os.remove(pickle_path)
+    logger.info("Converted %d chunks from %s", len(index_to_docstore_id), LEGACY_DOCSTORE_FILE)
+
+def _load_sparse_index(vector_store):
+    """Load the BM25 index stored with the index, or build it from the chunks"""
+    chunks = vector_store.chunks
+    if BM25Index.exists(vector_store.path):
+        sparse_index = BM25Index.load(vector_store.path, limit=len(chunks))
+        if len(sparse_index) == len(chunks):
+            return sparse_index
+    
+    # Index written before hybrid search existed, or with the older JSON
+    # BM25 file; the next write stores the rebuilt one
+    return BM25Index.from_texts(chunks.get(position).page_content for position in range(len(chunks)))
+
+def get_vector_store(agent=None):
+    """
+    Get the pooled vector store of an agent, opening it if the index changed
+    
+    Args:
+        agent (str, optional): Agent whose index to get
+    
+    Returns:
+        VectorStore: Opened vector store
+    
+    Raises:
+        FileNotFoundError: If no index has been created yet
+    """
+    path = index_path(agent)
+    _finish_commit(path)
+    
+    version = _index_version(path)
+    if version is None:
+        raise FileNotFoundError(
+            "FAISS index not found. Please upload and process PDFs first."
+        )
+    
+    with _pool_lock:
+        vector_store = _pool.get(path)
+        if vector_store is not None and vector_store.version == version:
+            _pool.move_to_end(path)
+            _pool_stats["hits"] += 1
+            return vector_store
+    
+    # Opening happens under the directory's lock so concurrent sessions wait
+    # for a single open, while other agents are served meanwhile
+    with _lock_for(_load_locks, path):
+        with _pool_lock:
+            vector_store = _pool.get(path)
+            if vector_store is not None and vector_store.version == version:
+                _pool.move_to_end(path)
+                return vector_store
+        
+        vector_store = _open_vector_store(path)
+        vector_store.footprint = _index_footprint(vector_store, "Loaded")
+        with _pool_lock:
+            _pool_stats["reloads"] += 1
+        _add_to_pool(vector_store)
+        return vector_store
+
+def invalidate_vector_store_cache():
+    """Drop every pooled vector store so the next search reopens it"""
+    with _pool_lock:
+        _pool.clear()
+    _search_results_cache.clear()
+
+def get_vector_store_stats():
+    """
+    Get pool counters for the vector stores
+    
+    Returns:
+        dict: 'hits', 'reloads' and 'evictions' of the pool, the number of
+            'loaded' stores and their 'memory_bytes', the 'stores' by index
+            directory with their 'version' and 'memory' footprint, plus the
+            counters of the 'query_embeddings' and 'search_results' caches
+    """
+    with _pool_lock:
+        stores = {
+            path: {"version": store.version, "memory": store.footprint}
+            for path, store in _pool.items()
+        }
+        return {
+            "hits": _pool_stats["hits"],
+            "reloads": _pool_stats["reloads"],
+            "evictions": _pool_stats["evictions"],
+            "loaded": len(_pool),
+            "memory_bytes": sum(store.memory_bytes() for store in _pool.values()),
+            "stores": stores,
+            "query_embeddings": _query_embedding_cache.get_stats(),
+            "search_results": _search_results_cache.get_stats()
+        }
+
+def get_ann_report(num_queries=100, k=4, agent=None):
+    """
+    Report recall and latency of the current index against exact search
+    
+    Runs on a copy of the index, so searches in progress are unaffected.
+    For quantized indexes, recall with full precision re-ranking is
+    reported too.
+    
+    Args:
+        num_queries (int): Number of sample queries
+        k (int): Neighbours per query
+        agent (str, optional): Agent whose index to measure
+    
+    Returns:
+        dict: Report from ann.recall_report, plus the index 'memory' footprint
+    """
+    vector_store = get_vector_store(agent)
+    full_vectors = vector_store.full_vectors
+    
+    report = ann.recall_report(
+        _read_index(vector_store.path, writable=True),
+        num_queries=num_queries,
+        k=k,
+        vectors=full_vectors,
+        rerank_candidates=RERANK_CANDIDATES if full_vectors is not None else 0
     )
+    report["memory"] = vector_store.footprint
+    return report
+
+def normalize_query(query):
+    """
+    Normalize a query for cache lookups (Unicode form and whitespace)
+    
+    Case is kept: cased embedding models give "Apple" and "apple" different
+    embeddings. NFC only merges canonically equivalent spellings of the same
+    characters, and tokenizers split on whitespace runs anyway, so neither
+    changes what the model sees.
+    
+    Args:
+        query (str): Query text
+    
+    Returns:
+        str: Normalized query
+    """
+    return " ".join(unicodedata.normalize("NFC", query).split())
+
+def embed_query(query):
+    """
+    Embed a query, reusing the embedding of an identical earlier query
+    
+    With query batching enabled the model call is shared with other
+    queries embedded at the same time.
+    
+    Args:
+        query (str): Query text
+    
+    Returns:
+        list: Query embedding
+    """
+    normalized = normalize_query(query)
+    
+    embedding = _query_embedding_cache.get(normalized)
+    if embedding is None:
+        batcher = get_query_batcher()
+        with span("embed_query", batched=batcher is not None):
+            if batcher is not None:
+                embedding = batcher.embed(normalized)
+            else:
+                embedding = get_embeddings().embed_query(normalized)
+        _query_embedding_cache.put(normalized, embedding)
+    
+    return embedding
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """
+    Merge ranked lists of IDs with reciprocal rank fusion
+    
+    Each list contributes 1 / (k + rank) for every ID it contains, so IDs
+    ranked well by several retrievers rise to the top without having to
+    compare their raw scores.
+    
+    Args:
+        rankings (list): Lists of IDs, best first
+        k (int): Damping constant (60 is the usual choice)
+    
+    Returns:
+        list: IDs ordered by fused score, best first
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    
+    return sorted(scores, key=scores.get, reverse=True)
+
+def _dense_search_positions(vector_store, embedding, k, matching=None):
+    """
+    Get the positions of the k nearest chunks to an embedding
+    
+    A quantized index only approximates distances, so it is asked for
+    RERANK_CANDIDATES times more candidates, which are then re-scored
+    against their full precision vectors.
+    
+    With a filter, chunks outside it are never looked at: a subset that
+    is small, or a small share of the index, is compared exactly; a larger
+    one is searched through the index with a selector, widened by how
+    selective the filter is (see ann.search_subset). Indexes that reject
+    selectors (flat PQ) compare the subset exactly whatever its size.
+    """
+    query = np.array([embedding], dtype=np.float32)
+    index = vector_store.index
+    
+    full_vectors = vector_store.full_vectors
+    rerank = full_vectors is not None and RERANK_CANDIDATES > 0
+    candidates = k * RERANK_CANDIDATES if rerank else k
+    
+    with span("dense_search", vectors=index.ntotal) as stage:
+        if matching is None:
+            _, indices = index.search(query, candidates)
+            positions = [int(i) for i in indices[0] if i != -1]
+        else:
+            subset = matching["positions"]
+            stage["filtered"] = len(subset)
+            comparable = full_vectors is not None or ann.supports_reconstruct(index)
+            small = (
+                len(subset) <= FILTER_EXACT_MAX_CHUNKS
+                or len(subset) <= FILTER_EXACT_MAX_SHARE * index.ntotal
+            )
+            if comparable and (small or not ann.supports_selector(index)):
+                positions = ann.exact_search(index, query[0], subset, k, full_vectors)
+                rerank = False  # Already exact
+            else:
+                positions = ann.search_subset(index, query, subset, candidates)
+        
+        if rerank:
+            positions = ann.rerank(full_vectors, query[0], positions, k)
+    
+    return positions
+
+def _dense_search(vector_store, embedding, k, matching=None):
+    """Search with FAISS only"""
+    return [
+        vector_store.chunks.get(position)
+        for position in _dense_search_positions(vector_store, embedding, k, matching)
+    ]
+
+def _hybrid_search(vector_store, query, k, matching=None):
+    """Search with both FAISS and BM25 and fuse the two rankings"""
+    candidates = max(k, HYBRID_CANDIDATES)
+    chunks = vector_store.chunks
+    
+    mask = matching["mask"] if matching is not None else None
+    
+    dense_positions = _dense_search_positions(vector_store, embed_query(query), candidates, matching)
+    with span("sparse_search"):
+        sparse_positions = [
+            position
+            for position, _ in vector_store.get_sparse_index().search(query, candidates, mask=mask)
+        ]
     
-    return vector_store
+    fused = reciprocal_rank_fusion([dense_positions, sparse_positions])
+    return [chunks.get(position) for position in fused[:k]]
 
-def search_similar_documents(query, k=4):
+def _page_range(pages):
+    """Validate a (first, last) page range"""
+    if pages is None:
+        return None
+    
+    try:
+        first, last = (int(page) for page in pages)
+    except (TypeError, ValueError):
+        raise ValueError(f"Page range must be (first, last), got {pages!r}")
+    if first > last:
+        raise ValueError(f"Page range starts after it ends: {pages!r}")
+    return first, last
+
+def search_similar_documents(query, k=4, mode=RETRIEVAL_MODE, agent=None, source=None, pages=None):
     """
     Search for similar documents in the vector store
     
     Args:
         query (str): Query text
         k (int): Number of similar documents to return
+        mode (str): 'dense' for FAISS similarity only, or 'hybrid' to fuse
+            it with BM25 so exact identifiers are found too
+        agent (str, optional): Agent whose index to search
+        source (str, optional): Only search the chunks of this source file
+        pages (tuple, optional): Only search chunks on pages (first, last)
+    
+    Returns:
+        list: List of similar documents
+    """
+    if mode not in ("dense", "hybrid"):
+        raise ValueError(f"Unknown retrieval mode: {mode}")
+    pages = _page_range(pages)
+    
+    vector_store = get_vector_store(agent)
+    
+    cache_key = (normalize_query(query), k, mode, source, pages, vector_store.path, vector_store.version)
+    docs = _search_results_cache.get(cache_key)
+    if docs is None:
+        matching = vector_store.get_filter(source, pages)
+        if matching is not None and not len(matching["positions"]):
+            docs = []
+        elif mode == "hybrid":
+            docs = _hybrid_search(vector_store, query, k, matching)
+        else:
+            docs = _dense_search(vector_store, embed_query(query), k, matching)
+        _search_results_cache.put(cache_key, docs)
+    
+    return list(docs)
+
+async def asearch_similar_documents(query, k=4, mode=RETRIEVAL_MODE, agent=None, source=None, pages=None):
+    """
+    Search for similar documents without blocking the event loop
+    
+    Args:
+        query (str): Query text
+        k (int): Number of similar documents to return
+        mode (str): 'dense' or 'hybrid' (see search_similar_documents)
+        agent (str, optional): Agent whose index to search
+        source (str, optional): Only search the chunks of this source file
+        pages (tuple, optional): Only search chunks on pages (first, last)
     
     Returns:
         list: List of similar documents
     """
-    vector_store = load_vector_store()
-    docs = vector_store.similarity_search(query, k=k)
-    return docs
\ No newline at end of file
+    loop = asyncio.get_running_loop()
+    # Run in a copy of this task's context so search stages join its request
+    return await loop.run_in_executor(
+        _search_executor,
+        contextvars.copy_context().run,
+        search_similar_documents,
+        query,
+        k,
+        mode,
+        agent,
+        source,
+        pages
+    )
\ No newline at end of file
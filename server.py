@@ -0,0 +1,283 @@
+"""
+Headless HTTP API for the chat and ingestion services
+
+Endpoints (JSON in and out):
+    GET    /health
+    POST   /query     {"question", "session_id"?, "agent"?, "max_history"?,
+                       "source"?, "pages"?: [first, last]}
+    POST   /ingest    {"files"?: [{"name", "data" (base64 PDF)}], "text"?, "agent"?, "append"?}
+    GET    /history   ?session_id=&page_size=&before_id=
+    DELETE /history   ?session_id=
+    GET    /sources   ?agent=
+    GET    /metrics   (Prometheus text)
+
+Usage:
+    python server.py --host 0.0.0.0 --port 8000
+"""
+import argparse
+import base64
+import binascii
+import io
+import json
+import logging
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from core import (
+    validate_env,
+    process_user_question,
+    process_documents,
+    get_history_page,
+    clear_history,
+    flush_messages,
+    list_sources,
+    render_prometheus
+)
+from core.config import (
+    DEFAULT_SESSION_ID,
+    DEFAULT_MAX_HISTORY,
+    MAX_HISTORY_LIMIT,
+    SERVER_HOST,
+    SERVER_PORT,
+    SERVER_MAX_BODY_BYTES
+)
+from core.query_batcher import enable_query_batching
+from core.startup import start_warmup
+
+logger = logging.getLogger("server")
+
+class RequestError(Exception):
+    """A request the client has to fix, answered with a 4xx status"""
+    
+    def __init__(self, message, status=HTTPStatus.BAD_REQUEST):
+        super().__init__(message)
+        self.status = status
+
+class UploadedFile(io.BytesIO):
+    """Decoded upload with a name, like the files Streamlit hands over"""
+    
+    def __init__(self, name, data):
+        super().__init__(data)
+        self.name = name
+
+def _decode_files(files):
+    """Turn [{'name', 'data'}] with base64 data into file objects"""
+    if not isinstance(files, list):
+        raise RequestError("'files' must be a list")
+    
+    uploads = []
+    for i, item in enumerate(files):
+        try:
+            uploads.append(UploadedFile(item["name"], base64.b64decode(item["data"], validate=True)))
+        except (KeyError, TypeError):
+            raise RequestError(f"files[{i}] needs a 'name' and base64 'data'")
+        except binascii.Error:
+            raise RequestError(f"files[{i}].data is not valid base64")
+    return uploads
+
+def _int_param(value, name, default=None, minimum=None, maximum=None):
+    """Parse an optional integer parameter"""
+    if value is None or value == "":
+        return default
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise RequestError(f"'{name}' must be an integer")
+    if minimum is not None and value < minimum:
+        raise RequestError(f"'{name}' must be at least {minimum}")
+    if maximum is not None and value > maximum:
+        raise RequestError(f"'{name}' must be at most {maximum}")
+    return value
+
+def _page_range(pages):
+    """Parse an optional [first, last] page range"""
+    if pages is None:
+        return None
+    valid = (
+        isinstance(pages, list)
+        and len(pages) == 2
+        and all(isinstance(page, int) and not isinstance(page, bool) for page in pages)
+        and pages[0] <= pages[1]
+    )
+    if not valid:
+        raise RequestError("'pages' must be [first, last] page numbers")
+    return tuple(pages)
+
+def handle_query(body, params):
+    """Answer a question, with the session's recent history as context"""
+    question = body.get("question")
+    if not isinstance(question, str) or not question.strip():
+        raise RequestError("'question' is required")
+    
+    session_id = body.get("session_id") or DEFAULT_SESSION_ID
+    source = body.get("source")
+    if source is not None and not isinstance(source, str):
+        raise RequestError("'source' must be a string")
+    pages = _page_range(body.get("pages"))
+    max_history = _int_param(
+        body.get("max_history"), "max_history", DEFAULT_MAX_HISTORY, minimum=0, maximum=MAX_HISTORY_LIMIT
+    )
+    
+    history = []
+    if max_history:
+        history = get_history_page(session_id, page_size=max_history * 2)["messages"]
+    
+    try:
+        answer = process_user_question(
+            question,
+            conversation_history=history,
+            max_history=max_history,
+            session_id=session_id,
+            agent=body.get("agent"),
+            source=source,
+            pages=pages
+        )
+    except FileNotFoundError:
+        raise RequestError("No documents have been ingested yet", HTTPStatus.NOT_FOUND)
+    
+    return {"answer": answer, "session_id": session_id}
+
+def handle_ingest(body, params):
+    """Index uploaded PDFs and/or text"""
+    uploads = _decode_files(body.get("files") or [])
+    text = body.get("text")
+    if not uploads and not text:
+        raise RequestError("Provide 'files' and/or 'text'")
+    
+    result = process_documents(
+        pdf_files=uploads,
+        text_input=text,
+        append=body.get("append", True),
+        agent=body.get("agent")
+    )
+    if result["error"]:
+        raise RequestError(result["error"], HTTPStatus.UNPROCESSABLE_ENTITY)
+    
+    return {"success": True, "warning": result["warning"]}
+
+def handle_history(body, params):
+    """Read one page of a conversation, newest page first"""
+    return get_history_page(
+        params.get("session_id", DEFAULT_SESSION_ID),
+        page_size=_int_param(params.get("page_size"), "page_size", 50, minimum=1, maximum=1000),
+        before_id=_int_param(params.get("before_id"), "before_id")
+    )
+
+def handle_clear_history(body, params):
+    """Delete a conversation"""
+    session_id = params.get("session_id")
+    if not session_id:
+        raise RequestError("'session_id' is required")
+    clear_history(session_id)
+    return {"cleared": session_id}
+
+def handle_sources(body, params):
+    """List the documents in an agent's index"""
+    return {"sources": list_sources(params.get("agent"))}
+
+# (method, path) -> handler(json body, query parameters)
+ROUTES = {
+    ("GET", "/health"): lambda body, params: {"status": "ok"},
+    ("POST", "/query"): handle_query,
+    ("POST", "/ingest"): handle_ingest,
+    ("GET", "/history"): handle_history,
+    ("DELETE", "/history"): handle_clear_history,
+    ("GET", "/sources"): handle_sources
+}
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """Dispatches requests to ROUTES; each request runs on its own thread"""
+    
+    protocol_version = "HTTP/1.1"
+    
+    def _send(self, status, payload, content_type="application/json"):
+        if content_type == "application/json":
+            payload = json.dumps(payload, default=str)
+        data = payload.encode("utf-8")
+        
+        self.send_response(status)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def _read_body(self):
+        length = _int_param(self.headers.get("Content-Length"), "Content-Length", 0, minimum=0)
+        if length > SERVER_MAX_BODY_BYTES:
+            raise RequestError("Request body too large", HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+        if not length:
+            return {}
+        
+        try:
+            body = json.loads(self.rfile.read(length))
+        except (UnicodeDecodeError, ValueError):
+            raise RequestError("Body must be JSON")
+        if not isinstance(body, dict):
+            raise RequestError("Body must be a JSON object")
+        return body
+    
+    def _dispatch(self, method):
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        
+        if method == "GET" and url.path == "/metrics":
+            self._send(HTTPStatus.OK, render_prometheus(), content_type="text/plain; version=0.0.4")
+            return
+        
+        handler = ROUTES.get((method, url.path))
+        try:
+            if handler is None:
+                if any(path == url.path for _, path in ROUTES):
+                    raise RequestError("Method not allowed", HTTPStatus.METHOD_NOT_ALLOWED)
+                raise RequestError("Not found", HTTPStatus.NOT_FOUND)
+            self._send(HTTPStatus.OK, handler(self._read_body(), params))
+        except RequestError as e:
+            self.close_connection = True  # The body may not have been read
+            self._send(e.status, {"error": str(e)})
+        except Exception as e:
+            logger.exception("%s %s failed", method, url.path)
+            self._send(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)})
+    
+    def do_GET(self):
+        self._dispatch("GET")
+    
+    def do_POST(self):
+        self._dispatch("POST")
+    
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+    
+    def log_message(self, format, *args):
+        logger.info("%s - %s", self.address_string(), format % args)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--no-query-batching", action="store_true", help="Embed each query on its own")
+    args = parser.parse_args(argv)
+    
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    validate_env()
+    
+    # Requests are served on concurrent threads, so their query embeddings
+    # can share model calls
+    if not args.no_query_batching:
+        enable_query_batching()
+    
+    # Load the model and index while the server starts accepting requests
+    start_warmup()
+    
+    server = ThreadingHTTPServer((args.host, args.port), RequestHandler)
+    server.daemon_threads = True
+    logger.info("Serving on http://%s:%d", args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        flush_messages()
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
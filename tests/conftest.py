@@ -0,0 +1,49 @@
+"""
+Shared fixtures: scratch storage and offline fakes for the model and LLM
+"""
+import os
+import sys
+import uuid
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import FakeEmbeddings, fake_chat_model
+
+@pytest.fixture(scope="session", autouse=True)
+def isolated_storage(tmp_path_factory):
+    """
+    Point every storage path of core at a scratch directory
+    
+    Shared by the whole session: the write-behind and job worker threads
+    keep their SQLite connection, so the database must not move between
+    tests. Tests use their own agents and session IDs instead.
+    """
+    from core import database, embeddings, jobs, llm_chain, manifest, vector_store
+    
+    root = tmp_path_factory.mktemp("storage")
+    
+    manifest.FAISS_INDEX_PATH = str(root / "faiss_index")
+    manifest.AGENT_INDEX_ROOT = str(root / "agents")
+    vector_store.invalidate_vector_store_cache()
+    
+    database.DATABASE_PATH = str(root / "chat_history.db")
+    database._schema_ready = False
+    database._local.conn = None
+    
+    jobs.JOB_SPOOL_PATH = str(root / "jobs")
+    
+    embeddings._embeddings_instance = FakeEmbeddings()
+    llm_chain.ChatGroq = fake_chat_model
+    llm_chain.reset_chain()
+    
+    return root
+
+@pytest.fixture
+def agent():
+    """A fresh agent, so every test gets an empty index of its own"""
+    return f"test-{uuid.uuid4().hex[:8]}"
+
+@pytest.fixture
+def session_id():
+    return f"session-{uuid.uuid4().hex[:8]}"
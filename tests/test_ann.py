@@ -0,0 +1,106 @@
+"""
+Index type selection, IVF retraining and recall reports on small corpora
+"""
+import numpy as np
+import pytest
+from core import ann
+from core.config import HNSW_EF_SEARCH, IVF_NPROBE
+
+DIM = 16
+
+def _vectors(count, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, DIM)).astype(np.float32)
+
+@pytest.fixture
+def low_thresholds(monkeypatch):
+    """Switch to HNSW at 100 vectors and to IVF at 1000"""
+    monkeypatch.setattr(ann, "ANN_AUTO_HNSW_MIN_VECTORS", 100)
+    monkeypatch.setattr(ann, "ANN_AUTO_IVF_MIN_VECTORS", 1000)
+
+def test_auto_index_type_follows_corpus_size(low_thresholds):
+    assert ann.choose_index_type(0, "auto") == "flat"
+    assert ann.choose_index_type(99, "auto") == "flat"
+    assert ann.choose_index_type(100, "auto") == "hnsw"
+    assert ann.choose_index_type(999, "auto") == "hnsw"
+    assert ann.choose_index_type(1000, "auto") == "ivf"
+
+def test_explicit_index_type_is_kept_unless_untrainable():
+    assert ann.choose_index_type(10, "hnsw") == "hnsw"
+    assert ann.choose_index_type(ann._MIN_TRAINING_POINTS_PER_LIST - 1, "ivf") == "flat"
+    assert ann.choose_index_type(ann._MIN_TRAINING_POINTS_PER_LIST, "ivf") == "ivf"
+    with pytest.raises(ValueError):
+        ann.choose_index_type(10, "annoy")
+
+def test_growing_corpus_moves_from_flat_to_hnsw(low_thresholds):
+    vectors = _vectors(150)
+    index = ann.build_index(vectors[:50], "auto", None)
+    assert ann.index_type_of(index) == "flat"
+    
+    index.add(vectors[50:])
+    index = ann.reindex_if_needed(index, vectors, index_type="auto", quantization=None)
+    
+    assert ann.index_type_of(index) == "hnsw"
+    assert index.ntotal == 150
+    assert index.hnsw.efSearch == HNSW_EF_SEARCH
+
+def test_ivf_is_retrained_once_the_corpus_outgrows_its_lists():
+    vectors = _vectors(4400)
+    index = ann.build_index(vectors[:400], "ivf", None)
+    assert index.nlist == 10  # 400 vectors train at most 400 // 39 lists
+    
+    index.add(vectors[400:500])
+    # 500 vectors would get 12 lists: not worth a retrain yet
+    assert ann.reindex_if_needed(index, vectors[:500], index_type="ivf", quantization=None) is index
+    
+    index.add(vectors[500:])
+    retrained = ann.reindex_if_needed(index, vectors, index_type="ivf", quantization=None)
+    
+    assert retrained is not index
+    assert retrained.nlist == ann._ivf_nlist(4400) == 112
+    assert retrained.ntotal == 4400
+    assert retrained.nprobe == IVF_NPROBE
+
+def test_recall_report_of_a_flat_index_is_exact():
+    index = ann.build_index(_vectors(500), "flat", None)
+    
+    report = ann.recall_report(index, num_queries=20, k=4)
+    
+    assert report["index_type"] == "flat"
+    assert report["quantization"] is None
+    assert report["vectors"] == 500
+    assert report["k"] == 4
+    assert [(entry["param"], entry["value"], entry["recall"]) for entry in report["sweep"]] == [(None, None, 1.0)]
+
+def test_ivf_recall_is_exact_once_every_list_is_probed():
+    index = ann.build_index(_vectors(2000), "ivf", None)
+    assert index.nlist == 51
+    
+    report = ann.recall_report(index, num_queries=50, k=4)
+    
+    recalls = {entry["value"]: entry["recall"] for entry in report["sweep"]}
+    assert list(recalls) == [1, 2, 4, 8, 16, 32, 64, 128]
+    assert recalls[64] == recalls[128] == 1.0
+    assert recalls[1] < 1.0
+    # The sweep leaves the configured nprobe in place
+    assert index.nprobe == IVF_NPROBE
+
+def test_hnsw_recall_sweep_covers_ef_search():
+    index = ann.build_index(_vectors(1000), "hnsw", None)
+    
+    report = ann.recall_report(index, num_queries=50, k=4)
+    
+    assert [entry["param"] for entry in report["sweep"]] == ["efSearch"] * 5
+    assert report["sweep"][-1]["recall"] >= 0.95
+    assert all(0.0 <= entry["recall"] <= 1.0 for entry in report["sweep"])
+    assert index.hnsw.efSearch == HNSW_EF_SEARCH
+
+def test_reranking_recovers_recall_lost_to_quantization():
+    vectors = _vectors(1000)
+    index = ann.build_index(vectors, "flat", "sq8")
+    
+    report = ann.recall_report(index, num_queries=50, k=4, vectors=vectors, rerank_candidates=4)
+    
+    entry, = report["sweep"]
+    assert report["quantization"] == "sq8"
+    assert entry["reranked_recall"] >= entry["recall"]
+    assert entry["reranked_recall"] == 1.0
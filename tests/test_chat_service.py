@@ -0,0 +1,101 @@
+"""
+Question paths of the chat service, driven by the fake LLM
+"""
+import asyncio
+import random
+import pytest
+from benchmarks.fakes import FAKE_ANSWER, synthetic_text
+from core import chat_service, vector_store
+from core.chunk_store import NO_PAGE
+from core.database import get_history_page
+
+QUESTION = "What does the warranty section say?"
+
+@pytest.fixture
+def indexed_agent(agent):
+    result = chat_service.process_documents(
+        text_input=synthetic_text(random.Random(0), 600),
+        agent=agent
+    )
+    assert result["success"], result
+    return agent
+
+def _saved_exchange(session_id):
+    return [
+        (message["role"], message["content"])
+        for message in get_history_page(session_id)["messages"]
+    ]
+
+async def _collect(pieces):
+    return "".join([piece async for piece in pieces])
+
+def test_process_user_question_answers_and_saves_history(indexed_agent, session_id):
+    answer = chat_service.process_user_question(QUESTION, session_id=session_id, agent=indexed_agent)
+    
+    assert answer == FAKE_ANSWER
+    assert _saved_exchange(session_id) == [("user", QUESTION), ("assistant", FAKE_ANSWER)]
+
+def test_stream_user_question_streams_and_saves_history(indexed_agent, session_id):
+    pieces = list(chat_service.stream_user_question(QUESTION, session_id=session_id, agent=indexed_agent))
+    
+    assert len(pieces) > 1
+    assert "".join(pieces) == FAKE_ANSWER
+    assert _saved_exchange(session_id) == [("user", QUESTION), ("assistant", FAKE_ANSWER)]
+
+def test_aprocess_user_question_answers_and_saves_history(indexed_agent, session_id):
+    answer = asyncio.run(
+        chat_service.aprocess_user_question(QUESTION, session_id=session_id, agent=indexed_agent)
+    )
+    
+    assert answer == FAKE_ANSWER
+    assert _saved_exchange(session_id) == [("user", QUESTION), ("assistant", FAKE_ANSWER)]
+
+def test_astream_user_question_streams_and_saves_history(indexed_agent, session_id):
+    answer = asyncio.run(_collect(
+        chat_service.astream_user_question(QUESTION, session_id=session_id, agent=indexed_agent)
+    ))
+    
+    assert answer == FAKE_ANSWER
+    assert _saved_exchange(session_id) == [("user", QUESTION), ("assistant", FAKE_ANSWER)]
+
+def test_follow_up_questions_append_to_history(indexed_agent, session_id):
+    history = []
+    for question in ("First question?", "And a follow-up?"):
+        answer = chat_service.process_user_question(
+            question,
+            conversation_history=history,
+            session_id=session_id,
+            agent=indexed_agent
+        )
+        history += [{"role": "user", "content": question}, {"role": "assistant", "content": answer}]
+    
+    assert _saved_exchange(session_id) == [
+        ("user", "First question?"),
+        ("assistant", FAKE_ANSWER),
+        ("user", "And a follow-up?"),
+        ("assistant", FAKE_ANSWER)
+    ]
+
+def test_conversation_history_reaches_the_prompt():
+    history = [
+        {"role": "user", "content": "My invoice number is INV-4411."},
+        {"role": "assistant", "content": "Noted."}
+    ]
+    
+    text = chat_service.format_conversation_history(history, session_id="prompt-check")
+    
+    assert "User: My invoice number is INV-4411." in text
+    assert "Assistant: Noted." in text
+
+def test_typed_text_is_stored_without_a_page(indexed_agent):
+    store = vector_store.get_vector_store(agent=indexed_agent)
+    
+    assert set(store.chunks.pages().tolist()) == {NO_PAGE}
+    assert store.chunks.get(0).metadata["page"] is None
+    assert vector_store.search_similar_documents("warranty", agent=indexed_agent, pages=(1, 1)) == []
+
+def test_question_without_documents_raises(agent, session_id):
+    with pytest.raises(FileNotFoundError):
+        chat_service.process_user_question(QUESTION, session_id=session_id, agent=agent)
+    
+    assert _saved_exchange(session_id) == []
@@ -0,0 +1,86 @@
+"""
+Chunk files of an index snapshot: appends, rewrites and interrupted writers
+"""
+import os
+from core.chunk_store import CHUNKS_FILE, ChunkStore, ChunkWriter
+from core.sparse_index import BM25_TERMS_FILE, BM25_VOCAB_FILE, BM25Index, BM25Writer
+
+def _write(path, texts, base=None, skip=(), commit=True):
+    writer = ChunkWriter(str(path), base=base, skip=skip)
+    try:
+        for text in texts:
+            writer.add(f"id-{text}".ljust(64, "0"), text, {"source": "doc", "page": len(text)})
+        if commit:
+            writer.commit()
+    finally:
+        writer.close()
+    return ChunkStore(str(path))
+
+def _texts(store):
+    return [store.get(position).page_content for position in range(len(store))]
+
+def test_append_writes_to_the_committed_files(tmp_path):
+    first = _write(tmp_path, ["alpha", "beta"])
+    inode = os.stat(tmp_path / CHUNKS_FILE).st_ino
+    
+    second = _write(tmp_path, ["gamma"], base=first)
+    
+    assert os.stat(tmp_path / CHUNKS_FILE).st_ino == inode
+    assert _texts(second) == ["alpha", "beta", "gamma"]
+    assert second.pages().tolist() == [5, 4, 5]
+    assert second.position_of("id-gamma".ljust(64, "0")) == 2
+    # A store opened before the append keeps reading its own snapshot
+    assert _texts(first) == ["alpha", "beta"]
+
+def test_appended_store_extends_the_base_lookup_table(tmp_path):
+    first = _write(tmp_path, ["alpha", "beta"])
+    assert "id-alpha".ljust(64, "0") in first
+    
+    second = _write(tmp_path, ["gamma"], base=first)
+    second.ids = None  # Every ID decoded again would fail
+    second.share_positions(first)
+    
+    assert second.position_of("id-gamma".ljust(64, "0")) == 2
+    assert second.position_of("id-alpha".ljust(64, "0")) == 0
+    # The base shares the table but not the positions past its own
+    assert first.position_of("id-gamma".ljust(64, "0")) is None
+
+def test_uncommitted_append_is_invisible_and_dropped(tmp_path):
+    first = _write(tmp_path, ["alpha"])
+    
+    _write(tmp_path, ["lost"], base=first, commit=False)
+    assert _texts(ChunkStore(str(tmp_path))) == ["alpha"]
+    
+    assert _texts(_write(tmp_path, ["kept"], base=first)) == ["alpha", "kept"]
+
+def test_skipped_positions_rewrite_the_files(tmp_path):
+    first = _write(tmp_path, ["alpha", "beta", "gamma"])
+    
+    second = _write(tmp_path, ["delta"], base=first, skip=[1])
+    
+    assert _texts(second) == ["alpha", "gamma", "delta"]
+    assert _texts(_write(tmp_path, ["epsilon"], base=second))[-2:] == ["delta", "epsilon"]
+
+def test_bm25_append_matches_a_full_build(tmp_path):
+    texts = ["Invoice AB-1234 is due.", "The warranty covers water damage."]
+    writer = BM25Writer(str(tmp_path))
+    for text in texts:
+        writer.add(text)
+    writer.commit()
+    base = BM25Index.load(str(tmp_path))
+    
+    # What a writer interrupted mid-commit leaves past the committed counts
+    with open(tmp_path / BM25_VOCAB_FILE, "ab") as f:
+        f.write(b"zebra\nhal")
+    with open(tmp_path / BM25_TERMS_FILE, "ab") as f:
+        f.write(b"\x07\x00")
+    
+    writer = BM25Writer(str(tmp_path), base=base)
+    writer.add("Payment schedule for invoice AB-9999.")
+    writer.commit()
+    
+    loaded = BM25Index.load(str(tmp_path))
+    expected = BM25Index.from_texts(texts + ["Payment schedule for invoice AB-9999."])
+    assert len(loaded) == 3
+    assert loaded.search("invoice warranty payment", 3) == expected.search("invoice warranty payment", 3)
+    assert loaded.search("zebra", 3) == []
@@ -0,0 +1,103 @@
+"""
+Packing retrieved chunks into the context sent to the LLM
+"""
+from langchain_core.documents import Document
+from core.config import CHARS_PER_TOKEN
+from core.context import _MAX_WHITESPACE_GAP, _drop_near_duplicates, _merge_adjacent, pack_context
+
+PAGE = "Invoices are due in thirty days. Late payments incur a fee of two percent per month."
+
+def _slice(start, end, source="terms.pdf", page=1):
+    return Document(
+        page_content=PAGE[start:end],
+        metadata={"source": source, "page": page, "start": start, "end": end, "hash": f"{start}-{end}"}
+    )
+
+def _words(count, offset=0):
+    return " ".join(f"word{i}" for i in range(offset, offset + count))
+
+def test_overlapping_chunks_of_a_page_are_merged_once():
+    merged = _merge_adjacent([_slice(20, 60), _slice(0, 40)])
+    
+    assert len(merged) == 1
+    rank, doc = merged[0]
+    assert rank == 0
+    assert doc.page_content == PAGE[0:60]
+    assert doc.metadata["start"] == 0 and doc.metadata["end"] == 60
+    assert doc.metadata["chunks"] == 2
+    assert "hash" not in doc.metadata
+
+def test_chunks_within_the_whitespace_gap_are_joined():
+    first = Document(page_content="alpha", metadata={"source": "a.pdf", "page": 1, "start": 0, "end": 5})
+    near = Document(
+        page_content="beta",
+        metadata={"source": "a.pdf", "page": 1, "start": 5 + _MAX_WHITESPACE_GAP, "end": 9 + _MAX_WHITESPACE_GAP}
+    )
+    far = Document(
+        page_content="gamma",
+        metadata={"source": "a.pdf", "page": 1, "start": 10 + _MAX_WHITESPACE_GAP * 2, "end": 40}
+    )
+    
+    merged = [doc for _, doc in _merge_adjacent([first, near, far])]
+    
+    assert [doc.page_content for doc in merged] == ["alpha beta", "gamma"]
+
+def test_chunks_of_other_pages_or_sources_are_not_merged():
+    docs = [_slice(0, 40), _slice(20, 60, page=2), _slice(20, 60, source="other.pdf")]
+    
+    merged = _merge_adjacent(docs)
+    
+    assert [rank for rank, _ in merged] == [0, 1, 2]
+    assert [doc for _, doc in merged] == docs
+
+def test_chunks_without_offsets_are_kept_in_rank_order():
+    bare = Document(page_content="no offsets", metadata={"source": "notes.txt"})
+    
+    merged = _merge_adjacent([bare, _slice(40, 84), _slice(0, 41)])
+    
+    assert [rank for rank, _ in merged] == [0, 1]
+    assert merged[0][1] is bare
+    assert merged[1][1].page_content == PAGE[0:84]
+
+def test_near_duplicates_are_dropped_at_the_threshold():
+    best = Document(page_content=_words(20))
+    # 16 of the 17 shingles of this one are in the best document
+    mostly_repeated = Document(page_content=_words(20) + " extra")
+    # 10 of 16 shingles
+    half_repeated = Document(page_content=_words(14) + " " + _words(6, offset=100))
+    
+    kept = _drop_near_duplicates([best, mostly_repeated, half_repeated], 0.8)
+    assert kept == [best, half_repeated]
+    
+    kept = _drop_near_duplicates([best, mostly_repeated, half_repeated], 0.6)
+    assert kept == [best]
+
+def test_documents_are_kept_in_rank_order_while_they_fit_the_budget():
+    docs = [
+        Document(page_content=_words(10, offset=0)),
+        Document(page_content=_words(40, offset=100)),
+        Document(page_content=_words(10, offset=200))
+    ]
+    budget = (len(docs[0].page_content) + len(docs[2].page_content)) // CHARS_PER_TOKEN + 2
+    
+    packed = pack_context(docs, token_budget=budget)
+    
+    # The second does not fit, but the smaller third still does
+    assert packed == [docs[0], docs[2]]
+
+def test_best_document_is_truncated_when_it_does_not_fit_alone():
+    doc = Document(page_content=_words(200), metadata={"source": "long.pdf"})
+    
+    packed = pack_context([doc, Document(page_content="small")], token_budget=10)
+    
+    assert len(packed) == 1
+    assert packed[0].page_content.endswith("...")
+    assert len(packed[0].page_content) == 10 * CHARS_PER_TOKEN
+    assert packed[0].metadata == {"source": "long.pdf"}
+
+def test_pack_context_merges_and_dedupes_before_budgeting():
+    copy = Document(page_content=PAGE[0:60], metadata={"source": "copy.pdf"})
+    
+    packed = pack_context([_slice(0, 40), copy, _slice(30, 60)], token_budget=1000)
+    
+    assert [doc.page_content for doc in packed] == [PAGE[0:60]]
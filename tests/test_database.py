@@ -0,0 +1,76 @@
+"""
+Message storage and the write-behind thread
+"""
+import sqlite3
+import uuid
+import pytest
+from core import database
+
+@pytest.fixture
+def failing_sessions(monkeypatch):
+    """Make inserts touching the returned sessions fail, a set number of times each"""
+    failures = {}
+    insert_batch = database._insert_batch
+    
+    def flaky_insert_batch(batch):
+        for session_id, _ in batch:
+            if failures.get(session_id, 0) > 0:
+                failures[session_id] -= 1
+                raise sqlite3.OperationalError("database is locked")
+        insert_batch(batch)
+    
+    monkeypatch.setattr(database, "_insert_batch", flaky_insert_batch)
+    monkeypatch.setattr(database, "DB_WRITE_RETRY_DELAY", 0)
+    return failures
+
+def _session():
+    return f"session-{uuid.uuid4().hex[:8]}"
+
+def _contents(session_id):
+    return [msg["content"] for msg in database.get_conversation_history(session_id=session_id)]
+
+def test_failing_save_does_not_drop_the_rest_of_its_batch(failing_sessions):
+    good, flaky, broken = _session(), _session(), _session()
+    failing_sessions[flaky] = 2  # The batch attempt and the first retry
+    failing_sessions[broken] = database.DB_WRITE_RETRIES + 1
+    
+    database._write_batch([
+        (good, [("user", "first")]),
+        (broken, [("user", "lost")]),
+        (flaky, [("user", "retried")]),
+        (good, [("assistant", "second")])
+    ])
+    
+    assert _contents(good) == ["first", "second"]
+    assert _contents(flaky) == ["retried"]
+    assert _contents(broken) == []
+
+def test_background_saves_are_visible_after_a_flush():
+    session_id = _session()
+    
+    database.save_messages([("user", "question"), ("assistant", "answer")], session_id=session_id, background=True)
+    database.flush_messages()
+    
+    assert _contents(session_id) == ["question", "answer"]
+
+def test_migration_moves_old_messages_to_the_default_session(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DEFAULT_SESSION_ID", "it's-mine")
+    conn = sqlite3.connect(str(tmp_path / "old.db"))
+    conn.execute("""
+        CREATE TABLE messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("INSERT INTO messages (role, content) VALUES ('user', 'hello')")
+    conn.commit()
+    
+    database._initialize_database(conn)
+    database._migrate_database(conn)
+    
+    assert conn.execute("SELECT session_id FROM messages").fetchall() == [("it's-mine",)]
+    assert conn.execute("SELECT id FROM sessions").fetchall() == [("it's-mine",)]
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == database.SCHEMA_VERSION
+    conn.close()
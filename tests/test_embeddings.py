@@ -0,0 +1,82 @@
+"""
+Embedding backend checks and the on-disk embedding cache
+"""
+import numpy as np
+from benchmarks.fakes import FakeEmbeddings
+from core import embeddings
+
+class _ShiftedEmbeddings(FakeEmbeddings):
+    """Fake vectors nudged away from FakeEmbeddings, like a quantized model"""
+    
+    def _embed(self, text):
+        vector = np.array(super()._embed(text))
+        vector[0] += 0.5
+        return vector.tolist()
+
+def test_drift_is_measured_against_huggingface_embeddings(monkeypatch):
+    monkeypatch.setattr(embeddings, "_huggingface_backend", FakeEmbeddings)
+    
+    monkeypatch.setattr(embeddings, "_create_backend", FakeEmbeddings)
+    assert embeddings.check_embedding_drift(max_drift=1e-6)["ok"]
+    
+    monkeypatch.setattr(embeddings, "_create_backend", _ShiftedEmbeddings)
+    report = embeddings.check_embedding_drift(max_drift=1e-6)
+    assert not report["ok"]
+    assert report["texts"] == len(embeddings.DRIFT_SAMPLE_TEXTS)
+
+def _cache(path, max_entries=100):
+    return embeddings.CachedEmbeddings(FakeEmbeddings(), "fake", str(path), max_entries)
+
+def _assert_cached_vectors_are_right(cache, texts):
+    expected = FakeEmbeddings().embed_documents(texts)
+    assert np.allclose(cache.embed_documents(texts), expected)
+
+def test_processes_sharing_the_cache_never_share_a_row(tmp_path):
+    # Two instances stand in for the app and the server: neither has seen
+    # what the other stored when it stores its own
+    first, second = _cache(tmp_path), _cache(tmp_path)
+    first_texts = [f"first {i}" for i in range(10)]
+    second_texts = [f"second {i}" for i in range(10)]
+    
+    first.embed_documents(first_texts)
+    second.embed_documents(second_texts)
+    
+    for cache in (first, second, _cache(tmp_path)):
+        _assert_cached_vectors_are_right(cache, first_texts + second_texts)
+    assert second.get_stats()["hits"] == 20
+
+def test_rows_evicted_by_another_process_are_not_served(tmp_path):
+    first = _cache(tmp_path, max_entries=8)
+    first.embed_documents([f"old {i}" for i in range(8)])
+    
+    # Fills every row of the cache first wrote to with other texts
+    _cache(tmp_path, max_entries=8).embed_documents([f"new {i}" for i in range(8)])
+    
+    _assert_cached_vectors_are_right(first, [f"old {i}" for i in range(8)])
+    _assert_cached_vectors_are_right(first, [f"new {i}" for i in range(8)])
+
+def test_recently_used_entries_survive_eviction_after_a_restart(tmp_path):
+    cache = _cache(tmp_path, max_entries=4)
+    for text in ("hot", "b", "c", "d"):
+        cache.embed_documents([text])
+    # Used again once it has drifted into the older half of the log
+    cache.embed_documents(["hot"])
+    
+    restarted = _cache(tmp_path, max_entries=4)
+    restarted.embed_documents(["e"])
+    
+    assert restarted.get_stats()["evictions"] == 1
+    restarted.embed_documents(["hot"])
+    assert restarted.get_stats()["hits"] == 1
+    restarted.embed_documents(["b"])
+    assert restarted.get_stats()["misses"] == 2
+
+def test_hot_entries_are_not_logged_on_every_hit(tmp_path):
+    cache = _cache(tmp_path, max_entries=100)
+    cache.embed_documents([f"text {i}" for i in range(10)])
+    
+    for _ in range(20):
+        cache.embed_documents(["text 9"])
+    
+    with open(tmp_path / "keys.log") as f:
+        assert len(f.readlines()) == 10
@@ -0,0 +1,127 @@
+"""
+Search restricted to a source file or page range
+"""
+import random
+import types
+import numpy as np
+import pytest
+from benchmarks.fakes import UploadedFile, make_pdf, synthetic_text
+from core import ann, vector_store
+from core.chat_service import process_documents
+from core.config import FILTER_EXACT_MAX_CHUNKS, PQ_M
+
+NUM_VECTORS = 10_000  # Enough to train PQ codebooks
+DIM = PQ_M  # Smallest dimension PQ accepts, to keep training fast
+
+_indexes = {}
+
+@pytest.fixture(scope="module")
+def vectors():
+    return np.random.default_rng(0).standard_normal((NUM_VECTORS, DIM)).astype(np.float32)
+
+def _index(vectors, index_type, quantization):
+    key = (index_type, quantization)
+    if key not in _indexes:
+        _indexes[key] = ann.build_index(vectors, index_type, quantization)
+    return _indexes[key]
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw", "ivf"])
+@pytest.mark.parametrize("quantization", [None, "sq8", "pq"])
+@pytest.mark.parametrize("full_precision", [True, False])
+@pytest.mark.parametrize("subset_size", [FILTER_EXACT_MAX_CHUNKS // 4, FILTER_EXACT_MAX_CHUNKS * 2])
+def test_filtered_dense_search(vectors, index_type, quantization, full_precision, subset_size):
+    index = _index(vectors, index_type, quantization)
+    assert ann.index_type_of(index) == index_type
+    assert ann.quantization_of(index) == quantization
+    
+    store = types.SimpleNamespace(
+        index=index,
+        full_vectors=vectors if full_precision and quantization else None
+    )
+    subset = np.sort(np.random.default_rng(1).choice(NUM_VECTORS, subset_size, replace=False))
+    target = int(subset[len(subset) // 2])
+    
+    positions = vector_store._dense_search_positions(
+        store, vectors[target].tolist(), 5, {"positions": subset}
+    )
+    
+    assert len(positions) == 5
+    assert set(positions) <= set(subset.tolist())
+    assert positions[0] == target
+
+@pytest.mark.parametrize("index_type", ["hnsw", "ivf"])
+def test_selective_filter_keeps_recall(vectors, index_type, monkeypatch):
+    # Searched through the index despite its size, as in a larger corpus
+    monkeypatch.setattr(vector_store, "FILTER_EXACT_MAX_CHUNKS", 100)
+    index = _index(vectors, index_type, None)
+    store = types.SimpleNamespace(index=index, full_vectors=None)
+    rng = np.random.default_rng(3)
+    subset = np.sort(rng.choice(NUM_VECTORS, NUM_VECTORS // 20, replace=False))
+    queries = vectors[rng.integers(0, NUM_VECTORS, 50)] + rng.normal(scale=0.1, size=(50, DIM))
+    
+    recalls = []
+    for query in queries.astype(np.float32):
+        found = vector_store._dense_search_positions(store, query.tolist(), 10, {"positions": subset})
+        truth = ann.exact_search(None, query, subset, 10, vectors)
+        recalls.append(len(set(found) & set(truth)) / 10)
+    
+    assert np.mean(recalls) >= 0.95
+
+def test_filter_on_a_small_share_of_the_index_is_searched_exactly(vectors, monkeypatch):
+    monkeypatch.setattr(vector_store, "FILTER_EXACT_MAX_CHUNKS", 10)
+    monkeypatch.setattr(ann, "search_subset", None)  # Fails if the index is searched
+    store = types.SimpleNamespace(index=_index(vectors, "hnsw", None), full_vectors=None)
+    subset = np.arange(0, NUM_VECTORS, 200, dtype=np.int64)  # 0.5%
+    
+    positions = vector_store._dense_search_positions(store, vectors[400].tolist(), 5, {"positions": subset})
+    
+    assert positions[0] == 400
+    assert set(positions) <= set(subset.tolist())
+
+def test_exact_search_matches_brute_force_across_blocks(vectors, monkeypatch):
+    monkeypatch.setattr(ann, "EXACT_SEARCH_BLOCK", 100)
+    subset = np.arange(0, NUM_VECTORS, 7, dtype=np.int64)
+    query = vectors[3] + 0.1
+    
+    found = ann.exact_search(None, query, subset, 10, vectors)
+    
+    distances = ((vectors[subset] - query) ** 2).sum(axis=1)
+    assert found == subset[np.argsort(distances)[:10]].tolist()
+
+@pytest.fixture
+def paged_agent(agent):
+    rng = random.Random(2)
+    uploads = [
+        UploadedFile(name, make_pdf([synthetic_text(rng, 300) for _ in range(4)]))
+        for name in ("alpha.pdf", "beta.pdf")
+    ]
+    assert process_documents(pdf_files=uploads, agent=agent)["success"]
+    return agent
+
+@pytest.mark.parametrize("mode", ["dense", "hybrid"])
+def test_search_by_source(paged_agent, mode):
+    docs = vector_store.search_similar_documents(
+        "payment schedule audit", k=6, mode=mode, agent=paged_agent, source="beta.pdf"
+    )
+    
+    assert docs
+    assert {doc.metadata["source"] for doc in docs} == {"beta.pdf"}
+
+@pytest.mark.parametrize("mode", ["dense", "hybrid"])
+def test_search_by_source_and_pages(paged_agent, mode):
+    docs = vector_store.search_similar_documents(
+        "payment schedule audit", k=6, mode=mode, agent=paged_agent, source="alpha.pdf", pages=(2, 3)
+    )
+    
+    assert docs
+    for doc in docs:
+        assert doc.metadata["source"] == "alpha.pdf"
+        assert 2 <= doc.metadata["page"] <= 3
+
+def test_filter_without_matches_returns_nothing(paged_agent):
+    assert vector_store.search_similar_documents("audit", agent=paged_agent, source="missing.pdf") == []
+    assert vector_store.search_similar_documents("audit", agent=paged_agent, pages=(50, 60)) == []
+
+def test_invalid_page_range_is_rejected(paged_agent):
+    with pytest.raises(ValueError):
+        vector_store.search_similar_documents("audit", agent=paged_agent, pages=(3, 1))
@@ -0,0 +1,67 @@
+"""
+Conversation history packed into the prompt budget
+"""
+import pytest
+from core import history, llm_chain
+
+@pytest.fixture
+def summaries(monkeypatch):
+    """Records summarize calls and answers them with a fixed summary"""
+    calls = []
+    
+    def summarize_conversation(summary, messages, max_words):
+        calls.append(messages)
+        return "They discussed invoices."
+    
+    monkeypatch.setattr(llm_chain, "summarize_conversation", summarize_conversation)
+    return calls
+
+def _conversation(count, words=20):
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i} " + "word " * words}
+        for i in range(count)
+    ]
+
+def _wait_for_folds():
+    history._summary_executor.submit(lambda: None).result()
+
+def test_history_within_limits_is_kept_whole_without_summarizing(summaries, session_id):
+    conversation = _conversation(4)
+    
+    packed = history.pack_conversation_history(conversation, 2, 100_000, session_id)
+    _wait_for_folds()
+    
+    assert packed.splitlines() == [history.format_message(msg) for msg in conversation]
+    assert summaries == []
+
+def test_only_max_messages_exchanges_are_kept_verbatim(summaries, session_id):
+    conversation = _conversation(30)
+    lines = [history.format_message(msg) for msg in conversation]
+    
+    packed = history.pack_conversation_history(conversation, 2, 100_000, session_id)
+    
+    assert packed.splitlines() == lines[-4:]
+    
+    _wait_for_folds()
+    packed = history.pack_conversation_history(conversation, 2, 100_000, session_id)
+    
+    assert summaries == ["\n".join(lines[:-4])]
+    assert packed.splitlines() == ["Summary of earlier conversation: They discussed invoices."] + lines[-4:]
+
+def test_unfolded_messages_stay_until_the_summary_covers_them(summaries, session_id):
+    conversation = _conversation(6, words=200)
+    lines = [history.format_message(msg) for msg in conversation]
+    budget = history.estimate_tokens("\n".join(lines)) - 1
+    
+    packed = history.pack_conversation_history(conversation, 3, budget, session_id)
+    
+    # While the summary is being written, older messages fill the budget
+    # in its place, newest first
+    assert packed.splitlines() == lines[1:]
+    
+    _wait_for_folds()
+    packed = history.pack_conversation_history(conversation, 3, budget, session_id)
+    
+    assert len(summaries) == 1
+    assert packed.splitlines()[0] == "Summary of earlier conversation: They discussed invoices."
+    assert packed.splitlines()[1:] == lines[-4:]
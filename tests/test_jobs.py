@@ -0,0 +1,105 @@
+"""
+Background ingestion jobs and their recovery after a restart
+"""
+import json
+import os
+import queue
+import time
+import uuid
+import pytest
+from benchmarks.fakes import UploadedFile, make_pdf
+from core import jobs
+from core.database import get_db_connection
+from core.manifest import list_sources
+
+@pytest.fixture
+def job_queue(monkeypatch):
+    """A queue no worker reads, so recovered jobs stay where tests can see them"""
+    pending = queue.Queue()
+    monkeypatch.setattr(jobs, "_job_queue", pending)
+    return pending
+
+def _insert_job(status, worker, spooled=True):
+    job_id = uuid.uuid4().hex
+    if spooled:
+        jobs._spool_inputs(job_id, [], "Some text", True, None)
+    
+    conn = get_db_connection()
+    with conn:
+        conn.execute(
+            "INSERT INTO jobs (id, kind, agent, status, progress, worker) VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, "ingest", None, status, json.dumps({}), worker)
+        )
+    return job_id
+
+def _queued(pending):
+    return [pending.get_nowait() for _ in range(pending.qsize())]
+
+@pytest.mark.parametrize("worker", [
+    str(os.getpid()),
+    f"{os.getpid()}:{uuid.uuid4().hex}"
+], ids=["pid-only", "other-instance"])
+def test_job_left_under_a_reused_pid_is_requeued(job_queue, worker):
+    job_id = _insert_job(jobs.RUNNING, worker)
+    
+    jobs._recover_jobs()
+    
+    assert job_id in _queued(job_queue)
+    assert jobs.get_job(job_id)["status"] == jobs.QUEUED
+
+def test_job_left_without_inputs_is_failed(job_queue):
+    job_id = _insert_job(jobs.RUNNING, f"{os.getpid()}:{uuid.uuid4().hex}", spooled=False)
+    
+    jobs._recover_jobs()
+    
+    assert job_id not in _queued(job_queue)
+    assert jobs.get_job(job_id)["status"] == jobs.FAILED
+
+def test_job_of_a_live_process_is_left_alone(job_queue):
+    job_id = _insert_job(jobs.RUNNING, f"{os.getppid()}:{uuid.uuid4().hex}")
+    
+    jobs._recover_jobs()
+    
+    assert job_id not in _queued(job_queue)
+    assert jobs.get_job(job_id)["status"] == jobs.RUNNING
+
+def test_job_claimed_by_this_instance_is_left_alone(job_queue):
+    job_id = _insert_job(jobs.RUNNING, f"{os.getpid()}:{jobs._INSTANCE_ID}")
+    
+    jobs._recover_jobs()
+    
+    assert job_id not in _queued(job_queue)
+    assert jobs.get_job(job_id)["status"] == jobs.RUNNING
+
+def _wait_for(job_id):
+    deadline = time.monotonic() + 60
+    while jobs.get_job(job_id)["status"] in jobs.ACTIVE_STATES and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return jobs.get_job(job_id)
+
+def test_spooled_uploads_are_handed_over_as_paths():
+    job_id = uuid.uuid4().hex
+    jobs._spool_inputs(job_id, [UploadedFile("manual.pdf", b"%PDF-1.4")], None, True, None)
+    
+    upload, = jobs._load_inputs(job_id)["files"]
+    
+    assert upload.name == "manual.pdf"
+    with open(upload.path, "rb") as f:
+        assert f.read() == b"%PDF-1.4"
+
+def test_submitted_pdf_job_indexes_the_upload(agent):
+    upload = UploadedFile("manual.pdf", make_pdf(["The warranty lasts two years. " * 20]))
+    job_id = jobs.submit_ingest_job(pdf_files=[upload], agent=agent)
+    
+    job = _wait_for(job_id)
+    
+    assert job["status"] == jobs.SUCCEEDED, job["error"]
+    assert list_sources(agent) == ["manual.pdf"]
+
+def test_submitted_job_runs_to_completion(agent):
+    job_id = jobs.submit_ingest_job(text_input="The warranty lasts two years. " * 40, agent=agent)
+    
+    job = _wait_for(job_id)
+    assert job["status"] == jobs.SUCCEEDED, job["error"]
+    assert job["result"]["success"]
+    assert not os.path.exists(jobs._spool_dir(job_id))
@@ -0,0 +1,156 @@
+"""
+Stage histograms, self-time accounting, Prometheus export and profiling
+"""
+import threading
+import pytest
+from core import metrics
+
+class FakeClock:
+    """Stands in for time.perf_counter; advanced by hand"""
+    
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self):
+        return self.now
+    
+    def advance(self, seconds):
+        self.now += seconds
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    metrics.reset_metrics()
+    yield
+    metrics.reset_metrics()
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(metrics.time, "perf_counter", clock)
+    return clock
+
+def _observed(*seconds, buckets=(1, 2, 4)):
+    histogram = metrics.Histogram(buckets)
+    for value in seconds:
+        histogram.observe(value)
+    return histogram
+
+def test_quantiles_interpolate_within_their_bucket():
+    histogram = _observed(0.5, 1.5, 1.5, 3)
+    
+    assert histogram.counts == [1, 2, 1, 0]
+    assert histogram.quantile(0.25) == 1.0
+    assert histogram.quantile(0.5) == 1.5
+    assert histogram.quantile(1.0) == 4.0
+
+def test_quantile_beyond_the_last_bucket_is_its_bound():
+    assert _observed(10, 20).quantile(0.99) == 4
+    assert metrics.Histogram((1, 2)).quantile(0.5) is None
+
+def test_prometheus_export_has_cumulative_buckets_and_attribute_totals():
+    metrics.record("embed", 0.125, {"chunks": 5, "model": "fake"})
+    metrics.record("embed", 0.75, {"chunks": 2})
+    metrics.record('say "hi"', 0.01)
+    
+    lines = metrics.render_prometheus().splitlines()
+    
+    assert "# TYPE rag_stage_duration_seconds histogram" in lines
+    assert 'rag_stage_duration_seconds_bucket{stage="embed",le="0.1"} 0' in lines
+    assert 'rag_stage_duration_seconds_bucket{stage="embed",le="0.25"} 1' in lines
+    assert 'rag_stage_duration_seconds_bucket{stage="embed",le="1"} 2' in lines
+    assert 'rag_stage_duration_seconds_bucket{stage="embed",le="+Inf"} 2' in lines
+    assert 'rag_stage_duration_seconds_sum{stage="embed"} 0.875' in lines
+    assert 'rag_stage_duration_seconds_count{stage="embed"} 2' in lines
+    assert "# TYPE rag_stage_chunks_total counter" in lines
+    assert 'rag_stage_chunks_total{stage="embed"} 7' in lines
+    # Only numeric attributes are summed
+    assert not any("model" in line for line in lines)
+    assert 'rag_stage_duration_seconds_count{stage="say \\"hi\\""} 1' in lines
+
+def test_span_records_its_duration_and_added_counts(clock):
+    with metrics.span("retrieval", k=4) as attrs:
+        clock.advance(0.5)
+        attrs["chunks"] = 3
+    
+    summary = metrics.get_metrics()["retrieval"]
+    assert summary["count"] == 1
+    assert summary["total_seconds"] == 0.5
+    assert summary["totals"] == {"k": 4, "chunks": 3}
+
+def test_trace_sums_repeated_stages_and_marks_errors(clock):
+    with metrics.trace("question", agent="docs") as current:
+        for seconds, chunks in ((1, 2), (2, 3)):
+            with metrics.span("embed", chunks=chunks):
+                clock.advance(seconds)
+        with pytest.raises(ValueError):
+            with metrics.span("llm"):
+                raise ValueError("no answer")
+        # Nested traces are plain stages of the outer one
+        with metrics.trace("inner"):
+            clock.advance(0.5)
+    
+    assert current["stages"]["embed"] == {"seconds": 3, "calls": 2, "chunks": 5}
+    assert current["stages"]["llm"]["error"] == "ValueError"
+    assert current["stages"]["inner"]["seconds"] == 0.5
+    assert current["seconds"] == 3.5
+    assert current["attrs"] == {"agent": "docs"}
+    assert metrics.get_recent_traces() == [current]
+
+def test_nested_timed_iterables_count_only_their_own_time(clock):
+    def pages():
+        for page in range(3):
+            clock.advance(1)
+            yield page
+    
+    def chunks(pages):
+        for page in pages:
+            clock.advance(2)
+            yield page
+    
+    with metrics.trace("ingest") as current:
+        items = list(metrics.timed("chunk", chunks(metrics.timed("load", pages()))))
+    
+    assert items == [0, 1, 2]
+    assert current["stages"]["load"] == {"seconds": 3, "calls": 1, "items": 3}
+    assert current["stages"]["chunk"] == {"seconds": 6, "calls": 1, "items": 3}
+
+def test_timed_records_under_the_trace_it_was_created_in(clock):
+    def pages():
+        clock.advance(1)
+        yield "page"
+    
+    with metrics.trace("ingest") as current:
+        stage = metrics.timed("load", pages())
+        # Pipeline stages are consumed on their own threads
+        consumer = threading.Thread(target=lambda: list(stage))
+        consumer.start()
+        consumer.join()
+    
+    assert current["stages"]["load"]["items"] == 1
+
+def test_profile_next_request_profiles_exactly_one_trace():
+    metrics.profile_next_request()
+    
+    with metrics.trace("profiled") as profiled:
+        sorted(range(1000), key=lambda value: -value)
+    with metrics.trace("plain") as plain:
+        pass
+    
+    assert "function calls" in profiled["profile"]
+    assert "profile" not in plain
+
+def test_only_one_request_is_profiled_at_a_time():
+    skipped = {}
+    
+    def concurrent_request():
+        with metrics.trace("other", profile=True) as current:
+            pass
+        skipped.update(current)
+    
+    with metrics.trace("profiled", profile=True) as profiled:
+        thread = threading.Thread(target=concurrent_request)
+        thread.start()
+        thread.join()
+    
+    assert skipped["profile"] == "Skipped: another request is being profiled"
+    assert "function calls" in profiled["profile"]
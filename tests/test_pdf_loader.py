@@ -0,0 +1,73 @@
+"""
+Page-by-page PDF extraction in worker processes
+"""
+import threading
+import pytest
+from benchmarks.fakes import UploadedFile, make_pdf
+from core import pdf_loader
+from core.config import PDF_PAGES_PER_TASK
+
+def _pdf(name, num_pages):
+    return UploadedFile(name, make_pdf([f"{name} page {i + 1}" for i in range(num_pages)]))
+
+def _extract(pdf_files, parallel=None):
+    skipped = []
+    pages = list(pdf_loader.iter_pdf_pages(pdf_files, skipped, parallel=parallel))
+    return pages, skipped
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_pages_come_back_in_upload_order(parallel):
+    num_pages = PDF_PAGES_PER_TASK + 3  # More than one page range per file
+    pages, skipped = _extract([_pdf("a.pdf", num_pages), _pdf("b.pdf", 2)], parallel=parallel)
+    
+    assert skipped == []
+    assert [(name, number) for name, number, _ in pages] == (
+        [("a.pdf", i + 1) for i in range(num_pages)] + [("b.pdf", 1), ("b.pdf", 2)]
+    )
+    assert "a.pdf page 5" in pages[4][2]
+
+def test_unreadable_file_is_skipped(caplog):
+    pages, skipped = _extract([UploadedFile("broken.pdf", b"not a pdf"), _pdf("ok.pdf", 1)])
+    
+    assert skipped == ["broken.pdf"]
+    assert [name for name, _, _ in pages] == ["ok.pdf"]
+    warning, = [record for record in caplog.records if "broken.pdf" in record.getMessage()]
+    assert warning.exc_info is not None
+
+def test_files_are_only_parsed_in_worker_processes(monkeypatch):
+    def parse_in_parent(*args, **kwargs):
+        raise AssertionError("PDF parsed outside a worker")
+    
+    monkeypatch.setattr(pdf_loader, "PdfReader", parse_in_parent)
+    
+    pages, skipped = _extract([_pdf("a.pdf", 3)])
+    
+    assert skipped == []
+    assert len(pages) == 3
+
+def test_file_over_the_timeout_is_skipped(monkeypatch):
+    monkeypatch.setattr(pdf_loader, "PDF_FILE_TIMEOUT", 0)
+    
+    pages, skipped = _extract([_pdf("slow.pdf", 1)])
+    
+    assert pages == []
+    assert skipped == ["slow.pdf"]
+
+def test_stopping_one_extraction_leaves_others_running():
+    results = {}
+    
+    def extract():
+        results["big.pdf"] = _extract([_pdf("big.pdf", 200)], parallel=True)
+    
+    thread = threading.Thread(target=extract)
+    thread.start()
+    
+    # Abandoning an extraction stops its workers, and only its workers
+    abandoned = pdf_loader.iter_pdf_pages([_pdf("other.pdf", 40)], [], parallel=True)
+    next(abandoned)
+    abandoned.close()
+    
+    thread.join()
+    pages, skipped = results["big.pdf"]
+    assert skipped == []
+    assert len(pages) == 200
@@ -0,0 +1,104 @@
+"""
+Threaded pipeline stages: ordering, backpressure and shutdown
+"""
+import contextvars
+import threading
+import time
+import pytest
+from core.pipeline import batched, threaded
+
+class Source:
+    """Counts the items pulled from it and remembers the thread pulling them"""
+    
+    def __init__(self, count, fail_at=None):
+        self.count = count
+        self.fail_at = fail_at
+        self.produced = 0
+        self.thread = None
+    
+    def __iter__(self):
+        self.thread = threading.current_thread()
+        for i in range(self.count):
+            if i == self.fail_at:
+                raise ValueError(f"bad item {i}")
+            self.produced += 1
+            yield i
+
+def _wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+def test_chained_stages_keep_item_order():
+    def square(items):
+        for item in items:
+            yield item * item
+    
+    stages = batched(threaded(square(threaded(Source(100), 4)), 3), 32)
+    
+    batches = list(stages)
+    
+    assert [len(batch) for batch in batches] == [32, 32, 32, 4]
+    assert [item for batch in batches for item in batch] == [i * i for i in range(100)]
+
+def test_stage_runs_in_the_callers_context():
+    request = contextvars.ContextVar("request", default=None)
+    request.set("ingest-1")
+    
+    def seen(items):
+        for item in items:
+            yield request.get(), item
+    
+    assert list(threaded(seen(range(3)), 2)) == [("ingest-1", 0), ("ingest-1", 1), ("ingest-1", 2)]
+
+def test_full_queue_blocks_the_producer():
+    source = Source(1000)
+    stage = threaded(source, 5)
+    
+    assert next(stage) == 0
+    # One item handed over, five waiting and one held by the blocked producer
+    assert _wait_until(lambda: source.produced == 7)
+    time.sleep(0.3)
+    assert source.produced == 7
+    
+    assert next(stage) == 1
+    assert _wait_until(lambda: source.produced == 8)
+    stage.close()
+
+def test_producer_error_reaches_the_consumer_after_earlier_items():
+    received = []
+    
+    with pytest.raises(ValueError, match="bad item 3"):
+        for item in threaded(Source(10, fail_at=3), 2):
+            received.append(item)
+    
+    assert received == [0, 1, 2]
+
+def test_error_in_a_later_stage_stops_the_earlier_ones():
+    source = Source(10_000)
+    
+    def fail_after(items, count):
+        for i, item in enumerate(items):
+            if i == count:
+                raise RuntimeError("embedding failed")
+            yield item
+    
+    with pytest.raises(RuntimeError, match="embedding failed"):
+        list(threaded(fail_after(threaded(source, 4), 10), 4))
+    
+    # The stop event lets the blocked producer thread exit
+    assert _wait_until(lambda: source.thread is not None and not source.thread.is_alive())
+    assert source.produced < 100
+
+def test_closing_the_consumer_stops_the_producer():
+    source = Source(10_000)
+    stage = threaded(source, 4)
+    next(stage)
+    
+    stage.close()
+    
+    assert _wait_until(lambda: not source.thread.is_alive())
+    produced = source.produced
+    time.sleep(0.2)
+    assert source.produced == produced < 100
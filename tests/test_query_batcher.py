@@ -0,0 +1,92 @@
+"""
+Micro-batching of concurrent query embeddings
+"""
+import threading
+import time
+import pytest
+from core.query_batcher import QueryBatcher
+
+class RecordingModel:
+    """Embeds each text as its length, recording the batches it was called with"""
+    
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batches = []
+        self.started = threading.Event()
+    
+    def __call__(self, texts):
+        self.started.set()
+        self.batches.append(list(texts))
+        time.sleep(self.delay)
+        return [[float(len(text))] for text in texts]
+
+def test_concurrent_queries_share_one_batch():
+    model = RecordingModel()
+    batcher = QueryBatcher(model, max_batch_size=8, max_wait=0.5)
+    texts = [f"query {i}" * (i + 1) for i in range(8)]
+    
+    futures = [batcher.submit(text) for text in texts]
+    
+    assert [future.result(timeout=5) for future in futures] == [[float(len(text))] for text in texts]
+    assert len(model.batches) == 1
+    assert batcher.get_stats()["largest_batch"] == 8
+
+def test_batches_close_at_the_max_size():
+    model = RecordingModel()
+    batcher = QueryBatcher(model, max_batch_size=3, max_wait=0.5)
+    
+    futures = [batcher.submit(f"query {i}") for i in range(7)]
+    for future in futures:
+        future.result(timeout=5)
+    
+    assert [len(batch) for batch in model.batches] == [3, 3, 1]
+
+def test_lone_query_waits_at_most_max_wait():
+    model = RecordingModel()
+    batcher = QueryBatcher(model, max_batch_size=32, max_wait=0.05)
+    
+    started = time.monotonic()
+    assert batcher.embed("lonely") == [6.0]
+    
+    assert time.monotonic() - started < 1.0
+    assert model.batches == [["lonely"]]
+
+def test_queries_arriving_during_a_call_form_the_next_batch():
+    model = RecordingModel(delay=0.2)
+    batcher = QueryBatcher(model, max_batch_size=32, max_wait=0.01)
+    
+    first = batcher.submit("first")
+    model.started.wait(5)
+    later = [batcher.submit(f"later {i}") for i in range(4)]
+    
+    first.result(timeout=5)
+    for future in later:
+        future.result(timeout=5)
+    assert [len(batch) for batch in model.batches] == [1, 4]
+
+def test_identical_queries_are_embedded_once():
+    model = RecordingModel()
+    batcher = QueryBatcher(model, max_batch_size=5, max_wait=0.5)
+    
+    futures = [batcher.submit(text) for text in ["same", "same", "other", "same", "same"]]
+    
+    assert [future.result(timeout=5) for future in futures] == [[4.0], [4.0], [5.0], [4.0], [4.0]]
+    assert model.batches == [["same", "other"]]
+    assert batcher.get_stats()["queries"] == 5
+
+def test_model_errors_reach_every_caller_and_the_batcher_recovers():
+    calls = []
+    
+    def embed_many(texts):
+        calls.append(texts)
+        if len(calls) == 1:
+            raise RuntimeError("model unavailable")
+        return [[1.0] for _ in texts]
+    
+    batcher = QueryBatcher(embed_many, max_batch_size=2, max_wait=0.5)
+    futures = [batcher.submit("a"), batcher.submit("b")]
+    
+    for future in futures:
+        with pytest.raises(RuntimeError, match="model unavailable"):
+            future.result(timeout=5)
+    assert batcher.embed("c") == [1.0]
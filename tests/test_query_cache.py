@@ -0,0 +1,27 @@
+"""
+Query normalization shared by the query embedding and results caches
+"""
+from core import vector_store
+
+def test_spelling_variants_share_a_cache_key():
+    decomposed = "  Cafe\u0301\n opening   hours "
+    
+    assert vector_store.normalize_query(decomposed) == "Caf\u00e9 opening hours"
+
+def test_case_is_kept_for_cased_models(monkeypatch):
+    embedded = []
+    
+    class RecordingEmbeddings:
+        def embed_query(self, text):
+            embedded.append(text)
+            return [float(len(embedded))]
+    
+    monkeypatch.setattr(vector_store, "get_embeddings", RecordingEmbeddings)
+    monkeypatch.setattr(vector_store, "get_query_batcher", lambda: None)
+    
+    first = vector_store.embed_query("Apple  revenue")
+    second = vector_store.embed_query("apple revenue")
+    
+    assert embedded == ["Apple revenue", "apple revenue"]
+    assert first != second
+    assert vector_store.embed_query("Apple revenue") == first
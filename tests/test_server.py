@@ -0,0 +1,129 @@
+"""
+HTTP API of the headless server, served on a free port with the fakes
+"""
+import base64
+import http.client
+import json
+import random
+import threading
+import pytest
+import server
+from http.server import ThreadingHTTPServer
+from benchmarks.fakes import FAKE_ANSWER, make_pdf, synthetic_text
+
+@pytest.fixture(scope="module")
+def address():
+    """Serve the API on port 0 for the module's tests"""
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), server.RequestHandler)
+    httpd.daemon_threads = True
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd.server_address
+    httpd.shutdown()
+    httpd.server_close()
+
+def _request(address, method, path, body=None, raw=None):
+    """
+    Send one request on a new connection
+    
+    Returns:
+        tuple: (status, parsed JSON or text body)
+    """
+    connection = http.client.HTTPConnection(*address, timeout=30)
+    try:
+        data = raw if raw is not None else (json.dumps(body).encode() if body is not None else None)
+        headers = {"Content-Type": "application/json"} if data is not None else {}
+        connection.request(method, path, body=data, headers=headers)
+        response = connection.getresponse()
+        payload = response.read().decode("utf-8")
+        if response.getheader("Content-Type", "").startswith("application/json"):
+            payload = json.loads(payload)
+        return response.status, payload
+    finally:
+        connection.close()
+
+@pytest.fixture
+def indexed_agent(address, agent):
+    status, payload = _request(
+        address, "POST", "/ingest",
+        {"text": synthetic_text(random.Random(0), 400), "agent": agent}
+    )
+    assert status == 200, payload
+    return agent
+
+def test_health(address):
+    assert _request(address, "GET", "/health") == (200, {"status": "ok"})
+
+def test_query_answers_and_records_history(address, indexed_agent, session_id):
+    status, payload = _request(
+        address, "POST", "/query",
+        {"question": "What does the warranty cover?", "agent": indexed_agent, "session_id": session_id}
+    )
+    
+    assert status == 200
+    assert payload == {"answer": FAKE_ANSWER, "session_id": session_id}
+    
+    status, page = _request(address, "GET", f"/history?session_id={session_id}&page_size=10")
+    assert status == 200
+    assert [message["role"] for message in page["messages"]] == ["user", "assistant"]
+    
+    assert _request(address, "DELETE", f"/history?session_id={session_id}") == (200, {"cleared": session_id})
+    assert _request(address, "GET", f"/history?session_id={session_id}")[1]["messages"] == []
+
+def test_ingest_pdf_lists_its_source(address, agent):
+    pdf = make_pdf([synthetic_text(random.Random(1), 200)])
+    
+    status, payload = _request(
+        address, "POST", "/ingest",
+        {"files": [{"name": "manual.pdf", "data": base64.b64encode(pdf).decode()}], "agent": agent}
+    )
+    
+    assert status == 200, payload
+    assert payload["success"]
+    assert _request(address, "GET", f"/sources?agent={agent}") == (200, {"sources": ["manual.pdf"]})
+
+def test_query_without_documents_is_not_found(address, agent):
+    status, payload = _request(address, "POST", "/query", {"question": "Anything?", "agent": agent})
+    
+    assert status == 404
+    assert "error" in payload
+
+@pytest.mark.parametrize("method, path, body, status", [
+    ("POST", "/query", {}, 400),
+    ("POST", "/query", {"question": "Why?", "pages": [3, 1]}, 400),
+    ("POST", "/query", {"question": "Why?", "max_history": "many"}, 400),
+    ("POST", "/ingest", {}, 400),
+    ("POST", "/ingest", {"files": [{"name": "a.pdf", "data": "not base64!"}]}, 400),
+    ("GET", "/history?page_size=0", None, 400),
+    ("DELETE", "/history", None, 400),
+    ("GET", "/query", None, 405),
+    ("GET", "/nowhere", None, 404)
+])
+def test_request_errors_get_their_status(address, method, path, body, status):
+    response_status, payload = _request(address, method, path, body)
+    
+    assert response_status == status
+    assert payload["error"]
+
+def test_malformed_json_is_rejected(address):
+    status, payload = _request(address, "POST", "/query", raw=b"{not json")
+    
+    assert status == 400
+    assert payload == {"error": "Body must be JSON"}
+
+def test_body_over_the_size_limit_is_rejected_unread(address, monkeypatch):
+    monkeypatch.setattr(server, "SERVER_MAX_BODY_BYTES", 64)
+    
+    status, payload = _request(address, "POST", "/query", {"question": "x" * 100})
+    
+    assert status == 413
+    assert payload == {"error": "Request body too large"}
+
+def test_metrics_are_prometheus_text(address, indexed_agent):
+    _request(address, "POST", "/query", {"question": "What is covered?", "agent": indexed_agent})
+    
+    status, text = _request(address, "GET", "/metrics")
+    
+    assert status == 200
+    assert "# TYPE rag_stage_duration_seconds histogram" in text
+    assert 'rag_stage_duration_seconds_count{stage="' in text
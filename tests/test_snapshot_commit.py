@@ -0,0 +1,76 @@
+"""
+Commits of an index snapshot interrupted at any point
+"""
+import faiss
+import pytest
+from core import chunk_store, vector_store
+from core.chunk_store import ChunkWriter
+
+FIRST = ["The warranty covers water damage.", "Invoices are due in thirty days."]
+SECOND = ["Deliveries ship every Tuesday.", "Audit reports are filed quarterly."]
+
+class Crash(Exception):
+    pass
+
+def _crash(*args, **kwargs):
+    raise Crash()
+
+def _reopen(agent):
+    vector_store.invalidate_vector_store_cache()
+    return vector_store.get_vector_store(agent)
+
+def _assert_consistent(store):
+    assert len(store.chunks) == store.index.ntotal
+    assert len(store.get_sparse_index()) == store.index.ntotal
+
+def _assert_found(agent, texts):
+    for text in texts:
+        docs = vector_store.search_similar_documents(text, k=1, mode="dense", agent=agent)
+        assert docs[0].page_content == text
+
+def test_crash_before_the_commit_keeps_the_previous_snapshot(agent, monkeypatch):
+    vector_store.add_to_vector_store(FIRST, agent=agent)
+    
+    monkeypatch.setattr(faiss, "write_index", _crash)
+    with pytest.raises(Crash):
+        vector_store.add_to_vector_store(SECOND, agent=agent)
+    monkeypatch.undo()
+    
+    store = _reopen(agent)
+    _assert_consistent(store)
+    assert len(store.chunks) == len(FIRST)
+    
+    # The lost chunks were never indexed, so adding them again embeds them
+    assert vector_store.add_to_vector_store(SECOND, agent=agent)["added"] == len(SECOND)
+    _assert_consistent(_reopen(agent))
+    _assert_found(agent, FIRST + SECOND)
+
+def test_commit_stopped_midway_is_finished_on_open(agent, monkeypatch):
+    vector_store.add_to_vector_store(FIRST, agent=agent)
+    
+    # The commit is recorded, but none of its steps carried out
+    monkeypatch.setattr(chunk_store, "replay_commit", _crash)
+    with pytest.raises(Crash):
+        vector_store.add_to_vector_store(SECOND, agent=agent)
+    monkeypatch.undo()
+    
+    store = _reopen(agent)
+    _assert_consistent(store)
+    assert len(store.chunks) == len(FIRST + SECOND)
+    _assert_found(agent, FIRST + SECOND)
+
+def test_chunks_past_the_index_are_left_out(agent):
+    vector_store.add_to_vector_store(FIRST, agent=agent)
+    store = vector_store.get_vector_store(agent)
+    
+    # What a writer without the commit protocol leaves when it stops early
+    writer = ChunkWriter(store.path, base=store.chunks)
+    writer.add("orphan".ljust(64, "0"), "A chunk without a vector.", {"source": "lost"})
+    writer.commit()
+    writer.close()
+    
+    _assert_consistent(_reopen(agent))
+    
+    vector_store.add_to_vector_store(SECOND, agent=agent)
+    _assert_consistent(_reopen(agent))
+    _assert_found(agent, FIRST + SECOND)
@@ -0,0 +1,81 @@
+"""
+BM25 index keyed by chunk position, and its files
+"""
+import numpy as np
+from core.sparse_index import BM25Index, BM25Writer, tokenize
+
+TEXTS = [
+    "Invoice AB-1234 is due in thirty days.",
+    "The warranty covers water damage.",
+    "Payment schedule for invoice AB-9999.",
+    "Nothing relevant here."
+]
+
+def _positions(results):
+    return [position for position, _ in results]
+
+def test_identifiers_match_whole_and_by_parts():
+    assert tokenize("AB-1234") == ["ab-1234", "ab", "1234"]
+    
+    index = BM25Index.from_texts(TEXTS)
+    
+    assert _positions(index.search("AB-1234", 2))[0] == 0
+    assert _positions(index.search("1234", 4)) == [0]
+
+def test_mask_limits_the_positions_scored():
+    index = BM25Index.from_texts(TEXTS)
+    mask = np.array([False, True, True, True])
+    
+    assert sorted(_positions(index.search("invoice", 4))) == [0, 2]
+    assert _positions(index.search("invoice", 4, mask=mask)) == [2]
+
+def test_written_index_loads_with_the_same_scores(tmp_path):
+    writer = BM25Writer(str(tmp_path))
+    for text in TEXTS:
+        writer.add(text)
+    writer.commit()
+    
+    loaded = BM25Index.load(str(tmp_path))
+    
+    assert len(loaded) == len(TEXTS)
+    assert loaded.search("invoice warranty", 4) == BM25Index.from_texts(TEXTS).search("invoice warranty", 4)
+
+def test_skipped_positions_are_compacted(tmp_path):
+    base = BM25Index.from_texts(TEXTS)
+    
+    writer = BM25Writer(str(tmp_path), base=base, skip=[0])
+    writer.add("A new invoice arrived.")
+    writer.commit()
+    
+    loaded = BM25Index.load(str(tmp_path))
+    expected = BM25Index.from_texts(TEXTS[1:] + ["A new invoice arrived."])
+    assert len(loaded) == len(TEXTS)
+    assert loaded.search("invoice warranty", 4) == expected.search("invoice warranty", 4)
+
+def test_uncommitted_writer_leaves_no_files(tmp_path):
+    writer = BM25Writer(str(tmp_path))
+    writer.add(TEXTS[0])
+    writer.close()
+    
+    assert not BM25Index.exists(str(tmp_path))
+    assert list(tmp_path.iterdir()) == []
+
+def test_appended_postings_match_a_full_inversion(tmp_path):
+    writer = BM25Writer(str(tmp_path))
+    for text in TEXTS[:2]:
+        writer.add(text)
+    writer.commit()
+    base = BM25Index.load(str(tmp_path))
+    
+    writer = BM25Writer(str(tmp_path), base=base)
+    for text in TEXTS[2:]:
+        writer.add(text)
+    writer.commit()
+    extended = writer.load()
+    inverted = BM25Index.load(str(tmp_path))
+    
+    np.testing.assert_array_equal(extended._posting_positions, inverted._posting_positions)
+    np.testing.assert_array_equal(extended._posting_freqs, inverted._posting_freqs)
+    np.testing.assert_array_equal(extended._posting_starts, inverted._posting_starts)
+    np.testing.assert_allclose(extended._length_norms, inverted._length_norms)
+    assert extended.search("invoice schedule", 4) == BM25Index.from_texts(TEXTS).search("invoice schedule", 4)
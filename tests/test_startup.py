@@ -0,0 +1,26 @@
+"""
+Import cost of the entry points
+"""
+import os
+import subprocess
+import sys
+from core import startup
+
+def test_entry_point_imports_fit_the_budget():
+    assert startup.main(["--check"]) == 0
+
+def test_app_imports_leave_the_vector_store_unloaded():
+    code = (
+        f"{startup.REPORT_STATEMENTS['app']}; import sys; "
+        "print(sorted(m for m in ('faiss', 'numpy', 'langchain_core', 'core.vector_store') if m in sys.modules))"
+    )
+    
+    loaded = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    )
+    
+    assert loaded.stdout.strip() == "[]"
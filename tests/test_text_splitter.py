@@ -0,0 +1,51 @@
+"""
+Chunk boundaries and the offsets recorded for them
+"""
+import random
+import pytest
+from benchmarks.fakes import synthetic_text
+from core.config import CHUNK_OVERLAP, CHUNK_SIZE
+from core.text_splitter import chunk_offsets, content_hash, iter_text_chunks
+
+def _text(words, seed=0):
+    return synthetic_text(random.Random(seed), words)
+
+@pytest.mark.parametrize("text", [
+    _text(2000),
+    _text(2000).replace(". ", ".\n\n"),
+    "x" * (CHUNK_SIZE * 3 + 17),  # No separator to cut at
+    "  \n  leading and trailing space  \n\n"
+], ids=["sentences", "paragraphs", "unbroken", "padded"])
+def test_offsets_slice_the_chunks_out_of_the_text(text):
+    offsets = list(chunk_offsets(text))
+    
+    assert offsets
+    previous_end = 0
+    for start, end in offsets:
+        chunk = text[start:end]
+        assert 0 < len(chunk) <= CHUNK_SIZE
+        assert chunk == chunk.strip()
+        # Overlap with the previous chunk stays within CHUNK_OVERLAP
+        assert start >= previous_end - CHUNK_OVERLAP
+        previous_end = end
+    
+    # Together the chunks cover every non-space character
+    covered = set()
+    for start, end in offsets:
+        covered.update(range(start, end))
+    assert all(i in covered for i, char in enumerate(text) if not char.isspace())
+
+def test_blank_text_has_no_chunks():
+    assert list(chunk_offsets("")) == []
+    assert list(chunk_offsets(" \n\n ")) == []
+
+def test_chunks_keep_their_page_and_offsets():
+    pages = [("a.pdf", 1, _text(400, 1)), ("a.pdf", 2, _text(400, 2)), ("Typed", None, _text(50, 3))]
+    texts = {(source, page): text for source, page, text in pages}
+    
+    chunks = list(iter_text_chunks(pages))
+    
+    assert {(chunk.source, chunk.page) for chunk in chunks} == set(texts)
+    for chunk in chunks:
+        assert texts[(chunk.source, chunk.page)][chunk.start:chunk.end] == chunk.text
+        assert chunk.hash == content_hash(chunk.text)
@@ -0,0 +1,80 @@
+"""
+Pool of opened per-agent vector stores: LRU limits, isolation and deletion
+"""
+import os
+import pytest
+from core import vector_store
+from core.manifest import index_path, list_agents, list_sources
+
+@pytest.fixture(autouse=True)
+def empty_pool():
+    vector_store.invalidate_vector_store_cache()
+    yield
+    vector_store.invalidate_vector_store_cache()
+
+def _create(agent, text, source="notes.txt"):
+    vector_store.add_to_vector_store([text], sources=[source], agent=agent)
+    return index_path(agent)
+
+def _pooled():
+    return list(vector_store._pool)
+
+def test_least_recently_used_store_is_evicted_by_count(monkeypatch, agent):
+    monkeypatch.setattr(vector_store, "VECTOR_STORE_POOL_MAX_STORES", 2)
+    first = _create(agent + "-a", "Invoices are due in thirty days.")
+    second = _create(agent + "-b", "The warranty covers water damage.")
+    
+    # Using the first makes the second the least recently used
+    vector_store.get_vector_store(agent + "-a")
+    evictions = vector_store.get_vector_store_stats()["evictions"]
+    third = _create(agent + "-c", "Payments are made by bank transfer.")
+    
+    assert _pooled() == [first, third]
+    assert vector_store.get_vector_store_stats()["evictions"] == evictions + 1
+    # An evicted store is opened again on its next use
+    assert vector_store.get_vector_store(agent + "-b").path == second
+    assert _pooled() == [third, second]
+
+def test_stores_are_evicted_beyond_the_memory_cap(monkeypatch, agent):
+    first = _create(agent + "-a", "Invoices are due in thirty days.")
+    store_bytes = vector_store.get_vector_store(agent + "-a").memory_bytes()
+    assert store_bytes > 0
+    monkeypatch.setattr(vector_store, "VECTOR_STORE_POOL_MAX_BYTES", store_bytes * 2 + store_bytes // 2)
+    
+    second = _create(agent + "-b", "The warranty covers water damage.")
+    assert _pooled() == [first, second]
+    
+    third = _create(agent + "-c", "Payments are made by bank transfer.")
+    assert _pooled() == [second, third]
+    
+    # The most recent store stays even when it alone is over the cap
+    monkeypatch.setattr(vector_store, "VECTOR_STORE_POOL_MAX_BYTES", 1)
+    vector_store.get_vector_store(agent + "-b")
+    vector_store._enforce_pool_limits()
+    assert _pooled() == [second]
+
+def test_agents_search_only_their_own_index(agent):
+    _create(agent + "-billing", "Invoices are due in thirty days.", source="billing.pdf")
+    _create(agent + "-support", "The warranty covers water damage.", source="support.pdf")
+    
+    billing = vector_store.search_similar_documents("warranty", k=4, agent=agent + "-billing")
+    support = vector_store.search_similar_documents("warranty", k=4, agent=agent + "-support")
+    
+    assert [doc.page_content for doc in billing] == ["Invoices are due in thirty days."]
+    assert [doc.page_content for doc in support] == ["The warranty covers water damage."]
+    assert list_sources(agent + "-billing") == ["billing.pdf"]
+    assert list_sources(agent + "-support") == ["support.pdf"]
+    assert {agent + "-billing", agent + "-support"} <= set(list_agents())
+
+def test_delete_agent_removes_its_files_and_pool_entry(agent):
+    path = _create(agent, "Invoices are due in thirty days.")
+    other = _create(agent + "-kept", "The warranty covers water damage.")
+    
+    vector_store.delete_agent(agent)
+    
+    assert not os.path.exists(path)
+    assert _pooled() == [other]
+    assert agent not in list_agents()
+    with pytest.raises(FileNotFoundError):
+        vector_store.get_vector_store(agent)
+    assert vector_store.get_vector_store(agent + "-kept").path == other